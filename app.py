@@ -1,24 +1,30 @@
 import os
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, abort
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, BooleanField, SubmitField, SelectField
-from wtforms.validators import DataRequired, URL, Optional
+from markupsafe import Markup
+from flask_wtf.file import FileField, FileRequired
+from wtforms import StringField, TextAreaField, BooleanField, SubmitField, SelectField, SelectMultipleField, IntegerField
+from wtforms.validators import DataRequired, URL, Optional, NumberRange
 import datetime
 from slugify import slugify
-from apscheduler.schedulers.background import BackgroundScheduler
 
 from config import config
-from modules.storage import init_db, db, Feed, FeedItem, AggregatedFeed
+from modules.storage import init_db, db, Feed, FeedItem, AggregatedFeed, parse_tags
 from modules.aggregator import update_feed, update_all_feeds, fetch_rss_feed
-from modules.feed_generator import generate_aggregated_feed, generate_single_feed
-from modules.scraper import (
-    get_page_structure, 
-    get_element_info, 
-    save_screenshot_for_selector,
-    test_selectors,
-    auto_detect_selectors,
-    get_page_for_selector_setup
+from modules.feed_generator import (
+    generate_aggregated_feed,
+    generate_single_feed,
+    generate_feed_delta,
+    encode_cursor,
+    decode_cursor,
+    FEED_FORMATS
 )
+from modules.selector_pool import PoolBusy, ClientDisconnected
+
+# Модуль modules.scraper (requests, BeautifulSoup, Selenium) импортируется
+# внутри обработчиков при первом обращении, чтобы воркеры, которые только
+# отдают готовые ленты, не тратили время на его загрузку при старте.
+
 
 # Создаем приложение
 app = Flask(__name__)
@@ -31,46 +37,142 @@ config[env].init_app(app)
 # Инициализируем базу данных
 init_db(app)
 
+
+def create_app(with_scheduler=False):
+    """
+    Возвращает настроенное приложение для WSGI-сервера
+
+    Планировщик обновления лент больше не запускается при импорте модуля:
+    его включает этот шаг, например ``gunicorn 'app:create_app(with_scheduler=True)'``.
+    Воркеры, которые только отдают ленты, используют ``app:app`` или ``app:create_app()``.
+
+    Args:
+        with_scheduler (bool): Запускать ли планировщик обновления лент
+
+    Returns:
+        Flask: Экземпляр приложения
+    """
+    if with_scheduler and 'scheduler' not in app.extensions:
+        from modules.scheduler import start_scheduler
+        start_scheduler(app)
+
+    return app
+
 # Формы
 class FeedForm(FlaskForm):
     name = StringField('Название', validators=[DataRequired()])
     url = StringField('URL', validators=[DataRequired(), URL()])
     feed_type = SelectField('Тип ленты', choices=[
         ('rss', 'RSS-лента'),
-        ('scrape', 'Сайт без RSS (парсинг)')
+        ('scrape', 'Сайт без RSS (парсинг)'),
+        ('sitemap', 'Новостной sitemap')
     ])
     active = BooleanField('Активна', default=True)
     included_in_aggregate = BooleanField('Включать в общую ленту', default=True)
+    max_fetch_bytes = IntegerField('Лимит размера ответа, байт', validators=[Optional(), NumberRange(min=1024)])
+    enrich_content = BooleanField('Загружать полный текст статей', default=False)
+    tag_list = StringField('Метки', validators=[Optional()])
     submit = SubmitField('Сохранить')
 
 
+class OpmlImportForm(FlaskForm):
+    opml_file = FileField('Файл OPML', validators=[FileRequired()])
+    validate_feeds = BooleanField('Проверять ленты перед добавлением', default=True)
+    submit = SubmitField('Импортировать')
+
+
 class AggregatedFeedForm(FlaskForm):
     name = StringField('Название', validators=[DataRequired()])
     description = TextAreaField('Описание', validators=[Optional()])
     active = BooleanField('Активна', default=True)
+    feed_types = SelectMultipleField('Типы источников', choices=[
+        ('rss', 'RSS-ленты'),
+        ('scrape', 'Сайты без RSS'),
+        ('sitemap', 'Новостные sitemap')
+    ], validators=[Optional()])
+    tags = StringField('Метки источников', validators=[Optional()])
+    include_keywords = StringField('Только элементы со словами', validators=[Optional()])
+    exclude_keywords = StringField('Исключать элементы со словами', validators=[Optional()])
+    max_age_days = IntegerField('Не старше, дней', validators=[Optional(), NumberRange(min=1)])
     submit = SubmitField('Сохранить')
+    
+    def get_rules(self):
+        """Собирает правила агрегированной ленты из полей формы"""
+        return {
+            'feed_types': self.feed_types.data or [],
+            'tags': parse_tags(self.tags.data),
+            'include': parse_tags(self.include_keywords.data),
+            'exclude': parse_tags(self.exclude_keywords.data),
+            'max_age_days': self.max_age_days.data
+        }
+    
+    def set_rules(self, rules):
+        """Заполняет поля формы правилами агрегированной ленты"""
+        self.feed_types.data = rules.get('feed_types', [])
+        self.tags.data = ', '.join(rules.get('tags', []))
+        self.include_keywords.data = ', '.join(rules.get('include', []))
+        self.exclude_keywords.data = ', '.join(rules.get('exclude', []))
+        self.max_age_days.data = rules.get('max_age_days')
 
 
-# Планировщик для автоматического обновления лент
-scheduler = BackgroundScheduler()
-scheduler.add_job(
-    update_all_feeds,
-    'interval',
-    seconds=app.config['UPDATE_INTERVAL'],
-    id='update_feeds'
-)
-scheduler.start()
+@app.template_filter('article_html')
+def article_html_filter(html):
+    """Полный текст статьи: только разрешенная разметка и ссылки http(s)"""
+    from modules.enrichment import sanitize_article_html
+    
+    return Markup(sanitize_article_html(html))
+
+
+@app.template_filter('excerpt')
+def excerpt_filter(html, length=None):
+    """
+    Текст описания без разметки для списков элементов
+    
+    Описание в списках читается из БД обрезанным, поэтому последний тег
+    может быть оборван - он отбрасывается вместе с разметкой.
+    """
+    from modules.item_body import make_excerpt
+    
+    return make_excerpt(html, length or app.config['LISTING_EXCERPT_LENGTH'])
 
 
 @app.route('/')
 def index():
     """Главная страница - панель управления"""
-    feeds = Feed.query.all()
-    aggregated_feeds = AggregatedFeed.query.all()
+    from modules.aggregator import dashboard_feeds, aggregated_feed_source_counts, DASHBOARD_STATUSES
+    
+    per_page = app.config['DASHBOARD_PER_PAGE']
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'type': request.args.get('type', ''),
+        'status': request.args.get('status', ''),
+        'sort': request.args.get('sort', 'name'),
+        'order': 'desc' if request.args.get('order') == 'desc' else 'asc'
+    }
+    
+    # Фильтрация, сортировка и пагинация выполняются в БД, статистика
+    # элементов - одним сгруппированным запросом для лент на странице
+    feeds, item_stats = dashboard_feeds(
+        request.args.get('page', 1, type=int),
+        per_page,
+        search=filters['q'],
+        feed_type=filters['type'],
+        status=filters['status'],
+        sort=filters['sort'],
+        order=filters['order']
+    )
+    aggregated_feeds = AggregatedFeed.query.order_by(AggregatedFeed.name) \
+                                           .paginate(request.args.get('agg_page', 1, type=int), per_page, error_out=False)
+    source_counts = aggregated_feed_source_counts([agg_feed.id for agg_feed in aggregated_feeds.items])
+    
     return render_template(
         'dashboard.html', 
         feeds=feeds, 
-        aggregated_feeds=aggregated_feeds
+        item_stats=item_stats,
+        aggregated_feeds=aggregated_feeds,
+        source_counts=source_counts,
+        filters=filters,
+        statuses=DASHBOARD_STATUSES
     )
 
 
@@ -85,14 +187,17 @@ def add_feed():
             url=form.url.data,
             feed_type=form.feed_type.data,
             active=form.active.data,
-            included_in_aggregate=form.included_in_aggregate.data
+            included_in_aggregate=form.included_in_aggregate.data,
+            max_fetch_bytes=form.max_fetch_bytes.data,
+            enrich_content=form.enrich_content.data,
+            tag_list=form.tag_list.data
         )
         
         db.session.add(new_feed)
         db.session.commit()
         
-        # Если это RSS-лента, пробуем сразу обновить
-        if form.feed_type.data == 'rss':
+        # Если это RSS-лента или sitemap, пробуем сразу обновить
+        if form.feed_type.data in ('rss', 'sitemap'):
             success = update_feed(new_feed)
             if not success:
                 flash('Лента создана, но не удалось загрузить данные. Проверьте URL.', 'warning')
@@ -108,6 +213,46 @@ def add_feed():
     return render_template('feed_form.html', form=form, title='Добавить ленту')
 
 
+@app.route('/feeds/import', methods=['GET', 'POST'])
+def import_opml():
+    """Импорт источников из OPML"""
+    from modules.opml import start_import
+    
+    form = OpmlImportForm()
+    
+    if form.validate_on_submit():
+        try:
+            job = start_import(form.opml_file.data.read(), validate=form.validate_feeds.data)
+        except ValueError as e:
+            flash(f'Не удалось прочитать OPML: {str(e)}', 'danger')
+            return render_template('import_opml.html', form=form, job=None)
+        
+        flash(f'Импорт запущен: источников в файле - {job.total}', 'info')
+        return redirect(url_for('import_opml_status', job_id=job.id))
+    
+    return render_template('import_opml.html', form=form, job=None)
+
+
+@app.route('/feeds/import/<int:job_id>')
+def import_opml_status(job_id):
+    """Страница прогресса импорта OPML"""
+    from modules.storage import ImportJob
+    
+    job = ImportJob.query.get_or_404(job_id)
+    return render_template('import_opml.html', form=OpmlImportForm(), job=job)
+
+
+@app.route('/export/opml')
+def export_opml_file():
+    """Экспорт источников и агрегированных лент в OPML"""
+    from modules.opml import export_opml
+    
+    payload = export_opml(app.config['BASE_URL'])
+    response = Response(payload, mimetype='text/x-opml')
+    response.headers['Content-Disposition'] = 'attachment; filename=rss-aggregator.opml'
+    return response
+
+
 @app.route('/feeds/<int:feed_id>/edit', methods=['GET', 'POST'])
 def edit_feed(feed_id):
     """Редактирование ленты"""
@@ -157,16 +302,76 @@ def manual_update_feed(feed_id):
     return redirect(url_for('view_feed', feed_id=feed_id))
 
 
+@app.route('/feeds/<int:feed_id>/resume', methods=['POST'])
+def resume_suspended_feed(feed_id):
+    """Возобновление приостановленной ленты"""
+    from modules.aggregator import resume_feed
+    
+    feed = Feed.query.get_or_404(feed_id)
+    resume_feed(feed)
+    
+    flash('Лента возобновлена и будет обновлена при следующем запуске.', 'success')
+    return redirect(url_for('index'))
+
+
+@app.route('/feeds/<int:feed_id>/discover', methods=['POST'])
+def discover_feed(feed_id):
+    """Поиск RSS/Atom или новостного sitemap для ленты на основе парсинга"""
+    from modules.discovery import start_discovery
+    
+    feed = Feed.query.get_or_404(feed_id)
+    if feed.feed_type != 'scrape':
+        flash('Поиск ленты нужен только для лент на основе парсинга', 'warning')
+        return redirect(url_for('index'))
+    
+    status = start_discovery(feed)
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify(status)
+        response.status_code = 202
+        response.headers['Location'] = url_for('api_discovery_status', feed_id=feed.id)
+        return response
+    
+    flash('Поиск ленты запущен. Если лента найдется, на главной странице появится отметка «Есть RSS».', 'info')
+    return redirect(url_for('index'))
+
+
+@app.route('/api/feeds/<int:feed_id>/discovery')
+def api_discovery_status(feed_id):
+    """API для получения состояния поиска ленты для источника"""
+    from modules.discovery import discovery_status
+    
+    feed = Feed.query.get_or_404(feed_id)
+    return jsonify(discovery_status(feed))
+
+
+@app.route('/feeds/<int:feed_id>/switch_source', methods=['POST'])
+def switch_feed_source(feed_id):
+    """Перевод ленты на найденную RSS-ленту или sitemap (или обратно на парсинг)"""
+    from modules.discovery import switch_to_discovered
+    
+    feed = Feed.query.get_or_404(feed_id)
+    if not switch_to_discovered(feed):
+        flash('Для этой ленты не найден другой источник', 'warning')
+        return redirect(url_for('index'))
+    
+    if update_feed(feed):
+        flash(f'Лента переведена на {feed.url} и обновлена!', 'success')
+    else:
+        flash(f'Лента переведена на {feed.url}, но обновить ее не удалось.', 'warning')
+    return redirect(url_for('index'))
+
+
 @app.route('/feeds/<int:feed_id>/view')
 def view_feed(feed_id):
     """Просмотр элементов ленты"""
+    from modules.aggregator import get_feed_listing
+    
     feed = Feed.query.get_or_404(feed_id)
     page = request.args.get('page', 1, type=int)
     per_page = app.config['ITEMS_PER_PAGE']
     
-    items = FeedItem.query.filter_by(feed_id=feed.id) \
-                          .order_by(FeedItem.published.desc()) \
-                          .paginate(page, per_page, error_out=False)
+    # Только нужные колонки и начало описания, без объектов FeedItem
+    items = get_feed_listing(feed, page, per_page)
                           
     return render_template('feed_details.html', feed=feed, items=items)
 
@@ -174,6 +379,8 @@ def view_feed(feed_id):
 @app.route('/feeds/<int:feed_id>/setup_selectors', methods=['GET', 'POST'])
 def setup_selectors(feed_id):
     """Настройка селекторов для парсинга"""
+    from modules.scraper import get_page_structure
+
     feed = Feed.query.get_or_404(feed_id)
     
     # Убеждаемся, что лента предназначена для парсинга
@@ -188,6 +395,7 @@ def setup_selectors(feed_id):
         print(f"Получен POST-запрос для настройки селекторов ленты {feed.name}")
         # Обновляем селекторы
         new_selectors = {
+            'mode': request.form.get('mode', 'css'),
             'container': request.form.get('container'),
             'item': request.form.get('item'),
             'title': request.form.get('title'),
@@ -195,6 +403,9 @@ def setup_selectors(feed_id):
             'description': request.form.get('description'),
             'image': request.form.get('image'),
             'date': request.form.get('date'),
+            'next_page': request.form.get('next_page'),
+            'page_url_template': request.form.get('page_url_template'),
+            'max_pages': request.form.get('max_pages', type=int),
             'use_selenium': 'use_selenium' in request.form
         }
         
@@ -203,9 +414,10 @@ def setup_selectors(feed_id):
         db.session.commit()
         print(f"Селекторы сохранены в базе данных")
         
-        # Пробуем обновить ленту с новыми селекторами
+        # Пробуем обновить ленту с новыми селекторами: сначала на сохраненной
+        # копии страницы, без повторной загрузки
         print(f"Запускаем обновление ленты {feed.name}")
-        success = update_feed(feed)
+        success = update_feed(feed, from_store=True)
         print(f"Результат обновления: {success}")
         
         if success:
@@ -229,9 +441,43 @@ def setup_selectors(feed_id):
     )
 
 
+def run_selector_task(func, *args):
+    """
+    Выполняет загрузку для API настройки селекторов в общем ограниченном пуле
+    
+    Одинаковые одновременные запросы получают результат одной загрузки,
+    а если клиент закрыл соединение, загрузка отменяется.
+    """
+    from modules.selector_pool import get_selector_pool, client_disconnected
+    
+    environ = request.environ
+    return get_selector_pool().call(
+        func, *args,
+        is_disconnected=lambda: client_disconnected(environ),
+        poll=app.config['SELECTOR_API_POLL']
+    )
+
+
+@app.errorhandler(PoolBusy)
+def selector_pool_busy(error):
+    """Пул API настройки селекторов перегружен - клиенту стоит повторить позже"""
+    response = jsonify({'error': 'Too many pages are being loaded, try again later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(app.config['SELECTOR_API_RETRY_AFTER'])
+    return response
+
+
+@app.errorhandler(ClientDisconnected)
+def selector_client_disconnected(error):
+    """Клиент ушел, не дождавшись ответа: ответ уже никто не прочитает"""
+    return '', 499
+
+
 @app.route('/api/proxy_page', methods=['POST'])
 def proxy_page():
     """API для получения HTML страницы через прокси"""
+    from modules.scraper import get_page_for_selector_setup
+
     data = request.get_json()
     if not data:
         return jsonify({'error': 'Data not provided'}), 400
@@ -243,7 +489,7 @@ def proxy_page():
         return jsonify({'error': 'URL not provided'}), 400
         
     # Получаем HTML страницы с подготовкой для выбора селекторов
-    html = get_page_for_selector_setup(url, use_selenium)
+    html = run_selector_task(get_page_for_selector_setup, url, use_selenium)
     if not html:
         return jsonify({'error': 'Failed to fetch page'}), 500
         
@@ -254,6 +500,8 @@ def proxy_page():
 @app.route('/api/test_selectors', methods=['POST'])
 def api_test_selectors():
     """API для тестирования селекторов"""
+    from modules.scraper import test_selectors
+
     data = request.get_json()
     if not data:
         return jsonify({'error': 'Data not provided'}), 400
@@ -272,7 +520,7 @@ def api_test_selectors():
         }), 200
     
     # Тестируем селекторы
-    result = test_selectors(url, selectors, use_selenium)
+    result = run_selector_task(test_selectors, url, selectors, use_selenium)
     
     return jsonify(result)
 
@@ -280,6 +528,8 @@ def api_test_selectors():
 @app.route('/api/auto_detect_selectors', methods=['POST'])
 def auto_detect_selectors_api():
     """API для автоматического определения селекторов"""
+    from modules.scraper import auto_detect_selectors
+
     data = request.get_json()
     if not data:
         return jsonify({'error': 'Data not provided'}), 400
@@ -291,7 +541,7 @@ def auto_detect_selectors_api():
         return jsonify({'error': 'URL not provided'}), 400
     
     # Автоматически определяем селекторы
-    selectors = auto_detect_selectors(url, use_selenium)
+    selectors = run_selector_task(auto_detect_selectors, url, use_selenium)
     
     if not selectors:
         return jsonify({
@@ -308,13 +558,15 @@ def auto_detect_selectors_api():
 @app.route('/api/page_info', methods=['POST'])
 def page_info():
     """API для получения информации о странице"""
+    from modules.scraper import get_page_structure
+
     data = request.get_json()
     url = data.get('url') if data else None
     
     if not url:
         return jsonify({'error': 'URL not provided'}), 400
         
-    structure = get_page_structure(url)
+    structure = run_selector_task(get_page_structure, url)
     if not structure:
         return jsonify({'error': 'Failed to analyze page'}), 500
         
@@ -324,6 +576,8 @@ def page_info():
 @app.route('/api/element_info', methods=['POST'])
 def element_info():
     """API для получения информации об элементе"""
+    from modules.scraper import get_element_info
+
     data = request.get_json()
     if not data:
         return jsonify({'error': 'Data not provided'}), 400
@@ -334,7 +588,7 @@ def element_info():
     if not url or not selector:
         return jsonify({'error': 'URL or selector not provided'}), 400
         
-    info = get_element_info(url, selector)
+    info = run_selector_task(get_element_info, url, selector)
     if not info:
         return jsonify({'error': 'Element not found'}), 404
         
@@ -361,11 +615,15 @@ def add_aggregated_feed():
             slug=slug,
             active=form.active.data
         )
+        new_feed.set_rules(form.get_rules())
         
-        # Добавляем все активные ленты, отмеченные для включения в агрегированные
-        feeds = Feed.query.filter_by(active=True, included_in_aggregate=True).all()
-        for feed in feeds:
-            new_feed.feeds.append(feed)
+        # Без правил по источникам добавляем все активные ленты, отмеченные
+        # для включения в агрегированные; с правилами состав определяется ими
+        rules = new_feed.get_rules()
+        if not rules.get('feed_types') and not rules.get('tags'):
+            feeds = Feed.query.filter_by(active=True, included_in_aggregate=True).all()
+            for feed in feeds:
+                new_feed.feeds.append(feed)
         
         db.session.add(new_feed)
         db.session.commit()
@@ -381,11 +639,14 @@ def edit_aggregated_feed(agg_id):
     """Редактирование агрегированной ленты"""
     agg_feed = AggregatedFeed.query.get_or_404(agg_id)
     form = AggregatedFeedForm(obj=agg_feed)
+    if request.method == 'GET':
+        form.set_rules(agg_feed.get_rules())
     
     if form.validate_on_submit():
         agg_feed.name = form.name.data
         agg_feed.description = form.description.data
         agg_feed.active = form.active.data
+        agg_feed.set_rules(form.get_rules())
         
         db.session.commit()
         
@@ -446,13 +707,13 @@ def delete_aggregated_feed(agg_id):
 @app.route('/aggregate/<int:agg_id>/view')
 def view_aggregated_feed(agg_id):
     """Просмотр элементов агрегированной ленты"""
-    from modules.aggregator import get_aggregated_feed_items
+    from modules.aggregator import get_aggregated_feed_listing
     
     agg_feed = AggregatedFeed.query.get_or_404(agg_id)
     page = request.args.get('page', 1, type=int)
     per_page = app.config['ITEMS_PER_PAGE']
     
-    items_pagination = get_aggregated_feed_items(
+    items_pagination = get_aggregated_feed_listing(
         agg_feed, 
         page=page, 
         per_page=per_page
@@ -465,30 +726,191 @@ def view_aggregated_feed(agg_id):
     )
 
 
+def negotiate_feed_format(fmt=None):
+    """
+    Определяет формат ленты по расширению в URL или заголовку Accept
+    
+    Args:
+        fmt (str, optional): Формат из расширения URL
+        
+    Returns:
+        str: 'rss', 'atom' или 'json'
+    """
+    if fmt:
+        return fmt
+    
+    best = request.accept_mimetypes.best_match([
+        FEED_FORMATS['rss'],
+        FEED_FORMATS['atom'],
+        FEED_FORMATS['json'],
+        'application/json'
+    ], default=FEED_FORMATS['rss'])
+    
+    if best == FEED_FORMATS['atom']:
+        return 'atom'
+    if best in (FEED_FORMATS['json'], 'application/json'):
+        return 'json'
+    return 'rss'
+
+
+def feed_response(payload, fmt, negotiated, cursor_id):
+    """
+    Формирует ответ с лентой в выбранном формате
+    
+    Ответ содержит курсор для дельта-запросов (X-Feed-Cursor) и ETag;
+    на условный запрос с совпадающим If-None-Match возвращается 304.
+    """
+    if payload is None:
+        abort(500)
+    
+    response = Response(payload, mimetype=FEED_FORMATS[fmt])
+    response.headers['X-Feed-Cursor'] = encode_cursor(cursor_id)
+    if negotiated:
+        response.vary.add('Accept')
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def feed_delta_response(fmt, negotiated, feed=None, aggregated_feed=None):
+    """
+    Формирует ответ дельта-режима (?since=<курсор>)
+    
+    Возвращает только элементы, добавленные после курсора, и новый курсор
+    в заголовке X-Feed-Cursor; если новых элементов нет - 304 Not Modified.
+    Если новых элементов больше лимита, заголовок Link rel="next" указывает
+    на следующую порцию.
+    """
+    try:
+        since_id = decode_cursor(request.args['since'])
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    payload, last_id, has_more = generate_feed_delta(
+        since_id,
+        app.config['BASE_URL'],
+        fmt=fmt,
+        feed=feed,
+        aggregated_feed=aggregated_feed
+    )
+    
+    if payload is None:
+        response = Response(status=304)
+    else:
+        response = Response(payload, mimetype=FEED_FORMATS[fmt])
+    
+    cursor = encode_cursor(last_id)
+    response.headers['X-Feed-Cursor'] = cursor
+    response.headers['Cache-Control'] = 'no-cache'
+    if has_more:
+        next_url = url_for(request.endpoint, _external=True, **dict(request.view_args, since=cursor))
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+
 @app.route('/feed/<slug>')
-def get_public_feed(slug):
+@app.route('/feed/<slug>.<any(rss, atom, json):fmt>')
+def get_public_feed(slug, fmt=None):
     """Публичный доступ к агрегированной ленте"""
+    from modules.aggregator import aggregated_feed_version
+    
     agg_feed = AggregatedFeed.query.filter_by(slug=slug, active=True).first_or_404()
+    feed_format = negotiate_feed_format(fmt)
+    
+    if 'since' in request.args:
+        return feed_delta_response(feed_format, fmt is None, aggregated_feed=agg_feed)
     
-    xml = generate_aggregated_feed(
+    # Курсор определяем до сборки ленты: элемент, добавленный между запросами,
+    # лучше получить дважды, чем пропустить
+    cursor_id, version = aggregated_feed_version(agg_feed)
+    payload = generate_aggregated_feed(
         agg_feed, 
-        app.config['BASE_URL']
+        app.config['BASE_URL'],
+        fmt=feed_format,
+        version=version
     )
     
-    return Response(xml, mimetype='application/rss+xml')
+    return feed_response(payload, feed_format, fmt is None, cursor_id)
 
 
 @app.route('/source/<int:feed_id>')
-def get_source_feed(feed_id):
+@app.route('/source/<int:feed_id>.<any(rss, atom, json):fmt>')
+def get_source_feed(feed_id, fmt=None):
     """Публичный доступ к исходной ленте"""
+    from modules.aggregator import latest_item_id
+    
     feed = Feed.query.filter_by(id=feed_id, active=True).first_or_404()
+    feed_format = negotiate_feed_format(fmt)
+    
+    if 'since' in request.args:
+        return feed_delta_response(feed_format, fmt is None, feed=feed)
     
-    xml = generate_single_feed(
+    cursor_id = latest_item_id(feed)
+    payload = generate_single_feed(
         feed, 
-        app.config['BASE_URL']
+        app.config['BASE_URL'],
+        fmt=feed_format
     )
     
-    return Response(xml, mimetype='application/rss+xml')
+    return feed_response(payload, feed_format, fmt is None, cursor_id)
+
+
+@app.route('/thumbnails/<int:item_id>')
+def item_thumbnail(item_id):
+    """Миниатюра изображения элемента из локального кеша"""
+    from modules.thumbnails import cached_thumbnail, queue_thumbnail
+    
+    item = FeedItem.query.get_or_404(item_id)
+    if not item.image:
+        abort(404)
+    
+    # Пока миниатюры нет в кеше (или кеш отключен), отправляем к источнику,
+    # а миниатюра загружается в фоне для следующих запросов
+    thumbnail = cached_thumbnail(item.image)
+    if thumbnail is None:
+        queue_thumbnail(item.image)
+        return redirect(item.image)
+    
+    data, mimetype, key = thumbnail
+    response = Response(data, mimetype=mimetype)
+    # Изображение элемента не меняется, поэтому миниатюру можно кешировать надолго
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['THUMBNAIL_MAX_AGE']
+    response.set_etag(key)
+    return response.make_conditional(request)
+
+
+@app.route('/websub/callback/<int:feed_id>', methods=['GET', 'POST'])
+def websub_callback(feed_id):
+    """Обработчик WebSub: подтверждение подписки и прием обновлений от хаба"""
+    from modules.aggregator import parse_rss_content, store_feed_entries
+    from modules.websub import verify_intent, verify_signature, accepts_push
+    
+    feed = Feed.query.get_or_404(feed_id)
+    
+    if request.method == 'GET':
+        challenge = verify_intent(feed, request.args)
+        if challenge is None:
+            abort(404)
+        return Response(challenge, mimetype='text/plain')
+    
+    if not accepts_push(feed):
+        # Подписки нет (или у нее нет секрета) - хаб должен прекратить доставку
+        app.logger.warning(f"Rejected WebSub push for feed {feed_id} without an active subscription")
+        abort(410)
+    
+    body = request.get_data()
+    if not verify_signature(feed, body, request.headers.get('X-Hub-Signature')):
+        # По спецификации сообщение с неверной подписью игнорируется, но хабу отвечаем 2xx
+        app.logger.warning(f"Invalid WebSub signature for feed {feed_id}")
+        return '', 202
+    
+    feed_data = parse_rss_content(body, feed.topic_url or feed.url, request.content_type)
+    if feed_data:
+        store_feed_entries(feed, feed_data)
+    
+    return '', 202
 
 
 @app.route('/api/check_rss', methods=['POST'])
@@ -512,6 +934,86 @@ def check_rss():
     }), 200
 
 
+@app.route('/api/import/opml', methods=['POST'])
+def api_import_opml():
+    """API для импорта OPML: тело запроса - документ OPML, ?validate=0 отключает проверку"""
+    from modules.opml import start_import, import_progress
+    
+    try:
+        job = start_import(request.get_data(), validate=request.args.get('validate', '1') != '0')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(import_progress(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('api_import_status', job_id=job.id)
+    return response
+
+
+@app.route('/api/import/<int:job_id>')
+def api_import_status(job_id):
+    """API для получения прогресса импорта OPML"""
+    from modules.opml import import_progress
+    from modules.storage import ImportJob
+    
+    job = ImportJob.query.get_or_404(job_id)
+    return jsonify(import_progress(job))
+
+
+@app.route('/api/feeds/suspended')
+def api_suspended_feeds():
+    """API для получения приостановленных лент и лент с ошибками"""
+    feeds = Feed.query.filter(db.or_(Feed.suspended.is_(True), Feed.consecutive_failures > 0)) \
+                      .order_by(Feed.suspended.desc(), Feed.consecutive_failures.desc()) \
+                      .all()
+    
+    return jsonify([{
+        'id': feed.id,
+        'name': feed.name,
+        'url': feed.url,
+        'suspended': bool(feed.suspended),
+        'consecutive_failures': feed.consecutive_failures or 0,
+        'last_error_class': feed.last_error_class,
+        'last_error': feed.last_error,
+        'last_error_at': feed.last_error_at.isoformat() if feed.last_error_at else None,
+        'next_retry_at': feed.next_retry_at.isoformat() if feed.next_retry_at else None
+    } for feed in feeds])
+
+
+@app.route('/api/discovery/report')
+def api_discovery_report():
+    """API для отчета о лентах на основе парсинга, которые можно перевести на RSS"""
+    from modules.discovery import discovery_report
+    
+    return jsonify(discovery_report())
+
+
+@app.route('/api/update_history')
+def api_update_history():
+    """API для отчета о самых медленных и самых неудачных лентах с динамикой"""
+    from modules.update_history import update_history_report
+    
+    hours = min(max(request.args.get('hours', 24, type=int), 1), app.config['UPDATE_HISTORY_DAYS'] * 24)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    return jsonify(update_history_report(hours=hours, limit=limit))
+
+
+@app.route('/api/enrichment/status')
+def api_enrichment_status():
+    """API для получения состояния очереди загрузки полного текста статей"""
+    from modules.enrichment import enrichment_status
+    
+    return jsonify(enrichment_status())
+
+
+@app.route('/api/metrics')
+def api_metrics():
+    """API для получения метрик процесса (в том числе ожидания регулятора запросов)"""
+    from modules.metrics import metrics
+    
+    return jsonify(metrics.snapshot())
+
+
 @app.route('/update_all', methods=['POST'])
 def trigger_update_all():
     """Ручное обновление всех лент"""
@@ -520,13 +1022,9 @@ def trigger_update_all():
     return redirect(url_for('index'))
 
 
-@app.teardown_appcontext
-def shutdown_scheduler(exception=None):
-    """Остановка планировщика при завершении работы приложения"""
-    if scheduler.running:
-        scheduler.shutdown()
-
-
 # Запуск приложения
 if __name__ == '__main__':
+    # В режиме отладки перезагрузчик запускает приложение во втором процессе,
+    # планировщик нужен только в нем
+    create_app(with_scheduler=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     app.run(debug=True)
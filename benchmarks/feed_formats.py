@@ -0,0 +1,89 @@
+"""
+Сравнение форматов выдачи лент: размер документа и время сериализации
+
+Сериализует один и тот же набор элементов в RSS 2.0, Atom 1.0 и
+JSON Feed 1.1 и печатает размер документа (в том числе после gzip),
+время сериализации и время разбора документа потребителем.
+
+Пример:
+    python benchmarks/feed_formats.py --items 50 --repeat 200
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+Row = namedtuple('Row', 'title link description guid published')
+
+
+def make_rows(count):
+    """Создает элементы, похожие на типичные записи новостных лент"""
+    now = datetime.utcnow()
+    return [
+        Row(
+            title=f'Заголовок новости номер {i}',
+            link=f'https://example.com/news/2024/01/{i}/article-slug',
+            description='<p>' + 'Краткое содержание новости с <b>разметкой</b>. ' * 8 + '</p>',
+            guid=f'https://example.com/news/{i}',
+            published=now - timedelta(minutes=i)
+        )
+        for i in range(count)
+    ]
+
+
+def timed(func, repeat):
+    """Медианное время выполнения функции в миллисекундах"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    from flask import Flask
+    from config import config
+    from modules.feed_generator import generate_feed
+
+    app = Flask('feed_formats')
+    app.config.from_object(config['testing'])
+
+    rows = make_rows(args.items)
+    parsers = {
+        'rss': ElementTree.fromstring,
+        'atom': ElementTree.fromstring,
+        'json': json.loads,
+    }
+
+    print(f"{args.items} items, median of {args.repeat} runs")
+    print(f"{'format':<8} {'bytes':>10} {'gzip bytes':>12} {'serialize ms':>14} {'parse ms':>10}")
+    with app.app_context():
+        for fmt in ('rss', 'atom', 'json'):
+            def serialize():
+                return generate_feed(iter(rows), 'Benchmark', 'Feed formats benchmark',
+                                     'https://example.com/feed/bench', fmt=fmt)
+
+            payload = serialize().encode('utf-8')
+            serialize_ms = timed(serialize, args.repeat)
+            parse_ms = timed(lambda: parsers[fmt](payload), args.repeat)
+            print(f"{fmt:<8} {len(payload):>10} {len(gzip.compress(payload)):>12} "
+                  f"{serialize_ms:>14.3f} {parse_ms:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Сборка ленты из БД: объекты FeedItem против строк с нужными колонками
+
+Заполняет временную базу SQLite элементами с объемными описаниями и
+читает последние --limit элементов двумя способами:
+    orm     - FeedItem.query...all(): объекты в identity map сессии
+    columns - stream_feed_entries: строки с нужными колонками, yield_per
+Печатает медианное время и пик выделенной памяти (tracemalloc) для
+чтения элементов (read) и для сборки ленты в каждом формате.
+
+Пример:
+    python benchmarks/feed_generation.py --items 5000 --limit 500
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_app(tmp):
+    from flask import Flask
+    from config import config
+    from modules.storage import init_db
+
+    app = Flask('feed_generation')
+    app.config.from_object(config['production'])
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'feeds.db'),
+        PAYLOAD_STORE_DIR=os.path.join(tmp, 'payloads'),
+        WEBSUB_ENABLED=False,
+    )
+    init_db(app)
+    return app
+
+
+def seed(items, description_bytes):
+    """Создает ленту с items элементами и описаниями заданного размера"""
+    from modules.storage import db, Feed, FeedItem
+
+    feed = Feed(name='Benchmark', feed_type='rss', url='https://example.com/rss')
+    db.session.add(feed)
+    db.session.commit()
+
+    paragraph = '<p>Текст новости с <b>разметкой</b> и <a href="https://example.com/">ссылкой</a>.</p>'
+    description = paragraph * max(1, description_bytes // len(paragraph.encode()))
+    now = datetime.utcnow()
+    rows = [
+        dict(
+            feed_id=feed.id,
+            title=f'Заголовок новости номер {i}',
+            link=f'https://example.com/news/{i}',
+            description=description,
+            guid=f'https://example.com/news/{i}',
+            published=now - timedelta(minutes=i),
+            image=f'https://example.com/images/{i}.jpg' if i % 2 else None,
+        )
+        for i in range(items)
+    ]
+    for start in range(0, len(rows), 1000):
+        db.session.bulk_insert_mappings(FeedItem, rows[start:start + 1000])
+    db.session.commit()
+    return feed.id
+
+
+def measure(render, repeat):
+    """
+    Медианное время (мс), пик памяти (КБ) и результат последнего прогона
+
+    Время замеряется без tracemalloc (он замедляет выделение памяти),
+    пик памяти - отдельным прогоном.
+    """
+    from modules.storage import db
+
+    samples = []
+    for _ in range(repeat):
+        db.session.remove()
+        started = time.perf_counter()
+        payload = render()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    db.session.remove()
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    return statistics.median(samples), peak / 1024, payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--description-bytes', type=int, default=4096, help='Размер описания элемента')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+    args = parser.parse_args()
+
+    from modules.aggregator import stream_feed_entries
+    from modules.feed_generator import generate_feed
+    from modules.storage import db, Feed, FeedItem
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(tmp)
+        with app.app_context():
+            feed_id = seed(args.items, args.description_bytes)
+
+            def orm_items():
+                return FeedItem.query.filter_by(feed_id=feed_id) \
+                                     .order_by(FeedItem.published.desc()).limit(args.limit).all()
+
+            def column_rows():
+                return stream_feed_entries(Feed.query.get(feed_id), args.limit)
+
+            def read(load):
+                # Только чтение из БД: все поля каждого элемента
+                return sum(len(item.description or '') for item in load())
+
+            def render(load, fmt):
+                return generate_feed(load(), 'Benchmark', 'Feed generation benchmark',
+                                     'https://example.com/source/1', fmt=fmt,
+                                     base_url='https://example.com').encode('utf-8')
+
+            for stage in ('read', 'rss', 'atom', 'json'):
+                for mode, load in (('orm', orm_items), ('columns', column_rows)):
+                    if stage == 'read':
+                        median_ms, peak_kb, _ = measure(lambda: read(load), args.repeat)
+                        size = 0
+                    else:
+                        median_ms, peak_kb, payload = measure(lambda: render(load, stage), args.repeat)
+                        size = len(payload)
+                    results.append({
+                        'stage': stage,
+                        'mode': mode,
+                        'limit': args.limit,
+                        'ms': median_ms,
+                        'peak_kb': peak_kb,
+                        'bytes': size,
+                    })
+            db.session.remove()
+            db.engine.dispose()
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"{args.items} items, limit={args.limit}, description {args.description_bytes} bytes, "
+          f"median of {args.repeat} runs")
+    print(f"{'stage':<8} {'mode':<8} {'ms':>10} {'peak KB':>10} {'bytes':>10}")
+    for result in results:
+        print(f"{result['stage']:<8} {result['mode']:<8} {result['ms']:>10.2f} "
+              f"{result['peak_kb']:>10.0f} {result['bytes']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Замер времени холодного старта веб-воркера (``python -X importtime``)
+
+Запускает ``import app`` в отдельном интерпретаторе несколько раз,
+разбирает вывод ``-X importtime`` и печатает суммарное время импорта
+и тяжелые модули, попавшие в процесс.
+
+Пример:
+    python benchmarks/import_time.py --runs 5
+    python benchmarks/import_time.py --repo /path/to/old/checkout
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = [
+    'selenium',
+    'webdriver_manager',
+    'bs4',
+    'requests',
+    'feedparser',
+    'apscheduler',
+]
+
+LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$')
+
+
+def measure(repo, module):
+    """
+    Один запуск импорта модуля с -X importtime
+
+    Args:
+        repo (str): Путь к корню репозитория
+        module (str): Имя импортируемого модуля
+
+    Returns:
+        dict: Время импорта модулей верхнего уровня (мкс) по именам
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        env['PYTHONDONTWRITEBYTECODE'] = '1'
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=repo,
+            env=env,
+            capture_output=True,
+            text=True
+        )
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repo', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # Первый запуск прогревает файловый кеш и .pyc, его не учитываем
+    measure(args.repo, args.module)
+
+    totals = []
+    loaded = {}
+    for _ in range(args.runs):
+        cumulative = measure(args.repo, args.module)
+        totals.append(cumulative.get(args.module, 0) / 1000)
+        for name in HEAVY_MODULES:
+            if name in cumulative:
+                loaded.setdefault(name, []).append(cumulative[name] / 1000)
+
+    print(f"import {args.module}: median {statistics.median(totals):.1f} ms, "
+          f"min {min(totals):.1f} ms, max {max(totals):.1f} ms ({args.runs} runs)")
+    print()
+    print(f"{'module':<20} {'loaded':<8} {'median ms':>10}")
+    for name in HEAVY_MODULES:
+        times = loaded.get(name)
+        if times:
+            print(f"{name:<20} {'yes':<8} {statistics.median(times):>10.1f}")
+        else:
+            print(f"{name:<20} {'no':<8} {'-':>10}")
+
+
+if __name__ == '__main__':
+    main()
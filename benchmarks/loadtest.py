@@ -0,0 +1,438 @@
+"""
+Нагрузочный тест публичных лент: /feed/<slug> и /source/<id>
+
+Заполняет временную базу SQLite лентами, элементами и агрегированными
+лентами, запускает приложение в отдельном процессе (встроенный сервер
+Werkzeug или gunicorn) и опрашивает его --clients клиентами. Клиенты
+бывают трех видов:
+    plain       - каждый раз загружают ленту целиком;
+    conditional - повторяют запрос с If-None-Match (ответ 304, если лента
+                  не изменилась);
+    delta       - запрашивают только новые элементы (?since=<курсор>).
+С --update-interval в базу периодически добавляются элементы, поэтому
+кеш готовых лент сбрасывается, как при обновлении источников.
+
+Печатает пропускную способность и задержки p50/p95/p99 по каждой точке
+входа. Данные генерируются детерминированно (--seed), результат в JSON
+(--output) содержит параметры и коммит, а --baseline сравнивает прогон с
+сохраненным - так результаты разных коммитов сопоставимы.
+
+Пример:
+    python benchmarks/loadtest.py --feeds 200 --items 100 --aggregates 10 --clients 32 --duration 30
+    python benchmarks/loadtest.py --output before.json
+    python benchmarks/loadtest.py --baseline before.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Фиксированная дата публикации элементов - чтобы базы разных прогонов совпадали
+EPOCH = datetime(2025, 1, 1)
+
+
+def percentile(values, pct):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def build_app(db_path):
+    from flask import Flask
+    from config import config
+    from modules.storage import init_db
+
+    app = Flask('loadtest')
+    app.config.from_object(config['production'])
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    init_db(app)
+    return app
+
+
+def seed(args):
+    """
+    Заполняет базу лентами, элементами и агрегированными лентами
+
+    Returns:
+        tuple: (ID лент, slug агрегированных лент)
+    """
+    from modules.storage import db, Feed, FeedItem, AggregatedFeed, aggregated_feed_association
+
+    rng = random.Random(args.seed)
+    db.session.bulk_insert_mappings(Feed, [
+        {'name': f'Feed {i}', 'feed_type': 'rss', 'url': f'https://example.com/{i}/rss', 'last_updated': EPOCH}
+        for i in range(args.feeds)
+    ])
+    db.session.commit()
+    feed_ids = [feed_id for (feed_id,) in db.session.query(Feed.id).order_by(Feed.id)]
+
+    paragraph = '<p>Текст новости с <b>разметкой</b> и <a href="https://example.com/">ссылкой</a>.</p>'
+    rows = []
+    for feed_id in feed_ids:
+        for i in range(args.items):
+            rows.append({
+                'feed_id': feed_id,
+                'title': f'Новость {i} ленты {feed_id}',
+                'link': f'https://example.com/{feed_id}/news/{i}',
+                'description': paragraph * rng.randint(1, args.description_paragraphs),
+                'guid': f'{feed_id}-{i}',
+                'published': EPOCH - timedelta(minutes=i * len(feed_ids) + feed_id),
+                'image': f'https://example.com/{feed_id}/images/{i}.jpg' if i % 3 == 0 else None,
+            })
+            if len(rows) >= 5000:
+                db.session.bulk_insert_mappings(FeedItem, rows)
+                rows = []
+    db.session.bulk_insert_mappings(FeedItem, rows)
+    db.session.commit()
+
+    slugs = []
+    for i in range(args.aggregates):
+        aggregate = AggregatedFeed(name=f'Aggregate {i}', slug=f'aggregate-{i}', last_updated=EPOCH)
+        db.session.add(aggregate)
+        db.session.flush()
+        sources = rng.sample(feed_ids, min(args.sources_per_aggregate, len(feed_ids)))
+        db.session.execute(aggregated_feed_association.insert(), [
+            {'aggregated_feed_id': aggregate.id, 'feed_id': feed_id} for feed_id in sources
+        ])
+        slugs.append(aggregate.slug)
+    db.session.commit()
+    return feed_ids, slugs
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, db_path, tmp, port):
+    """Запускает приложение в отдельном процессе, чтобы сервер и клиенты не делили GIL"""
+    env = dict(
+        os.environ,
+        DATABASE_URL='sqlite:///' + db_path,
+        FLASK_ENV='production',
+        BASE_URL=f'http://127.0.0.1:{port}',
+        PAYLOAD_STORE_DIR=os.path.join(tmp, 'payloads'),
+        SQLALCHEMY_SILENCE_UBER_WARNING='1',
+    )
+    env.pop('WEBSUB_HUB_URL', None)
+    if args.server == 'gunicorn':
+        if not shutil.which('gunicorn'):
+            sys.exit('gunicorn is not installed')
+        command = ['gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+                   '--threads', str(args.threads), '--worker-class', 'gthread', '--log-level', 'warning',
+                   'app:app']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', str(port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL if not args.verbose else None)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f'Server exited with code {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit('Server did not start in 60 seconds')
+
+
+def serve(port):
+    """Встроенный многопоточный сервер Werkzeug (режим дочернего процесса)"""
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def writer(app, feed_ids, interval, stop):
+    """Добавляет по элементу в случайную ленту каждые interval секунд"""
+    from modules.storage import db, FeedItem
+
+    rng = random.Random(0)
+    counter = 0
+    with app.app_context():
+        while not stop.wait(interval):
+            counter += 1
+            feed_id = rng.choice(feed_ids)
+            db.session.add(FeedItem(
+                feed_id=feed_id,
+                title=f'Свежая новость {counter}',
+                link=f'https://example.com/{feed_id}/fresh/{counter}',
+                description='<p>Свежая новость.</p>',
+                guid=f'fresh-{counter}',
+                published=EPOCH + timedelta(seconds=counter)
+            ))
+            db.session.commit()
+        db.session.remove()
+
+
+def client(index, args, base_url, targets, started, stop, results, lock):
+    """
+    Один опрашивающий клиент: свое соединение, свой вид и свои ETag/курсоры
+    """
+    import requests
+
+    rng = random.Random(args.seed * 1000 + index)
+    share = index / args.clients
+    if share < args.delta:
+        mode = 'delta'
+    elif share < args.delta + args.conditional:
+        mode = 'conditional'
+    else:
+        mode = 'plain'
+
+    session = requests.Session()
+    etags = {}
+    cursors = {}
+    samples = []
+    while not stop.is_set():
+        endpoint, paths = targets[0] if rng.random() < args.feed_share and targets[0][1] else targets[1]
+        url = base_url + rng.choice(paths) + '.' + rng.choice(args.formats)
+        headers = {}
+        params = None
+        if mode == 'conditional' and url in etags:
+            headers['If-None-Match'] = etags[url]
+        elif mode == 'delta' and url in cursors:
+            params = {'since': cursors[url]}
+
+        request_started = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers, params=params, timeout=30)
+            size = len(response.content)
+            status = response.status_code
+        except requests.RequestException:
+            size = 0
+            status = 'error'
+        elapsed = time.perf_counter() - request_started
+
+        if status in (200, 304):
+            if response.headers.get('ETag'):
+                etags[url] = response.headers['ETag']
+            if response.headers.get('X-Feed-Cursor'):
+                cursors[url] = response.headers['X-Feed-Cursor']
+        # Запросы прогрева не учитываются
+        if request_started - started >= args.warmup:
+            samples.append((f'{endpoint} {mode}', status, elapsed, size))
+        if args.think_ms:
+            stop.wait(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+    session.close()
+    with lock:
+        results.extend(samples)
+
+
+def summarize(samples, duration):
+    """Сводка по точкам входа: запросы в секунду, статусы, перцентили задержки"""
+    groups = {}
+    for endpoint, status, elapsed, size in samples:
+        groups.setdefault(endpoint, []).append((status, elapsed, size))
+    groups['total'] = [(status, elapsed, size) for _, status, elapsed, size in samples]
+
+    rows = []
+    for endpoint in sorted(groups, key=lambda name: (name == 'total', name)):
+        group = groups[endpoint]
+        latencies = sorted(elapsed * 1000 for _, elapsed, _ in group)
+        rows.append({
+            'endpoint': endpoint,
+            'requests': len(group),
+            'rps': len(group) / duration,
+            'ok': sum(1 for status, _, _ in group if status == 200),
+            'not_modified': sum(1 for status, _, _ in group if status == 304),
+            'errors': sum(1 for status, _, _ in group if status not in (200, 304)),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1] if latencies else 0.0,
+            'kb_per_request': sum(size for _, _, size in group) / 1024 / max(len(group), 1),
+        })
+    return rows
+
+
+def git_revision():
+    """Коммит и признак незафиксированных изменений - для сравнения прогонов"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_rows(rows, baseline=None):
+    columns = ['endpoint', 'requests', 'rps', 'ok', 'not_modified', 'errors',
+               'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'kb_per_request']
+    if baseline:
+        columns += ['rps_change', 'p95_change']
+    print(f"{columns[0]:<20}" + ''.join(f'{name:>15}' for name in columns[1:]))
+    for row in rows:
+        line = f"{row['endpoint']:<20}"
+        for name in columns[1:]:
+            value = row.get(name)
+            if value is None:
+                line += f"{'-':>15}"
+            elif isinstance(value, float):
+                line += f'{value:>15.2f}'
+            else:
+                line += f'{value:>15}'
+        print(line)
+
+
+def compare(rows, baseline):
+    """Добавляет изменение rps и p95 относительно сохраненного прогона, %"""
+    before = {row['endpoint']: row for row in baseline['results']}
+    for row in rows:
+        old = before.get(row['endpoint'])
+        if not old:
+            continue
+        if old['rps']:
+            row['rps_change'] = (row['rps'] - old['rps']) * 100 / old['rps']
+        if old['p95_ms']:
+            row['p95_change'] = (row['p95_ms'] - old['p95_ms']) * 100 / old['p95_ms']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='\n'.join(__doc__.strip().splitlines()[2:]))
+    parser.add_argument('--feeds', type=int, default=200)
+    parser.add_argument('--items', type=int, default=100, help='Элементов в каждой ленте')
+    parser.add_argument('--aggregates', type=int, default=10)
+    parser.add_argument('--sources-per-aggregate', type=int, default=20)
+    parser.add_argument('--description-paragraphs', type=int, default=20,
+                        help='Наибольший размер описания, абзацев (~90 байт)')
+    parser.add_argument('--clients', type=int, default=32, help='Одновременных клиентов')
+    parser.add_argument('--conditional', type=float, default=0.5, help='Доля клиентов с If-None-Match')
+    parser.add_argument('--delta', type=float, default=0.1, help='Доля клиентов с ?since=')
+    parser.add_argument('--feed-share', type=float, default=0.5,
+                        help='Доля запросов к агрегированным лентам (остальные - к источникам)')
+    parser.add_argument('--formats', type=lambda value: value.split(','), default=['rss'],
+                        help='Форматы через запятую: rss,atom,json')
+    parser.add_argument('--think-ms', type=float, default=0, help='Пауза клиента между запросами, мс')
+    parser.add_argument('--update-interval', type=float, default=0,
+                        help='Добавлять элемент в случайную ленту каждые N секунд (0 - не добавлять)')
+    parser.add_argument('--duration', type=float, default=20, help='Длительность замера, секунд')
+    parser.add_argument('--warmup', type=float, default=3, help='Прогрев (не учитывается), секунд')
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug')
+    parser.add_argument('--workers', type=int, default=2, help='Процессов gunicorn')
+    parser.add_argument('--threads', type=int, default=8, help='Потоков в процессе gunicorn')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+    parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+    parser.add_argument('--baseline', help='Сравнить с результатом из JSON-файла')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Показывать вывод сервера')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+    if args.conditional + args.delta > 1:
+        parser.error('--conditional + --delta must not exceed 1')
+    if set(args.formats) - {'rss', 'atom', 'json'}:
+        parser.error('--formats accepts rss, atom and json')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'loadtest.db')
+        app = build_app(db_path)
+        seed_started = time.monotonic()
+        with app.app_context():
+            feed_ids, slugs = seed(args)
+            from modules.storage import db
+            db.session.remove()
+        seed_seconds = time.monotonic() - seed_started
+
+        port = free_port()
+        server = start_server(args, db_path, tmp, port)
+        base_url = f'http://127.0.0.1:{port}'
+        targets = [
+            ('feed', [f'/feed/{slug}' for slug in slugs]),
+            ('source', [f'/source/{feed_id}' for feed_id in feed_ids]),
+        ]
+
+        stop = threading.Event()
+        results = []
+        lock = threading.Lock()
+        threads = []
+        try:
+            started = time.perf_counter()
+            if args.update_interval:
+                threads.append(threading.Thread(target=writer, args=(app, feed_ids, args.update_interval, stop)))
+            threads += [
+                threading.Thread(target=client, args=(i, args, base_url, targets, started, stop, results, lock))
+                for i in range(args.clients)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(args.warmup + args.duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            stop.set()
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            with app.app_context():
+                from modules.storage import db
+                db.engine.dispose()
+
+    rows = summarize(results, args.duration)
+    commit, dirty = git_revision()
+    result = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed_seconds': round(seed_seconds, 2),
+            'params': {name: value for name, value in vars(args).items()
+                       if name not in ('json', 'output', 'baseline', 'verbose', 'serve')},
+        },
+        'results': rows,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        compare(rows, baseline)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    print(f"{args.feeds} feeds x {args.items} items, {args.aggregates} aggregates, {args.clients} clients "
+          f"({args.conditional:.0%} conditional, {args.delta:.0%} delta), {args.server}, "
+          f"{args.duration:.0f}s after {args.warmup:.0f}s warmup, commit {commit}{' (dirty)' if dirty else ''}")
+    if args.baseline:
+        print(f"baseline: commit {baseline['meta']['commit']}, {baseline['meta']['date']}")
+    print_rows(rows, baseline=args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Замер импорта OPML: проверка, создание лент и первая загрузка элементов
+
+Поднимает локальный HTTP-сервер, который отдает небольшую RSS-ленту по
+любому адресу (адреса с /missing/ - 404), генерирует OPML с заданным
+количеством источников на нескольких хостах (127.0.0.1, 127.0.0.2, ... -
+для регулятора запросов это разные хосты) и выполняет импорт с проверкой
+и без нее. Печатает время разбора OPML, общее время импорта, скорость и
+счетчики задачи.
+
+Пример:
+    python benchmarks/opml_import.py --feeds 5000 --hosts 50
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RSS_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Feed {path}</title><link>http://example.com/</link>
+<description>Benchmark feed</description>{items}</channel></rss>"""
+
+ITEM_TEMPLATE = """<item><title>Item {index}</title><link>http://example.com{path}/{index}</link>
+<guid>{path}/{index}</guid><pubDate>Mon, 06 Jan 2025 10:00:00 GMT</pubDate>
+<description>Lorem ipsum dolor sit amet.</description></item>"""
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Отдает RSS-ленту с items_per_feed элементами по любому адресу"""
+
+    items_per_feed = 10
+
+    def do_GET(self):
+        if self.path == '/robots.txt' or '/missing/' in self.path:
+            self.send_response(404)
+            self.end_headers()
+            return
+        items = ''.join(ITEM_TEMPLATE.format(index=i, path=self.path) for i in range(self.items_per_feed))
+        body = RSS_TEMPLATE.format(path=self.path, items=items).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_opml(feeds, hosts, port, invalid_share):
+    """Генерирует OPML: источники по кругу на hosts хостах в 10 группах"""
+    invalid_every = int(1 / invalid_share) if invalid_share else 0
+    groups = {}
+    for i in range(feeds):
+        host = f'127.0.0.{i % hosts + 1}:{port}'
+        path = f'/missing/{i}' if invalid_every and i % invalid_every == 0 else f'/feed/{i}'
+        groups.setdefault(f'Group {i % 10}', []).append(
+            f'<outline type="rss" text="Feed {i}" xmlUrl="http://{host}{path}"/>'
+        )
+    body = ''.join(
+        f'<outline text="{name}">{"".join(outlines)}</outline>' for name, outlines in groups.items()
+    )
+    return f'<?xml version="1.0"?><opml version="2.0"><head><title>bench</title></head><body>{body}</body></opml>'.encode()
+
+
+def build_app(tmp, args):
+    from flask import Flask
+    from config import config
+    from modules.storage import init_db
+
+    app = Flask('opml_import')
+    app.config.from_object(config['production'])
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'import.db'),
+        PAYLOAD_STORE_DIR=os.path.join(tmp, 'payloads'),
+        HOST_RATE_LIMIT=args.host_rate,
+        HOST_BURST=args.host_burst,
+        OPML_IMPORT_WORKERS=args.workers,
+        WEBSUB_ENABLED=False,
+    )
+    init_db(app)
+    return app
+
+
+def run_case(args, port, validate):
+    """Импортирует сгенерированный OPML в чистую базу и возвращает замеры"""
+    from modules.opml import parse_opml, run_import, import_progress
+    from modules.politeness import get_governor
+    from modules.storage import db, ImportJob, FeedItem
+
+    content = build_opml(args.feeds, args.hosts, port, args.invalid_share)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(tmp, args)
+        with app.app_context():
+            get_governor().reset()
+
+            started = time.perf_counter()
+            entries = parse_opml(content)
+            parse_seconds = time.perf_counter() - started
+
+            job = ImportJob(status='pending', validate=validate, total=len(entries))
+            db.session.add(job)
+            db.session.commit()
+
+            # update_feed печатает ход обновления каждой ленты
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_import(app, job.id, entries)
+            import_seconds = time.perf_counter() - started
+
+            db.session.expire_all()
+            progress = import_progress(ImportJob.query.get(job.id))
+            items = FeedItem.query.count()
+            db.engine.dispose()
+
+    return {
+        'mode': 'validate' if validate else 'no-validate',
+        'feeds': args.feeds,
+        'parse_ms': parse_seconds * 1000,
+        'import_s': import_seconds,
+        'feeds_per_sec': args.feeds / import_seconds,
+        'created': progress['created'],
+        'invalid': progress['invalid'],
+        'fetched': progress['fetched'],
+        'items': items,
+        'status': progress['status'],
+    }
+
+
+def print_results(results):
+    columns = ['mode', 'feeds', 'parse_ms', 'import_s', 'feeds_per_sec', 'created', 'invalid', 'fetched', 'items', 'status']
+    print(' '.join(f'{name:>13}' for name in columns))
+    for result in results:
+        row = []
+        for name in columns:
+            value = result[name]
+            row.append(f'{value:>13.2f}' if isinstance(value, float) else f'{value:>13}')
+        print(' '.join(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--feeds', type=int, default=5000)
+    parser.add_argument('--hosts', type=int, default=50, help='Количество разных хостов (до 254)')
+    parser.add_argument('--items', type=int, default=10, help='Элементов в каждой ленте')
+    parser.add_argument('--workers', type=int, default=16, help='OPML_IMPORT_WORKERS')
+    parser.add_argument('--host-rate', type=float, default=20.0, help='HOST_RATE_LIMIT, запросов в секунду')
+    parser.add_argument('--host-burst', type=int, default=5, help='HOST_BURST')
+    parser.add_argument('--invalid-share', type=float, default=0.02, help='Доля недоступных лент')
+    parser.add_argument('--mode', choices=['validate', 'no-validate', 'both'], default='both')
+    parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+    args = parser.parse_args()
+
+    # Ошибки недоступных лент ожидаемы и не нужны в выводе
+    logging.getLogger('modules').setLevel(logging.CRITICAL)
+
+    FeedHandler.items_per_feed = args.items
+    server = ThreadingHTTPServer(('', 0), FeedHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    modes = [True, False] if args.mode == 'both' else [args.mode == 'validate']
+    try:
+        results = [run_case(args, port, validate) for validate in modes]
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Нагрузочная проверка профиля SQLite: чтение во время обновлений
+
+Запускает писателя, который пачками вставляет элементы лент (как
+update_feed), и несколько читателей, выбирающих последние элементы ленты
+(как generate_single_feed). Печатает задержки чтения (p50/p95/p99) и
+количество ошибок 'database is locked' для профиля по умолчанию
+(без PRAGMA, NullPool) и для профиля из config.py.
+
+Пример:
+    python benchmarks/sqlite_stress.py --profile both --duration 10
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(values, pct):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def build_app(db_path, profile):
+    """
+    Создает минимальное приложение с нужным профилем хранилища
+
+    Args:
+        db_path (str): Путь к файлу базы данных
+        profile (str): 'default' или 'tuned'
+
+    Returns:
+        Flask: Экземпляр приложения
+    """
+    from flask import Flask
+    from config import config
+    from modules.storage import init_db
+
+    app = Flask('sqlite_stress')
+    app.config.from_object(config['production'])
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    if profile == 'default':
+        app.config['SQLITE_PRAGMAS'] = {}
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    init_db(app)
+    return app
+
+
+def seed(app, feeds, items):
+    """Заполняет базу лентами и элементами"""
+    from modules.storage import db, Feed, FeedItem
+
+    with app.app_context():
+        db.session.bulk_insert_mappings(Feed, [
+            {'name': f'Feed {i}', 'feed_type': 'rss', 'url': f'http://example.com/{i}/rss'}
+            for i in range(feeds)
+        ])
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(FeedItem, [
+            {
+                'feed_id': i % feeds + 1,
+                'title': f'Item {i}',
+                'link': f'http://example.com/item/{i}',
+                'description': 'Lorem ipsum dolor sit amet. ' * 20,
+                'guid': f'seed-{i}',
+                'published': now - timedelta(minutes=i),
+            }
+            for i in range(items)
+        ])
+        db.session.commit()
+
+
+def run_profile(args):
+    """Выполняет нагрузку для одного профиля и возвращает результаты"""
+    from sqlalchemy.exc import OperationalError
+    from modules.storage import db, FeedItem
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'stress.db'), args.profile)
+        seed(app, args.feeds, args.items)
+
+        stop = threading.Event()
+        read_latencies = []
+        write_latencies = []
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+
+        def writer():
+            counter = 0
+            with app.app_context():
+                while not stop.is_set():
+                    feed_id = random.randint(1, args.feeds)
+                    started = time.perf_counter()
+                    try:
+                        for _ in range(args.write_batch):
+                            counter += 1
+                            db.session.add(FeedItem(
+                                feed_id=feed_id,
+                                title=f'New {counter}',
+                                link=f'http://example.com/new/{counter}',
+                                description='Fresh content. ' * 40,
+                                guid=f'new-{counter}',
+                                published=datetime.utcnow()
+                            ))
+                        db.session.commit()
+                        elapsed = time.perf_counter() - started
+                        with lock:
+                            write_latencies.append(elapsed)
+                    except OperationalError:
+                        db.session.rollback()
+                        with lock:
+                            errors['write'] += 1
+                    finally:
+                        db.session.remove()
+
+        def reader():
+            with app.app_context():
+                while not stop.is_set():
+                    feed_id = random.randint(1, args.feeds)
+                    started = time.perf_counter()
+                    try:
+                        FeedItem.query.filter_by(feed_id=feed_id) \
+                            .order_by(FeedItem.published.desc()) \
+                            .limit(50).all()
+                        elapsed = time.perf_counter() - started
+                        with lock:
+                            read_latencies.append(elapsed)
+                    except OperationalError:
+                        with lock:
+                            errors['read'] += 1
+                    finally:
+                        db.session.remove()
+
+        threads = [threading.Thread(target=writer)]
+        threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            db.engine.dispose()
+
+    read_latencies.sort()
+    return {
+        'profile': args.profile,
+        'reads': len(read_latencies),
+        'reads_per_sec': len(read_latencies) / args.duration,
+        'read_p50_ms': percentile(read_latencies, 50) * 1000,
+        'read_p95_ms': percentile(read_latencies, 95) * 1000,
+        'read_p99_ms': percentile(read_latencies, 99) * 1000,
+        'read_max_ms': (read_latencies[-1] if read_latencies else 0) * 1000,
+        'read_errors': errors['read'],
+        'write_batches': len(write_latencies),
+        'write_errors': errors['write'],
+    }
+
+
+def print_results(results):
+    columns = ['profile', 'reads', 'reads_per_sec', 'read_p50_ms', 'read_p95_ms',
+               'read_p99_ms', 'read_max_ms', 'read_errors', 'write_batches', 'write_errors']
+    print(' '.join(f'{name:>14}' for name in columns))
+    for result in results:
+        row = []
+        for name in columns:
+            value = result[name]
+            row.append(f'{value:>14.2f}' if isinstance(value, float) else f'{value:>14}')
+        print(' '.join(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profile', choices=['default', 'tuned', 'both'], default='both')
+    parser.add_argument('--feeds', type=int, default=50)
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--write-batch', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--json', action='store_true', help='Вывести результат одного профиля в JSON')
+    args = parser.parse_args()
+
+    if args.profile != 'both':
+        result = run_profile(args)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_results([result])
+        return
+
+    # Каждый профиль запускается в отдельном процессе, чтобы движки и
+    # обработчики событий SQLAlchemy не влияли друг на друга
+    results = []
+    for profile in ('default', 'tuned'):
+        command = [sys.executable, os.path.abspath(__file__), '--profile', profile, '--json']
+        for name in ('feeds', 'items', 'readers', 'write_batch', 'duration'):
+            command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
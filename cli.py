@@ -0,0 +1,564 @@
+"""
+Командная строка для обновления лент и обслуживания без HTTP-сервера
+
+Подходит для cron и заданий Kubernetes: каждая команда печатает таблицу
+с временем по каждой ленте (или таблице) и завершается с ненулевым кодом,
+если превышены пороги ошибок.
+
+Примеры:
+    python cli.py update --all --workers 8
+    python cli.py update --id 3 --id 7 --force
+    python cli.py update --type scrape --max-failures 0
+    python cli.py benchmark --type rss --max-p95-ms 2000
+    python cli.py prune --days 90 --keep-latest 50
+    python cli.py dedupe --dry-run
+    python cli.py history --hours 12 --limit 10
+    python cli.py reindex --vacuum
+    python cli.py compact-bodies --vacuum
+    python cli.py export --output public/ --format atom
+    python cli.py export --format opml --output feeds.opml
+
+Коды завершения: 0 - успех, 1 - превышен порог ошибок, 2 - неверные аргументы.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+
+
+def percentile(values, pct):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def print_table(rows, columns):
+    """Печатает строки-словари таблицей: числа выравниваются вправо, текст - влево"""
+    def cell(value):
+        if isinstance(value, float):
+            return f'{value:.2f}'
+        return '' if value is None else str(value)
+
+    cells = [[cell(row.get(name)) for name in columns] for row in rows]
+    widths = [max([len(name)] + [len(line[i]) for line in cells]) for i, name in enumerate(columns)]
+    numeric = [
+        any(row.get(name) is not None for row in rows)
+        and all(isinstance(row.get(name), (int, float)) for row in rows if row.get(name) is not None)
+        for name in columns
+    ]
+
+    def line(values):
+        return '  '.join(
+            value.rjust(width) if is_number else value.ljust(width)
+            for value, width, is_number in zip(values, widths, numeric)
+        ).rstrip()
+
+    print(line(columns))
+    print('  '.join('-' * width for width in widths))
+    for values in cells:
+        print(line(values))
+
+
+def report(args, rows, columns, summary):
+    """Выводит результат команды таблицей или в JSON"""
+    if args.json:
+        print(json.dumps({'rows': rows, 'summary': summary}, ensure_ascii=False, default=str))
+        return
+    if rows:
+        print_table(rows, columns)
+        print()
+    print('  '.join(f'{name}={value:.2f}' if isinstance(value, float) else f'{name}={value}'
+                    for name, value in summary.items()))
+
+
+def failure_threshold_exceeded(args, failures, total):
+    """Проверяет пороги --max-failures и --max-failure-rate"""
+    if args.max_failures is not None and failures > args.max_failures:
+        return True
+    if total and failures / total > args.max_failure_rate:
+        return True
+    return False
+
+
+@contextlib.contextmanager
+def quiet(verbose):
+    """Перенаправляет отладочный вывод print модулей в stderr или отключает его"""
+    if verbose:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def select_feeds(args, due_only=False):
+    """
+    Выбирает ленты по аргументам --all, --id и --type
+
+    Args:
+        args (Namespace): Аргументы команды
+        due_only (bool): Пропускать приостановленные ленты и ленты в паузе
+            после ошибок (как плановое обновление)
+
+    Returns:
+        list: ID лент
+    """
+    from modules.storage import db, Feed
+
+    query = db.session.query(Feed.id).filter(Feed.active.is_(True))
+    if args.ids:
+        query = query.filter(Feed.id.in_(args.ids))
+    if args.type:
+        query = query.filter(Feed.feed_type == args.type)
+    if due_only:
+        now = datetime.utcnow()
+        query = query.filter(
+            Feed.suspended.isnot(True),
+            db.or_(Feed.next_retry_at.is_(None), Feed.next_retry_at <= now)
+        )
+    return [feed_id for (feed_id,) in query.order_by(Feed.id)]
+
+
+def run_pool(app, feed_ids, workers, task):
+    """
+    Выполняет task(feed) для каждой ленты в пуле потоков
+
+    Каждый поток работает в своем контексте приложения и своей сессии БД.
+
+    Returns:
+        list: Результаты task в порядке feed_ids
+    """
+    from modules.storage import db, Feed
+
+    def run(feed_id):
+        with app.app_context():
+            try:
+                feed = Feed.query.get(feed_id)
+                return task(feed)
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(run, feed_ids))
+
+
+def cmd_update(app, args):
+    """Обновляет выбранные ленты"""
+    from modules.aggregator import update_feed, latest_item_id
+    from modules.fetcher import pop_bytes_read
+    from modules.storage import db, FeedItem
+
+    def task(feed):
+        if args.force:
+            # Разбираем ответ заново, даже если он не изменился (например,
+            # чтобы заполнить новые поля элементов)
+            feed.parsed_content_hash = None
+        last_id = latest_item_id(feed)
+        pop_bytes_read()
+        started = time.monotonic()
+        success = update_feed(feed)
+        elapsed = time.monotonic() - started
+        new_items = db.session.query(FeedItem).filter(FeedItem.feed_id == feed.id, FeedItem.id > last_id).count()
+        return {
+            'id': feed.id,
+            'name': feed.name[:40],
+            'type': feed.feed_type,
+            'status': 'ok' if success else 'error',
+            'seconds': elapsed,
+            'new': new_items,
+            'bytes': pop_bytes_read(),
+            'error': None if success else f"{feed.last_error_class}: {feed.last_error or ''}"[:80]
+        }
+
+    feed_ids = select_feeds(args, due_only=not args.force)
+    started = time.monotonic()
+    with quiet(args.verbose):
+        rows = run_pool(app, feed_ids, args.workers, task)
+    elapsed = time.monotonic() - started
+
+    failures = sum(1 for row in rows if row['status'] != 'ok')
+    report(args, rows, ['id', 'name', 'type', 'status', 'seconds', 'new', 'bytes', 'error'], {
+        'feeds': len(rows),
+        'failed': failures,
+        'new_items': sum(row['new'] for row in rows),
+        'bytes': sum(row['bytes'] for row in rows),
+        'seconds': elapsed
+    })
+    return EXIT_FAILED if failure_threshold_exceeded(args, failures, len(rows)) else EXIT_OK
+
+
+def cmd_benchmark(app, args):
+    """Замеряет загрузку и разбор выбранных лент без записи в БД"""
+    from modules.aggregator import parse_rss_content, parse_news_sitemap
+    from modules.fetcher import fetch_url, pop_last_error
+
+    def task(feed):
+        row = {'id': feed.id, 'name': feed.name[:40], 'type': feed.feed_type}
+        pop_last_error()
+        selectors = feed.get_selectors()
+        try:
+            started = time.monotonic()
+            if feed.feed_type == 'scrape' and selectors.get('use_selenium'):
+                from modules.scraper import get_html
+                html = get_html(feed.url, use_selenium=True, max_bytes=feed.max_fetch_bytes)
+                if html is None:
+                    raise RuntimeError('Page is not available')
+                row['bytes'] = len(html.encode('utf-8'))
+            else:
+                response = fetch_url(feed.url, max_bytes=feed.max_fetch_bytes)
+                row['bytes'] = response.bytes_read
+            row['fetch_ms'] = (time.monotonic() - started) * 1000
+
+            started = time.monotonic()
+            if feed.feed_type == 'rss':
+                feed_data = parse_rss_content(response.content, response.url, response.headers.get('Content-Type'))
+                entries = feed_data['entries'] if feed_data else None
+            elif feed.feed_type == 'sitemap':
+                feed_data = parse_news_sitemap(response.content, response.url)
+                entries = feed_data['entries'] if feed_data else None
+            else:
+                from modules.scraper import extract_entries
+                if not selectors.get('use_selenium'):
+                    html = response.text
+                entries = extract_entries(html, selectors, feed.url)
+            row['parse_ms'] = (time.monotonic() - started) * 1000
+            row['entries'] = len(entries or [])
+            row['status'] = 'ok' if entries else 'empty'
+        except Exception as e:
+            row['status'] = 'error'
+            row['error'] = f"{type(e).__name__}: {str(e)}"[:80]
+        return row
+
+    feed_ids = select_feeds(args)
+    with quiet(args.verbose):
+        rows = run_pool(app, feed_ids, args.workers, task)
+
+    ok = [row for row in rows if row['status'] == 'ok']
+    fetch = sorted(row['fetch_ms'] for row in ok)
+    parse = sorted(row['parse_ms'] for row in ok)
+    failures = len(rows) - len(ok)
+    summary = {
+        'feeds': len(rows),
+        'failed': failures,
+        'fetch_p50_ms': percentile(fetch, 50),
+        'fetch_p95_ms': percentile(fetch, 95),
+        'parse_p50_ms': percentile(parse, 50),
+        'parse_p95_ms': percentile(parse, 95),
+        'bytes': sum(row.get('bytes', 0) for row in rows)
+    }
+    report(args, rows, ['id', 'name', 'type', 'status', 'fetch_ms', 'parse_ms', 'bytes', 'entries', 'error'], summary)
+
+    if failure_threshold_exceeded(args, failures, len(rows)):
+        return EXIT_FAILED
+    if args.max_p95_ms is not None and summary['fetch_p95_ms'] + summary['parse_p95_ms'] > args.max_p95_ms:
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def cmd_prune(app, args):
+    """Удаляет старые элементы лент и неиспользуемый полный текст статей"""
+    from modules.aggregator import prune_feed_items
+    from modules.storage import db, Feed, FeedItem, ItemContent
+    from modules.update_history import prune_update_runs
+
+    older_than = datetime.utcnow() - timedelta(days=args.days)
+    rows = []
+    for (feed_id,) in db.session.query(Feed.id).order_by(Feed.id):
+        feed = Feed.query.get(feed_id)
+        started = time.monotonic()
+        deleted = prune_feed_items(feed, older_than, keep_latest=args.keep_latest, dry_run=args.dry_run)
+        rows.append({'id': feed.id, 'name': feed.name[:40], 'deleted': deleted,
+                     'seconds': time.monotonic() - started})
+
+    # Полный текст статей, на которые больше не ссылается ни один элемент
+    orphaned = ItemContent.query.filter(~db.session.query(FeedItem.id)
+                                        .filter(FeedItem.link == ItemContent.url).exists())
+    articles = orphaned.count() if args.dry_run else orphaned.delete(synchronize_session=False)
+    db.session.commit()
+    runs = prune_update_runs(dry_run=args.dry_run)
+
+    report(args, [row for row in rows if row['deleted'] or args.verbose], ['id', 'name', 'deleted', 'seconds'], {
+        'feeds': len(rows),
+        'deleted_items': sum(row['deleted'] for row in rows),
+        'deleted_articles': articles,
+        'deleted_update_runs': runs,
+        'dry_run': args.dry_run
+    })
+    return EXIT_OK
+
+
+def cmd_dedupe(app, args):
+    """Пересчитывает GUID элементов парсинга по каноническим ссылкам и объединяет дубликаты"""
+    from modules.canonical import canonicalize_feed_items
+    from modules.storage import Feed
+
+    # GUID элементов RSS задает источник, пересчитываются только элементы парсинга
+    args.type = 'scrape'
+    rows = []
+    for feed_id in select_feeds(args):
+        feed = Feed.query.get(feed_id)
+        started = time.monotonic()
+        updated, merged = canonicalize_feed_items(feed, dry_run=args.dry_run)
+        rows.append({'id': feed.id, 'name': feed.name[:40], 'updated': updated, 'merged': merged,
+                     'seconds': time.monotonic() - started})
+
+    report(args, rows, ['id', 'name', 'updated', 'merged', 'seconds'], {
+        'feeds': len(rows),
+        'updated': sum(row['updated'] for row in rows),
+        'merged': sum(row['merged'] for row in rows),
+        'dry_run': args.dry_run
+    })
+    return EXIT_OK
+
+
+def cmd_history(app, args):
+    """Печатает ленты, на которые ушло больше всего времени обновлений (или с ошибками)"""
+    from modules.update_history import update_history_report
+
+    history = update_history_report(hours=args.hours, limit=args.limit)
+    rows = [
+        {'id': row['feed_id'], 'name': (row['name'] or '')[:40], 'runs': row['runs'],
+         'failures': row['failures'], 'total_s': row['total_ms'] / 1000, 'share': row['share'],
+         'fetch_ms': row['fetch_ms'], 'parse_ms': row['parse_ms'], 'write_ms': row['write_ms'],
+         'bytes': row['bytes'], 'trend': row['total_ms_trend'],
+         'error': row['last_error'] and f"{row['last_error']['error_class']}: {row['last_error']['error'] or ''}"[:60]}
+        for row in history['failing' if args.failing else 'slowest']
+    ]
+    columns = ['id', 'name', 'runs', 'failures', 'total_s', 'share', 'fetch_ms', 'parse_ms', 'write_ms', 'bytes', 'trend']
+    report(args, rows, columns + (['error'] if args.failing else []), dict(hours=args.hours, **history['totals']))
+    return EXIT_OK
+
+
+def cmd_reindex(app, args):
+    """Перестраивает индексы и обновляет статистику БД"""
+    from modules.storage import reindex_database
+
+    started = time.monotonic()
+    timings = reindex_database(vacuum=args.vacuum)
+    rows = [{'table': table, 'seconds': seconds} for table, seconds in timings]
+    report(args, rows, ['table', 'seconds'], {'tables': len(rows), 'seconds': time.monotonic() - started})
+    return EXIT_OK
+
+
+def item_scan_ms(repeat=5):
+    """Медианное время поиска слова по всем элементам (полный просмотр таблицы), мс"""
+    from modules.aggregator import _keyword_condition
+    from modules.storage import db, FeedItem
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.session.query(db.func.count(FeedItem.id)).filter(_keyword_condition('qzxjv')).scalar()
+        samples.append((time.perf_counter() - started) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+def cmd_compact_bodies(app, args):
+    """Выносит длинные описания элементов в сжатую таблицу и сравнивает размер БД и скорость просмотра"""
+    from modules.item_body import compact_feed_bodies
+    from modules.storage import db, Feed, database_size, reindex_database
+
+    size_before = database_size()
+    scan_before = item_scan_ms()
+
+    query = db.session.query(Feed.id)
+    if args.ids:
+        query = query.filter(Feed.id.in_(args.ids))
+    rows = []
+    for (feed_id,) in query.order_by(Feed.id):
+        feed = Feed.query.get(feed_id)
+        started = time.monotonic()
+        moved, before, after = compact_feed_bodies(feed, dry_run=args.dry_run)
+        rows.append({'id': feed.id, 'name': feed.name[:40], 'moved': moved, 'bytes_before': before,
+                     'bytes_after': after, 'seconds': time.monotonic() - started})
+
+    if args.vacuum and not args.dry_run:
+        db.session.remove()
+        reindex_database(vacuum=True)
+    size_after = size_before if args.dry_run else database_size()
+    scan_after = scan_before if args.dry_run else item_scan_ms()
+
+    bytes_before = sum(row['bytes_before'] for row in rows)
+    bytes_after = sum(row['bytes_after'] for row in rows)
+    report(args, [row for row in rows if row['moved'] or args.verbose],
+           ['id', 'name', 'moved', 'bytes_before', 'bytes_after', 'seconds'], {
+               'moved': sum(row['moved'] for row in rows),
+               'bytes_before': bytes_before,
+               'bytes_after': bytes_after,
+               'db_bytes_before': size_before,
+               'db_bytes_after': size_after,
+               'scan_ms_before': scan_before,
+               'scan_ms_after': scan_after,
+               'dry_run': args.dry_run
+           })
+    return EXIT_OK
+
+
+def cmd_export(app, args):
+    """Выгружает ленты в файлы или OPML"""
+    from modules.feed_generator import generate_single_feed, generate_aggregated_feed
+    from modules.storage import db, Feed, AggregatedFeed
+
+    base_url = app.config['BASE_URL']
+
+    if args.format == 'opml':
+        from modules.opml import export_opml
+        payload = export_opml(base_url)
+        if args.output and args.output != '-':
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(payload)
+        else:
+            sys.stdout.write(payload + '\n')
+        return EXIT_OK
+
+    if not args.output:
+        print('export: --output DIR is required for feed formats', file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    targets = []
+    if not args.sources_only:
+        aggregates = AggregatedFeed.query.filter_by(active=True)
+        if args.ids:
+            aggregates = aggregates.filter(AggregatedFeed.id.in_(args.ids))
+        targets += [('aggregate', aggregate) for aggregate in aggregates.order_by(AggregatedFeed.id)]
+    if not args.aggregates_only:
+        sources = Feed.query.filter_by(active=True)
+        if args.ids:
+            sources = sources.filter(Feed.id.in_(args.ids))
+        targets += [('source', feed) for feed in sources.order_by(Feed.id)]
+
+    rows = []
+    for kind, target in targets:
+        started = time.monotonic()
+        if kind == 'aggregate':
+            payload = generate_aggregated_feed(target, base_url, limit=args.limit, fmt=args.format)
+            filename = f"feed-{target.slug}.{args.format}"
+        else:
+            payload = generate_single_feed(target, base_url, limit=args.limit, fmt=args.format)
+            filename = f"source-{target.id}.{args.format}"
+        if payload is not None:
+            with open(os.path.join(args.output, filename), 'w', encoding='utf-8') as f:
+                f.write(payload)
+        rows.append({
+            'kind': kind,
+            'id': target.id,
+            'name': target.name[:40],
+            'status': 'ok' if payload is not None else 'error',
+            'bytes': len(payload.encode('utf-8')) if payload is not None else 0,
+            'ms': (time.monotonic() - started) * 1000,
+            'file': filename
+        })
+    db.session.remove()
+
+    failures = sum(1 for row in rows if row['status'] != 'ok')
+    report(args, rows, ['kind', 'id', 'name', 'status', 'bytes', 'ms', 'file'], {
+        'feeds': len(rows),
+        'failed': failures,
+        'bytes': sum(row['bytes'] for row in rows)
+    })
+    return EXIT_FAILED if failure_threshold_exceeded(args, failures, len(rows)) else EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='\n'.join(__doc__.strip().splitlines()[5:]))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def common(command, select=True, thresholds=True):
+        command.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+        command.add_argument('--verbose', '-v', action='store_true', help='Показывать ход работы в stderr')
+        if select:
+            command.add_argument('--all', action='store_true', help='Все активные ленты (по умолчанию)')
+            command.add_argument('--id', dest='ids', type=int, action='append', help='ID ленты (можно повторять)')
+            command.add_argument('--type', choices=['rss', 'scrape', 'sitemap'], help='Только ленты этого типа')
+        if thresholds:
+            command.add_argument('--max-failures', type=int, help='Допустимое количество ошибок')
+            command.add_argument('--max-failure-rate', type=float, default=0.25,
+                                 help='Допустимая доля ошибок (по умолчанию 0.25)')
+
+    update = commands.add_parser('update', help='Обновить ленты')
+    common(update)
+    update.add_argument('--workers', type=int, default=4, help='Сколько лент обновлять одновременно')
+    update.add_argument('--force', action='store_true',
+                        help='Обновить и приостановленные ленты, разобрать неизменившиеся ответы заново')
+    update.set_defaults(handler=cmd_update)
+
+    benchmark = commands.add_parser('benchmark', help='Замерить загрузку и разбор лент без записи в БД')
+    common(benchmark)
+    benchmark.add_argument('--workers', type=int, default=4)
+    benchmark.add_argument('--max-p95-ms', type=float, help='Порог p95 загрузки и разбора, мс')
+    benchmark.set_defaults(handler=cmd_benchmark)
+
+    prune = commands.add_parser('prune', help='Удалить старые элементы')
+    common(prune, select=False, thresholds=False)
+    prune.add_argument('--days', type=int, default=90, help='Удалять элементы старше, дней')
+    prune.add_argument('--keep-latest', type=int, default=50, help='Оставлять последних элементов каждой ленты')
+    prune.add_argument('--dry-run', action='store_true', help='Только посчитать')
+    prune.set_defaults(handler=cmd_prune)
+
+    dedupe = commands.add_parser('dedupe', help='Пересчитать GUID элементов парсинга и объединить дубликаты')
+    common(dedupe, select=False, thresholds=False)
+    dedupe.add_argument('--id', dest='ids', type=int, action='append', help='ID ленты (можно повторять)')
+    dedupe.add_argument('--dry-run', action='store_true', help='Только посчитать')
+    dedupe.set_defaults(handler=cmd_dedupe)
+
+    history = commands.add_parser('history', help='Самые медленные и самые неудачные ленты по истории обновлений')
+    common(history, select=False, thresholds=False)
+    history.add_argument('--hours', type=int, default=24, help='За сколько последних часов')
+    history.add_argument('--limit', type=int, default=10, help='Сколько лент показать')
+    history.add_argument('--failing', action='store_true', help='Ленты с ошибками вместо самых медленных')
+    history.set_defaults(handler=cmd_history)
+
+    reindex = commands.add_parser('reindex', help='Перестроить индексы и обновить статистику БД')
+    common(reindex, select=False, thresholds=False)
+    reindex.add_argument('--vacuum', action='store_true', help='Выполнить VACUUM (SQLite)')
+    reindex.set_defaults(handler=cmd_reindex)
+
+    compact = commands.add_parser('compact-bodies', help='Сжать длинные описания сохраненных элементов')
+    common(compact, select=False, thresholds=False)
+    compact.add_argument('--id', dest='ids', type=int, action='append', help='ID ленты (можно повторять)')
+    compact.add_argument('--dry-run', action='store_true', help='Только посчитать')
+    compact.add_argument('--vacuum', action='store_true',
+                         help='Выполнить VACUUM и ANALYZE, чтобы вернуть освободившееся место (SQLite)')
+    compact.set_defaults(handler=cmd_compact_bodies)
+
+    export = commands.add_parser('export', help='Выгрузить ленты в файлы или OPML')
+    common(export, select=False)
+    export.add_argument('--format', choices=['rss', 'atom', 'json', 'opml'], default='rss')
+    export.add_argument('--output', '-o', help='Каталог для лент или файл для OPML (по умолчанию stdout)')
+    export.add_argument('--id', dest='ids', type=int, action='append', help='ID ленты или агрегата')
+    export.add_argument('--limit', type=int, default=50, help='Элементов в ленте')
+    export.add_argument('--aggregates-only', action='store_true')
+    export.add_argument('--sources-only', action='store_true')
+    export.set_defaults(handler=cmd_export)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr)
+
+    # Импорт приложения создает схему БД; HTTP-сервер и планировщик не запускаются
+    with quiet(args.verbose):
+        from app import app
+
+    with app.app_context():
+        return args.handler(app, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,6 +8,23 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'rss_aggregator.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Пул соединений SQLAlchemy
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+    }
+    
+    # Профиль SQLite, применяемый к каждому новому соединению
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',        # Читатели не блокируются писателем
+        'synchronous': 'NORMAL',      # В режиме WAL безопасно и быстрее FULL
+        'busy_timeout': 5000,         # Ожидание блокировки, мс
+        'mmap_size': 268435456,       # 256 МБ
+        'cache_size': -65536,         # 64 МБ (отрицательное значение - в КиБ)
+    }
+    
     # Настройки для RSS-лент
     RSS_FEED_TITLE = "Агрегированная RSS-лента"
     RSS_FEED_DESCRIPTION = "Лента, созданная RSS Aggregator"
@@ -16,12 +33,105 @@ class Config:
     # Настройки для обновления данных (в секундах)
     UPDATE_INTERVAL = 3600  # Обновлять RSS каждый час
     
+    # Выбор лидера среди процессов с планировщиком (файловая блокировка).
+    # Файл должен лежать на локальной файловой системе хоста.
+    SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE') or os.path.join(
+        os.path.abspath(os.path.dirname(__file__)), 'temp', 'scheduler.lock')
+    LEADER_ELECTION_INTERVAL = 30  # Как часто резервные процессы пытаются стать лидером
+    
+    # WebSub (PubSubHubbub): подписка на хабы источников
+    WEBSUB_ENABLED = True
+    WEBSUB_LEASE_SECONDS = 10 * 24 * 3600  # Запрашиваемый срок подписки
+    WEBSUB_RENEW_BEFORE = 24 * 3600  # Продлевать подписку за сутки до истечения
+    WEBSUB_VERIFY_TIMEOUT = 3600  # Сколько ждать подтверждения подписки от хаба
+    WEBSUB_FALLBACK_INTERVAL = 24 * 3600  # Опрос лент с push-подпиской раз в сутки
+    # Хаб, который объявляется в наших лентах и уведомляется о новых элементах
+    WEBSUB_HUB_URL = os.environ.get('WEBSUB_HUB_URL')
+    
+    # Загрузка страниц и лент
+    # Один User-Agent для запросов, браузера и правил robots.txt
+    FETCH_USER_AGENT = os.environ.get('FETCH_USER_AGENT') or 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    FETCH_MAX_BYTES = int(os.environ.get('FETCH_MAX_BYTES', 10 * 1024 * 1024))  # Лимит размера ответа по умолчанию
+    FETCH_DEADLINE = 60  # Общий лимит времени загрузки одного ответа, секунд
+    
+    # Вежливость по отношению к хостам источников
+    HOST_RATE_LIMIT = 1.0  # Запросов в секунду к одному хосту
+    HOST_BURST = 3  # Допустимая пачка запросов к хосту
+    HOST_RATE_LIMITS = {}  # Переопределения по хостам: {'example.com': (rate, burst)}
+    HOST_MAX_WAIT = 60  # Максимальное ожидание в очереди к хосту, секунд
+    RETRY_AFTER_MAX = 3600  # Верхняя граница паузы по Retry-After, секунд
+    ROBOTS_TXT_ENABLED = True
+    ROBOTS_TXT_TTL = 3600  # Время жизни кеша robots.txt, секунд
+    ROBOTS_TXT_MAX_BYTES = 512 * 1024  # Лимит размера robots.txt
+    
+    # Пауза перед повтором после ошибок и автоматическая приостановка лент
+    FAILURE_BACKOFF_BASE = 900  # Пауза после первой ошибки, секунд
+    FAILURE_BACKOFF_MAX = 24 * 3600  # Максимальная пауза, секунд
+    FAILURE_SUSPEND_THRESHOLD = 10  # Ошибок подряд до приостановки ленты
+    
+    # Поиск RSS/Atom и новостных sitemap для источников со скрапингом
+    FEED_DISCOVERY_ENABLED = True
+    FEED_DISCOVERY_INTERVAL = 7 * 24 * 3600  # Как часто повторять поиск для источника
+    FEED_DISCOVERY_JOB_INTERVAL = 3600  # Как часто запускать задачу поиска, секунд
+    FEED_DISCOVERY_BATCH = 5  # Сколько источников проверять за один запуск задачи
+    # Переводить источник на найденную ленту автоматически, а не только предлагать
+    FEED_DISCOVERY_AUTO_SWITCH = os.environ.get('FEED_DISCOVERY_AUTO_SWITCH', '').lower() in ('1', 'true', 'yes')
+    
+    # Загрузка следующих страниц списка для лент на основе парсинга
+    SCRAPE_MAX_PAGES = 5  # Глубина обхода по умолчанию, страниц
+    SCRAPE_PAGE_CONCURRENCY = 3  # Сколько страниц загружать одновременно
+    
+    # История обновлений лент (время по этапам, объем, ошибки) для отчета о медленных лентах
+    UPDATE_HISTORY_DAYS = int(os.environ.get('UPDATE_HISTORY_DAYS', 14))  # Сколько дней хранить записи
+    
+    # API настройки селекторов: загрузка и рендеринг страниц в общем фоновом пуле
+    SELECTOR_API_WORKERS = 4  # Сколько страниц загружать одновременно (каждый рендеринг - процесс Chrome)
+    SELECTOR_API_MAX_PENDING = 16  # Сколько разных запросов выполнять и держать в очереди, остальным - 503
+    SELECTOR_API_RETRY_AFTER = 5  # Retry-After ответа 503, секунд
+    SELECTOR_API_POLL = 0.5  # Как часто проверять, что клиент еще ждет ответа, секунд
+    
+    # Загрузка полного текста статей для лент с включенным обогащением
+    ENRICH_WORKERS = 4  # Размер пула загрузки статей
+    ENRICH_BATCH_SIZE = 20  # Сколько статей забирать из очереди за раз
+    ENRICH_MAX_ATTEMPTS = 4  # Попыток до отметки 'failed'
+    ENRICH_RETRY_BASE = 300  # Пауза после первой ошибки, секунд (дальше удваивается)
+    ENRICH_STALE_AFTER = 600  # Когда считать зависшей статью в работе, секунд
+    ENRICH_INTERVAL = 60  # Как часто лидер проверяет очередь (повторы), секунд
+    
+    # Импорт источников из OPML
+    OPML_IMPORT_WORKERS = 16  # Сколько лент проверять одновременно (лимиты по хостам сохраняются)
+    OPML_IMPORT_BATCH = 200  # Сколько лент создавать одной транзакцией
+    OPML_MAX_BYTES = 5 * 1024 * 1024  # Лимит размера загружаемого файла
+    
     # Количество элементов на страницу
     ITEMS_PER_PAGE = 20
+    DASHBOARD_PER_PAGE = 50  # Лент на страницу панели управления
+    LISTING_DESCRIPTION_CHARS = 2000  # Сколько символов описания читать из БД для списков элементов
+    LISTING_EXCERPT_LENGTH = 300  # Длина текста описания в списках элементов
+    FEED_YIELD_PER = 100  # По сколько строк читать элементы при сборке ленты
+    
+    # Длинные описания элементов хранятся сжатыми в отдельной таблице (ItemBody)
+    ITEM_BODY_INLINE_MAX = 2048  # Описания длиннее (в символах) выносятся из строки элемента
+    ITEM_BODY_EXCERPT_LENGTH = 500  # Длина текста без разметки, остающегося в строке элемента
+    ITEM_BODY_CODEC = os.environ.get('ITEM_BODY_CODEC', 'zlib')  # 'zstd' - при установленном zstandard
     
     # Директория для хранения временных файлов
     TEMP_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'temp')
     
+    # Хранилище последних загруженных тел ответов (сжатые файлы, адресуемые хешем)
+    PAYLOAD_STORE_ENABLED = True
+    PAYLOAD_STORE_DIR = os.path.join(TEMP_FOLDER, 'payloads')
+    PAYLOAD_STORE_MAX_BYTES = int(os.environ.get('PAYLOAD_STORE_MAX_BYTES', 200 * 1024 * 1024))
+    
+    # Локальный кеш миниатюр изображений элементов: ленты и страницы ссылаются
+    # на миниатюры в приложении, а не на изображения на сайтах источников
+    THUMBNAIL_CACHE_ENABLED = os.environ.get('THUMBNAIL_CACHE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    THUMBNAIL_CACHE_DIR = os.path.join(TEMP_FOLDER, 'thumbnails')
+    THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+    THUMBNAIL_SIZE = 400  # Максимальная ширина и высота миниатюры, точек (нужен Pillow)
+    THUMBNAIL_MAX_SOURCE_BYTES = 5 * 1024 * 1024  # Лимит размера исходного изображения
+    THUMBNAIL_MAX_AGE = 30 * 24 * 3600  # Срок кеширования миниатюр у клиентов, секунд
+    
     # URL-префикс для создаваемых RSS-лент
     BASE_URL = os.environ.get('BASE_URL') or 'http://localhost:5000'
     
@@ -45,6 +155,7 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
 
 
 config = {
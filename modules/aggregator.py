@@ -1,155 +1,645 @@
-import feedparser
-from datetime import datetime
+from datetime import datetime, timedelta
+import random
+import time
 import pytz
 from dateutil import parser as date_parser
 import logging
-from .storage import db, Feed, FeedItem, AggregatedFeed
+from urllib.parse import urljoin
+from sqlalchemy import func, or_, and_, not_
+from sqlalchemy.orm import aliased
+from .storage import db, Feed, FeedItem, FeedTag, ItemBody, ItemContent, AggregatedFeed, aggregated_feed_association
 from flask import current_app
+from .item_body import set_item_description
+from .canonical import url_guid
 
 logger = logging.getLogger(__name__)
 
-def fetch_rss_feed(feed_url):
+# Пространства имен sitemap и расширения Google News
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+NEWS_NS = 'http://www.google.com/schemas/sitemap-news/0.9'
+IMAGE_NS = 'http://www.google.com/schemas/sitemap-image/1.1'
+
+def fetch_rss_feed(feed_url, max_bytes=None, parsed_hash=None):
     """
     Парсит RSS-ленту по указанному URL
     
     Args:
         feed_url (str): URL RSS-ленты
+        max_bytes (int, optional): Лимит размера ответа
+        parsed_hash (str, optional): Хеш тела, которое уже разобрано и сохранено
+        
+    Returns:
+        dict: Словарь с заголовком, описанием, элементами ленты и хешем
+            тела ответа; если хеш совпал с parsed_hash - только
+            {'unchanged': True, 'content_hash': ...}
+    """
+    return _fetch_and_parse(
+        feed_url,
+        lambda response: parse_rss_content(response.content, response.url, response.headers.get('Content-Type')),
+        max_bytes,
+        parsed_hash
+    )
+
+
+def fetch_sitemap_feed(sitemap_url, max_bytes=None, parsed_hash=None):
+    """
+    Загружает новостной sitemap и преобразует его в данные ленты
+    
+    Args:
+        sitemap_url (str): URL новостного sitemap
+        max_bytes (int, optional): Лимит размера ответа
+        parsed_hash (str, optional): Хеш тела, которое уже разобрано и сохранено
+        
+    Returns:
+        dict: Данные ленты в том же виде, что и fetch_rss_feed
+    """
+    return _fetch_and_parse(
+        sitemap_url,
+        lambda response: parse_news_sitemap(response.content, response.url),
+        max_bytes,
+        parsed_hash
+    )
+
+
+def _fetch_and_parse(url, parse, max_bytes=None, parsed_hash=None):
+    """
+    Загружает документ ленты и разбирает его, если он изменился
+    
+    Args:
+        url (str): URL документа
+        parse (callable): Функция разбора ответа в данные ленты
+        max_bytes (int, optional): Лимит размера ответа
+        parsed_hash (str, optional): Хеш тела, которое уже разобрано и сохранено
+        
+    Returns:
+        dict: Данные ленты или None при ошибке
+    """
+    from .fetcher import fetch_url, record_error
+    from .payload_store import store_payload
+
+    try:
+        # Загружаем через регулятор запросов (лимиты по хосту, robots.txt),
+        # а разбираем уже полученное содержимое
+        response = fetch_url(url, timeout=15, max_bytes=max_bytes)
+        
+        # Многие источники не отдают ETag и Last-Modified, поэтому неизменность
+        # ленты определяем по хешу тела ответа
+        digest = store_payload(response.content)
+        if parsed_hash and digest == parsed_hash:
+            return {'unchanged': True, 'content_hash': digest}
+        
+        feed_data = parse(response)
+        if feed_data is not None:
+            feed_data['content_hash'] = digest
+        return feed_data
+    except Exception as e:
+        record_error(e)
+        logger.error(f"Error fetching feed {url}: {str(e)}")
+        return None
+
+
+def parse_news_sitemap(content, source=''):
+    """
+    Разбирает новостной sitemap (Google News Sitemap)
+    
+    Args:
+        content (bytes): Тело документа
+        source (str): URL sitemap
+        
+    Returns:
+        dict: Данные ленты или None, если это не новостной sitemap
+    """
+    from xml.etree import ElementTree
+    from .fetcher import record_error
+
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError as e:
+        record_error(e)
+        logger.error(f"Error parsing sitemap {source}: {str(e)}")
+        return None
+    
+    entries = []
+    for url in root.iter(f'{{{SITEMAP_NS}}}url'):
+        news = url.find(f'{{{NEWS_NS}}}news')
+        link = (url.findtext(f'{{{SITEMAP_NS}}}loc') or '').strip()
+        if news is None or not link:
+            continue
+        
+        image = (url.findtext(f'{{{IMAGE_NS}}}image/{{{IMAGE_NS}}}loc') or '').strip()
+        
+        title = (news.findtext(f'{{{NEWS_NS}}}title') or '').strip()
+        try:
+            published = date_parser.parse(news.findtext(f'{{{NEWS_NS}}}publication_date'))
+            if published.tzinfo is not None:
+                published = published.astimezone(pytz.UTC).replace(tzinfo=None)
+        except (TypeError, ValueError, OverflowError):
+            published = datetime.utcnow()
+        
+        entries.append({
+            'title': title or link,
+            'link': link,
+            'description': '',
+            'guid': link,
+            'published': published,
+            'image': image or None
+        })
+    
+    if not entries:
+        return None
+    
+    return {
+        'title': source,
+        'description': f'News sitemap {source}',
+        'entries': entries
+    }
+
+
+def parse_rss_content(content, source='', content_type=None):
+    """
+    Парсит уже загруженное содержимое RSS/Atom-ленты
+    
+    Args:
+        content (bytes): Тело документа ленты
+        source (str): URL ленты, относительно которого разрешаются ссылки
+        content_type (str, optional): Значение заголовка Content-Type
         
     Returns:
         dict: Словарь с заголовком, описанием и элементами ленты
     """
+    import feedparser
+
     try:
-        parsed_feed = feedparser.parse(feed_url)
+        # Адрес источника задаем как базовый, чтобы относительные ссылки и GUID
+        # разрешались так же, как при загрузке ленты по URL
+        parsed_feed = feedparser.parse(content, response_headers={
+            'content-location': source,
+            'content-type': content_type or 'application/xml'
+        })
+        return _build_feed_data(parsed_feed, source)
+    except Exception as e:
+        logger.error(f"Error parsing feed content from {source}: {str(e)}")
+        return None
+
+
+def _entry_image(entry, feed_url):
+    """
+    Находит изображение элемента RSS/Atom
+    
+    Проверяются media:thumbnail, media:content с изображением и вложения
+    (enclosure) с типом image/*.
+    
+    Args:
+        entry (FeedParserDict): Элемент ленты
+        feed_url (str): URL ленты для относительных ссылок
         
-        # Проверка на наличие ошибок
-        if hasattr(parsed_feed, 'bozo_exception'):
-            logger.error(f"Error parsing feed {feed_url}: {parsed_feed.bozo_exception}")
-            return None
-            
-        feed_data = {
-            'title': parsed_feed.feed.get('title', 'Untitled Feed'),
-            'description': parsed_feed.feed.get('description', ''),
-            'entries': []
-        }
+    Returns:
+        str: URL изображения или None
+    """
+    candidates = [thumbnail.get('url') for thumbnail in entry.get('media_thumbnail') or []]
+    candidates += [
+        media.get('url') for media in entry.get('media_content') or []
+        if media.get('medium') == 'image' or (media.get('type') or '').startswith('image/')
+    ]
+    candidates += [
+        link.get('href') for link in entry.get('links') or []
+        if link.get('rel') == 'enclosure' and (link.get('type') or '').startswith('image/')
+    ]
+    for url in candidates:
+        if url:
+            return urljoin(feed_url, url)
+    return None
+
+
+def _build_feed_data(parsed_feed, feed_url):
+    """
+    Преобразует результат feedparser в словарь данных ленты
+    
+    Args:
+        parsed_feed (FeedParserDict): Результат feedparser.parse
+        feed_url (str): URL ленты для сообщений в журнале
         
-        for entry in parsed_feed.entries:
-            # Обработка даты публикации
-            published = None
-            if hasattr(entry, 'published'):
-                try:
-                    published = date_parser.parse(entry.published)
-                except:
-                    pass
-            elif hasattr(entry, 'updated'):
-                try:
-                    published = date_parser.parse(entry.updated)
-                except:
-                    pass
-                    
-            # Если дата не найдена, используем текущую
-            if not published:
-                published = datetime.utcnow()
-                
-            # Если дата без временной зоны, предполагаем UTC
-            if published.tzinfo is None:
-                published = pytz.UTC.localize(published)
+    Returns:
+        dict: Словарь с заголовком, описанием, элементами ленты,
+            а также адресами хаба WebSub и самой ленты, если они объявлены
+    """
+    # Проверка на наличие ошибок
+    if hasattr(parsed_feed, 'bozo_exception'):
+        from .fetcher import record_error
+        record_error(parsed_feed.bozo_exception)
+        logger.error(f"Error parsing feed {feed_url}: {parsed_feed.bozo_exception}")
+        return None
+        
+    feed_data = {
+        'title': parsed_feed.feed.get('title', 'Untitled Feed'),
+        'description': parsed_feed.feed.get('description', ''),
+        'hub': None,
+        'self_url': None,
+        'entries': []
+    }
+    
+    # Ссылки <link rel="hub"> и <link rel="self"> для подписки WebSub
+    for link in parsed_feed.feed.get('links', []):
+        if link.get('rel') == 'hub' and not feed_data['hub']:
+            feed_data['hub'] = link.get('href')
+        elif link.get('rel') == 'self' and not feed_data['self_url']:
+            feed_data['self_url'] = link.get('href')
+    
+    for entry in parsed_feed.entries:
+        # Обработка даты публикации
+        published = None
+        if hasattr(entry, 'published'):
+            try:
+                published = date_parser.parse(entry.published)
+            except:
+                pass
+        elif hasattr(entry, 'updated'):
+            try:
+                published = date_parser.parse(entry.updated)
+            except:
+                pass
                 
-            # Преобразуем в UTC для хранения
-            published = published.astimezone(pytz.UTC).replace(tzinfo=None)
-            
-            # Подготовка данных элемента
-            item = {
-                'title': entry.get('title', 'Untitled'),
-                'link': entry.get('link', ''),
-                'description': entry.get('description', entry.get('summary', '')),
-                'guid': entry.get('id', entry.get('link', '')),
-                'published': published
-            }
+        # Если дата не найдена, используем текущую
+        if not published:
+            published = datetime.utcnow()
             
-            feed_data['entries'].append(item)
+        # Если дата без временной зоны, предполагаем UTC
+        if published.tzinfo is None:
+            published = pytz.UTC.localize(published)
             
-        return feed_data
-    except Exception as e:
-        logger.error(f"Error fetching feed {feed_url}: {str(e)}")
-        return None
+        # Преобразуем в UTC для хранения
+        published = published.astimezone(pytz.UTC).replace(tzinfo=None)
+        
+        # Подготовка данных элемента
+        item = {
+            'title': entry.get('title', 'Untitled'),
+            'link': entry.get('link', ''),
+            'description': entry.get('description', entry.get('summary', '')),
+            'guid': entry.get('id', entry.get('link', '')),
+            'published': published,
+            'image': _entry_image(entry, feed_url)
+        }
+        
+        feed_data['entries'].append(item)
+        
+    return feed_data
 
 
-def update_feed(feed):
+def update_feed(feed, from_store=False, feed_data=None):
     """
     Обновляет элементы для конкретной ленты
     
     Args:
         feed (Feed): Объект ленты из БД
+        from_store (bool): Для лент на основе скрапинга - применить селекторы
+            к последней сохраненной странице вместо повторной загрузки
+        feed_data (dict, optional): Уже загруженные данные ленты (например,
+            при проверке во время импорта) - повторная загрузка не нужна
     
     Returns:
         bool: Успешно ли обновление
     """
+    from .fetcher import fetch_counters
+    from .update_history import record_update_run
+    
+    # Время загрузки и прочитанные байты накапливаются в счетчиках потока;
+    # разбор - все остальное время до получения данных ленты, запись - после
+    run = {}
+    feed_id = feed.id
+    started_at = datetime.utcnow()
+    started = time.monotonic()
+    bytes_before, fetch_before = fetch_counters()
+    
+    success = _update_feed(feed, from_store, feed_data, run)
+    
+    finished = time.monotonic()
+    bytes_after, fetch_after = fetch_counters()
+    fetched = run.get('fetched', finished)
+    fetch_ms = (fetch_after - fetch_before) * 1000
+    error_class, error = run.get('error', (None, None))
+    record_update_run(
+        feed_id, started_at,
+        fetch_ms=fetch_ms,
+        parse_ms=(fetched - started) * 1000 - fetch_ms,
+        write_ms=(finished - fetched) * 1000,
+        bytes_read=bytes_after - bytes_before,
+        new_items=run.get('new_items', 0),
+        error_class=error_class,
+        error=error
+    )
+    return success
+
+
+def _update_feed(feed, from_store, feed_data, run):
+    """Обновление ленты; этапы и результат для истории записываются в run"""
+    from .fetcher import pop_last_error
+    from .metrics import metrics
+    
+    # Сбрасываем ошибку, оставшуюся в потоке от предыдущей ленты
+    pop_last_error()
+    
     try:
+        # Переход на найденную поиском ленту - только между обновлениями
+        if feed_data is None and not from_store:
+            from .discovery import apply_pending_switch
+            apply_pending_switch(feed)
+        
         print(f"Обновление ленты: {feed.name} (тип: {feed.feed_type})")
-        if feed.feed_type == 'rss':
-            feed_data = fetch_rss_feed(feed.url)
+        if feed_data is not None:
+            print(f"Используются уже загруженные данные ленты: {feed.name}")
+        elif feed.feed_type == 'rss':
+            feed_data = fetch_rss_feed(feed.url, max_bytes=feed.max_fetch_bytes,
+                                       parsed_hash=feed.parsed_content_hash)
             print(f"Данные RSS получены: {feed_data is not None}")
+        elif feed.feed_type == 'sitemap':
+            feed_data = fetch_sitemap_feed(feed.url, max_bytes=feed.max_fetch_bytes,
+                                           parsed_hash=feed.parsed_content_hash)
         else:
             # Для лент на основе скрапинга используем другой модуль
-            from .scraper import scrape_feed
+            from .scraper import scrape_feed, scrape_stored_payload
             print(f"Запуск скрапинга для ленты: {feed.name}")
-            feed_data = scrape_feed(feed)
+            feed_data = scrape_stored_payload(feed) if from_store else None
+            if feed_data is None:
+                feed_data = scrape_feed(feed)
             print(f"Результат скрапинга: {feed_data is not None}")
-            
+        
+        run['fetched'] = time.monotonic()
         if not feed_data:
             print(f"Нет данных для ленты: {feed.name}")
+            error_class, message = pop_last_error() or ('NoData', 'Не удалось получить элементы ленты')
+            run['error'] = (error_class, message)
+            # Переполненная очередь к хосту - наше ограничение, а не ошибка источника
+            if error_class != 'HostSaturated':
+                register_failure(feed, error_class, message)
             return False
-            
-        print(f"Количество элементов: {len(feed_data['entries'])}")
-        
-        # Обновление элементов ленты
-        new_count = 0
-        for entry in feed_data['entries']:
-            # Проверяем существование элемента по GUID
-            existing_item = FeedItem.query.filter_by(
-                feed_id=feed.id, 
-                guid=entry['guid']
-            ).first()
-            
-            if not existing_item:
-                # Если published - строка, преобразуем ее в datetime
-                if isinstance(entry['published'], str):
-                    try:
-                        # Используем datetime, который уже импортирован в начале файла
-                        published = datetime.strptime(entry['published'], '%Y-%m-%d %H:%M:%S')
-                    except:
-                        published = datetime.utcnow()
-                else:
-                    published = entry['published']
-
-                # Создаем новый элемент
-                new_item = FeedItem(
-                    feed_id=feed.id,
-                    title=entry['title'],
-                    link=entry['link'],
-                    description=entry['description'],
-                    guid=entry['guid'],
-                    published=published
-                )
-                db.session.add(new_item)
-                new_count += 1
-                
-        # Обновляем время последнего обновления ленты
-        feed.last_updated = datetime.utcnow()
-        db.session.commit()
         
-        print(f"Лента {feed.name} обновлена: {new_count} новых элементов")
+        if feed_data.get('unchanged'):
+            # Тело ответа то же, что и при прошлом разборе - разбирать и
+            # сверять элементы с БД не нужно
+            print(f"Содержимое ленты {feed.name} не изменилось")
+            metrics.increment('update.unchanged')
+            feed.last_updated = datetime.utcnow()
+            db.session.commit()
+            register_success(feed)
+            return True
+        
+        if feed_data.get('content_hash'):
+            feed.content_hash = feed.parsed_content_hash = feed_data['content_hash']
+        run['new_items'] = store_feed_entries(feed, feed_data)
+        
+        # Если источник объявляет хаб WebSub, подписываемся на push-обновления
+        if feed.feed_type == 'rss':
+            from .websub import handle_discovered_hub
+            handle_discovered_hub(feed, feed_data)
+        
+        register_success(feed)
         return True
     except Exception as e:
         db.session.rollback()
         print(f"Ошибка при обновлении ленты {feed.name}: {str(e)}")
         logger.error(f"Error updating feed {feed.name}: {str(e)}")
+        run['error'] = (type(e).__name__, str(e))
+        register_failure(feed, type(e).__name__, str(e))
         return False
 
+
+def failure_backoff(failures):
+    """
+    Вычисляет паузу перед следующей попыткой после серии ошибок
+    
+    Пауза растет экспоненциально от FAILURE_BACKOFF_BASE до FAILURE_BACKOFF_MAX;
+    половина паузы случайна, чтобы повторы разных лент не совпадали.
+    
+    Args:
+        failures (int): Количество ошибок подряд
+        
+    Returns:
+        timedelta: Пауза перед повтором
+    """
+    config = current_app.config
+    delay = min(config['FAILURE_BACKOFF_BASE'] * 2 ** max(failures - 1, 0), config['FAILURE_BACKOFF_MAX'])
+    return timedelta(seconds=delay / 2 + random.uniform(0, delay / 2))
+
+
+def register_failure(feed, error_class, message):
+    """
+    Учитывает неудачное обновление ленты
+    
+    Планирует следующую попытку с экспоненциальной паузой, а после
+    FAILURE_SUSPEND_THRESHOLD ошибок подряд приостанавливает ленту.
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+        error_class (str): Класс ошибки
+        message (str): Текст ошибки
+    """
+    try:
+        now = datetime.utcnow()
+        feed.consecutive_failures = (feed.consecutive_failures or 0) + 1
+        feed.last_error_class = error_class[:100]
+        feed.last_error = (message or '')[:500]
+        feed.last_error_at = now
+        feed.next_retry_at = now + failure_backoff(feed.consecutive_failures)
+        
+        if feed.consecutive_failures >= current_app.config['FAILURE_SUSPEND_THRESHOLD'] and not feed.suspended:
+            feed.suspended = True
+            print(f"Лента {feed.name} приостановлена после {feed.consecutive_failures} ошибок подряд")
+            logger.warning(f"Feed {feed.name} suspended after {feed.consecutive_failures} consecutive failures")
+        
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving failure state for feed {feed.name}: {str(e)}")
+
+
+def register_success(feed):
+    """
+    Сбрасывает счетчик ошибок ленты после успешного обновления
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+    """
+    if not feed.consecutive_failures and not feed.suspended and not feed.next_retry_at:
+        return
+    
+    feed.consecutive_failures = 0
+    feed.next_retry_at = None
+    feed.suspended = False
+    db.session.commit()
+
+
+def resume_feed(feed):
+    """
+    Возобновляет приостановленную ленту
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+    """
+    feed.suspended = False
+    feed.consecutive_failures = 0
+    feed.next_retry_at = None
+    db.session.commit()
+
+
+def store_feed_entries(feed, feed_data):
+    """
+    Сохраняет новые элементы ленты в БД
+    
+    Общий путь для опроса источника (update_feed) и для содержимого,
+    доставленного хабом WebSub.
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+        feed_data (dict): Данные ленты с ключом 'entries'
+        
+    Returns:
+        int: Количество новых элементов
+    """
+    print(f"Количество элементов: {len(feed_data['entries'])}")
+    
+    # Уже сохраненные GUID выбираем одним запросом (частями, чтобы не
+    # превысить лимит параметров SQL), а не запросом на каждый элемент
+    guids = list({entry['guid'] for entry in feed_data['entries']})
+    known_guids = set()
+    for start in range(0, len(guids), 500):
+        known_guids.update(guid for (guid,) in db.session.query(FeedItem.guid).filter(
+            FeedItem.feed_id == feed.id,
+            FeedItem.guid.in_(guids[start:start + 500])
+        ))
+    
+    # GUID элементов парсинга вычисляются по канонической ссылке (url_guid).
+    # Элементы, сохраненные с GUID другого вида - прежними версиями или до
+    # смены типа источника (discovery.switch_to_discovered), - узнаем по
+    # тому же ключу от их сохраненной ссылки (она могла отличаться слешем,
+    # порядком параметров или метками отслеживания) и переводим на новый
+    # GUID. Ключ хранится в индексированной колонке link_key, поэтому
+    # читаются только элементы с ключами неизвестных GUID.
+    discovery = feed.get_discovery()
+    stored_links = {}
+    if feed.feed_type == 'scrape' or discovery.get('remap_items'):
+        link_keys = list({url_guid(entry['link']) for entry in feed_data['entries']
+                          if entry['guid'] not in known_guids and entry['link'] != feed.url})
+        if link_keys:
+            _fill_link_keys(feed)
+        for start in range(0, len(link_keys), 500):
+            for item_id, link_key in db.session.query(FeedItem.id, FeedItem.link_key) \
+                                               .filter(FeedItem.feed_id == feed.id,
+                                                       FeedItem.link_key.in_(link_keys[start:start + 500]),
+                                                       FeedItem.link != feed.url) \
+                                               .order_by(FeedItem.id):
+                stored_links.setdefault(link_key, item_id)
+    
+    # Обновление элементов ленты
+    new_count = 0
+    new_items = []
+    remapped = 0
+    for entry in feed_data['entries']:
+        # Проверяем существование элемента по GUID (в том числе среди только что добавленных)
+        if entry['guid'] not in known_guids:
+            known_guids.add(entry['guid'])
+            item_id = stored_links.pop(url_guid(entry['link']), None) if entry['link'] != feed.url else None
+            if item_id is not None:
+                FeedItem.query.filter(FeedItem.id == item_id) \
+                              .update({'guid': entry['guid']}, synchronize_session=False)
+                remapped += 1
+                continue
+            # Если published - строка, преобразуем ее в datetime
+            if isinstance(entry['published'], str):
+                try:
+                    # Используем datetime, который уже импортирован в начале файла
+                    published = datetime.strptime(entry['published'], '%Y-%m-%d %H:%M:%S')
+                except:
+                    published = datetime.utcnow()
+            else:
+                published = entry['published']
+            
+            # Слишком длинные адреса изображений (data: URI и т.п.) не сохраняем
+            image = entry.get('image') or None
+            if image and len(image) > 1000:
+                image = None
+
+            # Создаем новый элемент; длинное описание уходит сжатым в ItemBody
+            new_item = FeedItem(
+                feed_id=feed.id,
+                title=entry['title'],
+                link=entry['link'],
+                link_key=url_guid(entry['link']),
+                guid=entry['guid'],
+                published=published,
+                image=image
+            )
+            set_item_description(new_item, entry['description'])
+            db.session.add(new_item)
+            new_items.append(new_item)
+            new_count += 1
+            
+    if discovery.pop('remap_items', None):
+        feed.set_discovery(discovery)
+    
+    # GUID входит в готовые ленты, поэтому их кеш должен обновиться
+    if remapped:
+        feed.items_version = (feed.items_version or 0) + 1
+    
+    # Обновляем время последнего обновления ленты
+    feed.last_updated = datetime.utcnow()
+    db.session.commit()
+    
+    if remapped:
+        print(f"Лента {feed.name}: {remapped} элементов переведено на новые GUID")
+    print(f"Лента {feed.name} обновлена: {new_count} новых элементов")
+    
+    # Сообщаем нашему хабу, что в лентах появились новые элементы (темы
+    # ищутся, только если хаб настроен)
+    if new_count and current_app.config.get('WEBSUB_HUB_URL'):
+        from .websub import publish, topics_for_feed
+        publish(topics_for_feed(feed))
+    
+    # Полный текст новых статей загружается в фоне, обновление его не ждет
+    if new_items and feed.enrich_content:
+        from .enrichment import queue_items, start_background_processing
+        if queue_items(new_items):
+            start_background_processing(current_app._get_current_object())
+    
+    return new_count
+
+
+def _fill_link_keys(feed):
+    """
+    Заполняет link_key у элементов ленты, сохраненных до появления колонки
+    
+    Выполняется один раз для ленты: у новых элементов ключ записывается при
+    сохранении.
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+    """
+    rows = db.session.query(FeedItem.id, FeedItem.link) \
+                     .filter(FeedItem.feed_id == feed.id, FeedItem.link_key.is_(None)).all()
+    if rows:
+        db.session.bulk_update_mappings(FeedItem, [
+            {'id': item_id, 'link_key': url_guid(link)} for item_id, link in rows
+        ])
+
+
 def update_all_feeds():
     """Обновляет все активные ленты"""
-    feeds = Feed.query.filter_by(active=True).all()
+    from .websub import needs_subscription, subscribe
+
+    # Ленты с подпиской WebSub опрашиваются только как подстраховка
+    fallback_since = datetime.utcnow() - timedelta(seconds=current_app.config['WEBSUB_FALLBACK_INTERVAL'])
+    
+    # Пропускаем приостановленные ленты и ленты, для которых еще не наступило время повтора
+    now = datetime.utcnow()
+    feeds = Feed.query.filter(
+        Feed.active.is_(True),
+        Feed.suspended.isnot(True),
+        or_(Feed.next_retry_at.is_(None), Feed.next_retry_at <= now)
+    ).all()
     for feed in feeds:
+        if feed.push_enabled and feed.last_updated and feed.last_updated > fallback_since:
+            if needs_subscription(feed):
+                subscribe(feed)
+            continue
         update_feed(feed)
         
     # Обновляем время последнего обновления для агрегированных лент
@@ -157,6 +647,10 @@ def update_all_feeds():
     for agg_feed in aggregated_feeds:
         agg_feed.last_updated = datetime.utcnow()
     db.session.commit()
+    
+    # История обновлений хранится за скользящее окно
+    from .update_history import prune_update_runs
+    prune_update_runs()
 
 
 def get_aggregated_feed_items(aggregated_feed, limit=None, page=None, per_page=None):
@@ -172,13 +666,8 @@ def get_aggregated_feed_items(aggregated_feed, limit=None, page=None, per_page=N
     Returns:
         list: Список объектов FeedItem
     """
-    feed_ids = [feed.id for feed in aggregated_feed.feeds.filter_by(active=True).all()]
-    
-    if not feed_ids:
-        return []
-        
-    # Запрос для получения элементов из всех лент, отсортированных по дате
-    query = FeedItem.query.filter(FeedItem.feed_id.in_(feed_ids)).order_by(FeedItem.published.desc())
+    # Источники и правила проверяются в том же запросе, список ID лент не загружается
+    query = _aggregated_items_query(aggregated_feed).order_by(FeedItem.published.desc())
     
     # Пагинация или лимит
     if page and per_page:
@@ -188,3 +677,467 @@ def get_aggregated_feed_items(aggregated_feed, limit=None, page=None, per_page=N
         return query.limit(limit).all()
     else:
         return query.all()
+
+
+def _keyword_condition(keyword):
+    """
+    Условие: ключевое слово встречается в заголовке или описании элемента
+    
+    У длинного описания в FeedItem.description только начало, поэтому
+    проверяется и полный текст из ItemBody (через псевдоним: запросы
+    элементов сами присоединяют ItemBody для сборки ленты).
+    """
+    pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    body = aliased(ItemBody)
+    in_body = db.session.query(body.item_id).filter(
+        body.item_id == FeedItem.id,
+        body.text.ilike(pattern, escape='\\')
+    ).exists()
+    return or_(
+        FeedItem.title.ilike(pattern, escape='\\'),
+        func.coalesce(FeedItem.description, '').ilike(pattern, escape='\\'),
+        in_body
+    )
+
+
+def aggregated_sources_condition(aggregated_feed):
+    """
+    Условие на Feed: лента входит в агрегированную ленту
+    
+    Лента входит, если выбрана вручную или подходит под правила по типу
+    и меткам (и отмечена для включения в общие ленты).
+    
+    Args:
+        aggregated_feed (AggregatedFeed): Агрегированная лента
+        
+    Returns:
+        ClauseElement: Условие для запроса с Feed
+    """
+    association = aggregated_feed_association.c
+    selected = db.exists().where(and_(
+        association.aggregated_feed_id == aggregated_feed.id,
+        association.feed_id == Feed.id
+    ))
+    
+    rules = aggregated_feed.get_rules()
+    conditions = []
+    if rules.get('feed_types'):
+        conditions.append(Feed.feed_type.in_(rules['feed_types']))
+    if rules.get('tags'):
+        conditions.append(db.exists().where(and_(FeedTag.feed_id == Feed.id, FeedTag.tag.in_(rules['tags']))))
+    if not conditions:
+        return selected
+    return or_(selected, and_(Feed.included_in_aggregate.is_(True), *conditions))
+
+
+def aggregated_feed_conditions(aggregated_feed):
+    """
+    Компилирует правила агрегированной ленты в условия SQL
+    
+    Правила (AggregatedFeed.rules):
+        feed_types - типы лент-источников ('rss', 'scrape', 'sitemap')
+        tags - метки лент-источников (любая из них)
+        include - элемент содержит хотя бы одно из слов
+        exclude - элемент не содержит ни одного из слов
+        max_age_days - элемент опубликован не раньше, чем столько дней назад
+    
+    Слова ищутся в заголовке и описании без учета регистра (в SQLite - только
+    для латиницы).
+    
+    Args:
+        aggregated_feed (AggregatedFeed): Агрегированная лента
+        
+    Returns:
+        list: Условия для запроса FeedItem, соединенного с Feed
+    """
+    rules = aggregated_feed.get_rules()
+    conditions = [Feed.active.is_(True), aggregated_sources_condition(aggregated_feed)]
+    if rules.get('include'):
+        conditions.append(or_(*[_keyword_condition(keyword) for keyword in rules['include']]))
+    for keyword in rules.get('exclude', []):
+        conditions.append(not_(_keyword_condition(keyword)))
+    if rules.get('max_age_days'):
+        conditions.append(FeedItem.published >= datetime.utcnow() - timedelta(days=rules['max_age_days']))
+    return conditions
+
+
+def _aggregated_items_query(aggregated_feed):
+    """Запрос элементов агрегированной ленты: источники и правила - в одном запросе"""
+    return FeedItem.query \
+        .join(Feed, Feed.id == FeedItem.feed_id) \
+        .filter(*aggregated_feed_conditions(aggregated_feed))
+
+
+def aggregates_for_feed(feed):
+    """
+    Находит активные агрегированные ленты, в которые входит источник
+    
+    Условия всех агрегированных лент проверяются одним запросом: по одной
+    колонке-флагу на ленту в строке источника.
+    
+    Args:
+        feed (Feed): Лента-источник
+        
+    Returns:
+        list: Объекты AggregatedFeed
+    """
+    aggregates = AggregatedFeed.query.filter(AggregatedFeed.active.is_(True)).order_by(AggregatedFeed.id).all()
+    if not aggregates:
+        return []
+    
+    flags = db.session.query(*[
+        aggregated_sources_condition(aggregated_feed).label(f'aggregate_{aggregated_feed.id}')
+        for aggregated_feed in aggregates
+    ]).filter(Feed.id == feed.id).first()
+    if flags is None:
+        return []
+    return [aggregated_feed for aggregated_feed, matches in zip(aggregates, flags) if matches]
+
+
+def get_feed_items_since(since_id, limit, feed=None, aggregated_feed=None):
+    """
+    Получает элементы, добавленные после указанного элемента
+    
+    Элементы выбираются в порядке вставки (по возрастанию ID), поэтому
+    запрос - это диапазон по индексу, а последний ID становится новым курсором.
+    
+    Args:
+        since_id (int): ID последнего полученного клиентом элемента
+        limit (int): Максимальное количество элементов
+        feed (Feed, optional): Лента-источник
+        aggregated_feed (AggregatedFeed, optional): Агрегированная лента
+        
+    Returns:
+        list: Строки с полями FEED_ENTRY_COLUMNS
+    """
+    if aggregated_feed is not None:
+        query = _aggregated_items_query(aggregated_feed)
+    else:
+        query = FeedItem.query.filter(FeedItem.feed_id == feed.id)
+    
+    return query.outerjoin(ItemBody, ItemBody.item_id == FeedItem.id) \
+                .with_entities(*FEED_ENTRY_COLUMNS) \
+                .filter(FeedItem.id > since_id) \
+                .order_by(FeedItem.id.asc()) \
+                .limit(limit) \
+                .all()
+
+
+# Поля элемента, нужные для сериализации лент. Строки с этими полями
+# не попадают в identity map сессии, в отличие от объектов FeedItem.
+# Сжатое описание (ItemBody) читается внешним соединением и
+# распаковывается только при сериализации (full_description)
+FEED_ENTRY_COLUMNS = (
+    FeedItem.id,
+    FeedItem.feed_id,
+    FeedItem.title,
+    FeedItem.link,
+    FeedItem.description,
+    FeedItem.guid,
+    FeedItem.published,
+    FeedItem.image,
+    ItemBody.codec.label('body_codec'),
+    ItemBody.data.label('body_data'),
+)
+
+
+def _stream_entries(query, limit):
+    """Последние элементы запроса строками, читаемыми из курсора частями"""
+    return query.outerjoin(ItemBody, ItemBody.item_id == FeedItem.id) \
+                .with_entities(*FEED_ENTRY_COLUMNS) \
+                .order_by(FeedItem.published.desc()) \
+                .limit(limit) \
+                .yield_per(current_app.config['FEED_YIELD_PER'])
+
+
+def stream_feed_entries(feed, limit):
+    """
+    Получает последние элементы ленты-источника для сериализации
+    
+    Args:
+        feed (Feed): Лента-источник
+        limit (int): Количество элементов
+        
+    Returns:
+        iterator: Строки с полями FEED_ENTRY_COLUMNS (читаются один раз)
+    """
+    return _stream_entries(FeedItem.query.filter(FeedItem.feed_id == feed.id), limit)
+
+
+def stream_aggregated_feed_entries(aggregated_feed, limit):
+    """
+    Получает последние элементы агрегированной ленты для сериализации
+    
+    Args:
+        aggregated_feed (AggregatedFeed): Агрегированная лента
+        limit (int): Количество элементов
+        
+    Returns:
+        iterator: Строки с полями FEED_ENTRY_COLUMNS (читаются один раз)
+    """
+    return _stream_entries(_aggregated_items_query(aggregated_feed), limit)
+
+
+def _listing_page(query, page, per_page, *extra_columns):
+    """Страница элементов для списков: описание обрезается на стороне БД"""
+    excerpt = func.substr(FeedItem.description, 1, current_app.config['LISTING_DESCRIPTION_CHARS'])
+    return query.with_entities(
+        FeedItem.id,
+        FeedItem.feed_id,
+        FeedItem.title,
+        FeedItem.link,
+        excerpt.label('description'),
+        FeedItem.published,
+        FeedItem.image,
+        Feed.name.label('feed_name'),
+        *extra_columns
+    ).order_by(FeedItem.published.desc()).paginate(page, per_page, error_out=False)
+
+
+def get_feed_listing(feed, page, per_page):
+    """
+    Получает страницу элементов ленты-источника для просмотра
+    
+    Args:
+        feed (Feed): Лента-источник
+        page (int): Номер страницы
+        per_page (int): Элементов на страницу
+        
+    Returns:
+        Pagination: Строки с полями элемента, началом описания и именем ленты;
+            для лент с обогащением - также article_status и article_content
+    """
+    query = FeedItem.query.join(Feed, Feed.id == FeedItem.feed_id).filter(FeedItem.feed_id == feed.id)
+    if not feed.enrich_content:
+        return _listing_page(query, page, per_page)
+    
+    # Полный текст статьи - тем же запросом, без загрузки связи для каждого элемента
+    query = query.outerjoin(ItemContent, ItemContent.url == FeedItem.link)
+    return _listing_page(
+        query, page, per_page,
+        ItemContent.status.label('article_status'),
+        ItemContent.content.label('article_content')
+    )
+
+
+def get_aggregated_feed_listing(aggregated_feed, page, per_page):
+    """
+    Получает страницу элементов агрегированной ленты для просмотра
+    
+    Args:
+        aggregated_feed (AggregatedFeed): Агрегированная лента
+        page (int): Номер страницы
+        per_page (int): Элементов на страницу
+        
+    Returns:
+        Pagination: Строки с полями элемента, началом описания и именем ленты
+    """
+    return _listing_page(_aggregated_items_query(aggregated_feed), page, per_page)
+
+
+def prune_feed_items(feed, older_than, keep_latest=0, dry_run=False):
+    """
+    Удаляет старые элементы ленты
+    
+    Args:
+        feed (Feed): Лента-источник
+        older_than (datetime): Удаляются элементы, опубликованные раньше
+        keep_latest (int): Сколько последних элементов оставить в любом случае
+        dry_run (bool): Только посчитать элементы, которые были бы удалены
+        
+    Returns:
+        int: Количество удаленных элементов
+    """
+    query = FeedItem.query.filter(FeedItem.feed_id == feed.id, FeedItem.published < older_than)
+    if keep_latest:
+        latest = db.session.query(FeedItem.id).filter(FeedItem.feed_id == feed.id) \
+                           .order_by(FeedItem.published.desc()).limit(keep_latest)
+        query = query.filter(FeedItem.id.notin_(latest.subquery().select()))
+    if dry_run:
+        return query.count()
+    # Массовое удаление не применяет каскад связи FeedItem.body
+    ItemBody.query.filter(ItemBody.item_id.in_(query.with_entities(FeedItem.id).subquery().select())) \
+                  .delete(synchronize_session=False)
+    deleted = query.delete(synchronize_session=False)
+    if deleted:
+        feed.items_version = (feed.items_version or 0) + 1
+    db.session.commit()
+    return deleted
+
+
+# Сортировки панели управления: имя параметра -> выражение
+DASHBOARD_SORTS = {
+    'name': func.lower(Feed.name),
+    'type': Feed.feed_type,
+    'updated': Feed.last_updated,
+    'failures': Feed.consecutive_failures,
+    'created': Feed.id,
+}
+
+# Фильтры состояния лент на панели управления
+DASHBOARD_STATUSES = {
+    'active': lambda query: query.filter(Feed.active.is_(True), Feed.suspended.isnot(True),
+                                         func.coalesce(Feed.consecutive_failures, 0) == 0),
+    'failing': lambda query: query.filter(Feed.active.is_(True), Feed.suspended.isnot(True),
+                                          Feed.consecutive_failures > 0),
+    'suspended': lambda query: query.filter(Feed.suspended.is_(True)),
+    'inactive': lambda query: query.filter(Feed.active.isnot(True)),
+}
+
+
+def _item_stats_subquery(feed_ids=None):
+    """
+    Сгруппированный запрос количества элементов и последнего ID по лентам
+    
+    Последний ID - это последний вставленный элемент, поэтому и количество,
+    и максимум вычисляются по индексу (feed_id, id) без чтения строк.
+    """
+    query = db.session.query(
+        FeedItem.feed_id.label('feed_id'),
+        func.count(FeedItem.id).label('item_count'),
+        func.max(FeedItem.id).label('last_item_id')
+    )
+    if feed_ids is not None:
+        query = query.filter(FeedItem.feed_id.in_(feed_ids))
+    return query.group_by(FeedItem.feed_id).subquery()
+
+
+def feed_item_stats(feed_ids):
+    """
+    Получает статистику элементов для нескольких лент одним запросом
+    
+    Args:
+        feed_ids (list): ID лент
+        
+    Returns:
+        dict: ID ленты -> {'item_count', 'last_item_at'}; ленты без
+            элементов в словарь не попадают
+    """
+    if not feed_ids:
+        return {}
+    stats = _item_stats_subquery(feed_ids)
+    rows = db.session.query(stats.c.feed_id, stats.c.item_count, FeedItem.created_at) \
+                     .join(FeedItem, FeedItem.id == stats.c.last_item_id) \
+                     .all()
+    return {
+        feed_id: {'item_count': item_count, 'last_item_at': last_item_at}
+        for feed_id, item_count, last_item_at in rows
+    }
+
+
+def dashboard_feeds(page, per_page, search=None, feed_type=None, status=None, sort='name', order='asc'):
+    """
+    Получает страницу лент для панели управления со статистикой элементов
+    
+    Фильтрация, сортировка и пагинация выполняются в БД. Статистика
+    элементов загружается одним сгруппированным запросом только для лент
+    текущей страницы, поэтому время ответа не растет с количеством лент.
+    Сортировка по количеству элементов или последнему элементу группирует
+    элементы всех лент.
+    
+    Args:
+        page (int): Номер страницы
+        per_page (int): Лент на страницу
+        search (str, optional): Подстрока названия или URL
+        feed_type (str, optional): Тип ленты
+        status (str, optional): Состояние из DASHBOARD_STATUSES
+        sort (str): Поле сортировки: ключ DASHBOARD_SORTS, 'items' или 'last_item'
+        order (str): 'asc' или 'desc'
+        
+    Returns:
+        tuple: (Pagination лент, словарь статистики из feed_item_stats)
+    """
+    query = Feed.query
+    if search:
+        pattern = f"%{search.strip()}%"
+        query = query.filter(or_(Feed.name.ilike(pattern), Feed.url.ilike(pattern)))
+    if feed_type:
+        query = query.filter(Feed.feed_type == feed_type)
+    if status in DASHBOARD_STATUSES:
+        query = DASHBOARD_STATUSES[status](query)
+    
+    if sort in ('items', 'last_item'):
+        stats = _item_stats_subquery()
+        query = query.outerjoin(stats, stats.c.feed_id == Feed.id)
+        column = func.coalesce(stats.c.item_count if sort == 'items' else stats.c.last_item_id, 0)
+    else:
+        column = DASHBOARD_SORTS.get(sort, DASHBOARD_SORTS['name'])
+    column = column.desc() if order == 'desc' else column.asc()
+    
+    feeds = query.order_by(column, Feed.id).paginate(page, per_page, error_out=False)
+    return feeds, feed_item_stats([feed.id for feed in feeds.items])
+
+
+def aggregated_feed_source_counts(aggregated_feed_ids):
+    """
+    Считает источники агрегированных лент одним запросом
+    
+    Args:
+        aggregated_feed_ids (list): ID агрегированных лент
+        
+    Returns:
+        dict: ID агрегированной ленты -> (всего источников, активных)
+    """
+    if not aggregated_feed_ids:
+        return {}
+    association = aggregated_feed_association.c
+    rows = db.session.query(
+        association.aggregated_feed_id,
+        func.count(Feed.id),
+        func.sum(db.case((Feed.active.is_(True), 1), else_=0))
+    ).join(Feed, Feed.id == association.feed_id) \
+     .filter(association.aggregated_feed_id.in_(aggregated_feed_ids)) \
+     .group_by(association.aggregated_feed_id) \
+     .all()
+    return {agg_id: (total, active or 0) for agg_id, total, active in rows}
+
+
+def latest_item_id(feed):
+    """
+    Возвращает ID последнего добавленного элемента ленты
+    
+    Args:
+        feed (Feed): Лента-источник
+        
+    Returns:
+        int: ID элемента или 0, если элементов нет
+    """
+    return db.session.query(func.max(FeedItem.id)).filter(FeedItem.feed_id == feed.id).scalar() or 0
+
+
+def aggregated_feed_version(aggregated_feed):
+    """
+    Возвращает версию содержимого агрегированной ленты
+    
+    Версия считается одним агрегирующим запросом по активным источникам
+    ленты (без фильтров по словам): их количество и сумма ID (состав),
+    последний ID элемента (по индексу (feed_id, id)) и сумма счетчиков
+    удалений, а также название, описание и правила ленты. Она меняется при
+    появлении и удалении элементов и при изменении состава источников и
+    используется для кеширования готовых лент. Для правила max_age_days в
+    версию входит текущий час, чтобы устаревшие элементы уходили из ленты.
+    
+    Args:
+        aggregated_feed (AggregatedFeed): Объект агрегированной ленты
+        
+    Returns:
+        tuple: (максимальный ID элемента источников или 0, версия)
+    """
+    latest = db.session.query(func.max(FeedItem.id)) \
+                       .filter(FeedItem.feed_id == Feed.id) \
+                       .scalar_subquery()
+    sources = db.session.query(Feed.id.label('feed_id'), latest.label('latest_id'),
+                               Feed.items_version.label('items_version')) \
+                        .filter(Feed.active.is_(True), aggregated_sources_condition(aggregated_feed)) \
+                        .subquery()
+    count, id_sum, latest_id, items_version = db.session.query(
+        func.count(sources.c.feed_id),
+        func.coalesce(func.sum(sources.c.feed_id), 0),
+        func.coalesce(func.max(sources.c.latest_id), 0),
+        func.coalesce(func.sum(sources.c.items_version), 0)
+    ).one()
+    rules = aggregated_feed.get_rules()
+    period = datetime.utcnow().strftime('%Y%m%d%H') if rules.get('max_age_days') else None
+    version = (aggregated_feed.name, aggregated_feed.description, aggregated_feed.rules, period,
+               count, id_sum, latest_id, items_version)
+    return latest_id, version
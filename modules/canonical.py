@@ -0,0 +1,204 @@
+import hashlib
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urljoin
+
+logger = logging.getLogger(__name__)
+
+# Параметры отслеживания, которые не влияют на содержимое страницы
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'ysclid', 'twclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'cmpid', 'ncid', 'openstat',
+    '_openstat', 'ref_src', 'from_rss', 'spm', 'at_medium', 'at_campaign',
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'mtm_', 'hmb_', 'itm_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonical_url(url):
+    """
+    Приводит URL статьи к каноническому виду
+
+    Схема и хост - в нижнем регистре, порт по умолчанию и фрагмент
+    удаляются, параметры отслеживания (utm_*, fbclid и т.п.) убираются,
+    остальные параметры сортируются, завершающий слеш пути отбрасывается.
+    Результат - ключ для сравнения ссылок, а не адрес для перехода: сервер
+    может различать путь со слешем и без, поэтому сохраняется исходная ссылка.
+
+    Args:
+        url (str): Абсолютный URL
+
+    Returns:
+        str: Канонический URL (или исходная строка, если это не http(s)-адрес)
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip('.')
+    if ':' in host:
+        host = f'[{host}]'
+    if port and port != DEFAULT_PORTS[scheme]:
+        host = f'{host}:{port}'
+
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def url_guid(url):
+    """
+    Вычисляет GUID элемента по URL статьи
+
+    GUID не зависит от заголовка, схемы (http/https), префикса www и
+    параметров отслеживания, поэтому правка заголовка или метки в ссылке
+    не создают дубликат.
+
+    Args:
+        url (str): URL статьи
+
+    Returns:
+        str: GUID (MD5 канонического адреса)
+    """
+    canonical = canonical_url(url)
+    parts = urlsplit(canonical)
+    if parts.scheme in DEFAULT_PORTS:
+        host = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+        canonical = urlunsplit(('', host, parts.path, parts.query, ''))
+    return hashlib.md5(canonical.encode()).hexdigest()
+
+
+def element_canonical_link(element, base_url):
+    """
+    Ищет каноническую ссылку внутри элемента страницы
+
+    Карточки статей часто содержат микроразметку schema.org
+    (<meta itemprop="url">) или <link rel="canonical"> с адресом статьи.
+
+    Args:
+        element (Tag): Элемент BeautifulSoup
+        base_url (str): Базовый URL для относительных ссылок
+
+    Returns:
+        str: Абсолютный URL или None
+    """
+    tag = element.select_one('link[rel~="canonical"][href]')
+    if tag:
+        return urljoin(base_url, tag['href'])
+    tag = element.select_one('meta[itemprop="url"][content], link[itemprop="url"][href]')
+    if tag:
+        return urljoin(base_url, tag.get('content') or tag.get('href'))
+    return None
+
+
+def item_identity(link, title, base_url, page_canonical=None):
+    """
+    Вычисляет ссылку и GUID извлеченного со страницы элемента
+
+    Если у элемента есть собственная ссылка, она сохраняется как есть, а
+    GUID считается по ее каноническому виду. Если ссылка совпадает с адресом страницы (элемент
+    без ссылки или страница одной статьи), используется rel=canonical
+    страницы, а для нескольких элементов без ссылок - ссылка и заголовок,
+    как раньше.
+
+    Args:
+        link (str): Абсолютная ссылка элемента
+        title (str): Заголовок элемента
+        base_url (str): URL страницы
+        page_canonical (str, optional): rel=canonical страницы
+
+    Returns:
+        tuple: (ссылка для сохранения, GUID)
+    """
+    if link == base_url and page_canonical:
+        link = page_canonical
+    if link == base_url:
+        return link, hashlib.md5((link + title).encode()).hexdigest()
+    return link, url_guid(link)
+
+
+def page_canonical_link(soup, base_url):
+    """
+    Возвращает адрес из <link rel="canonical"> страницы
+
+    Args:
+        soup (BeautifulSoup): Разобранная страница
+        base_url (str): URL страницы
+
+    Returns:
+        str: Абсолютный канонический URL или None
+    """
+    tag = soup.select_one('head link[rel~="canonical"][href]')
+    if not tag:
+        return None
+    return urljoin(base_url, tag['href'])
+
+
+def canonicalize_feed_items(feed, dry_run=False):
+    """
+    Пересчитывает GUID элементов ленты и объединяет дубликаты
+
+    Элементы с одинаковым GUID после пересчета объединяются в самый
+    ранний (его ID - курсор для клиентов дельта-запросов), а заголовок,
+    описание (вместе со сжатым ItemBody) и изображение берутся у
+    последнего добавленного дубликата - это самая свежая правка статьи.
+    Ссылки элементов не меняются.
+
+    Args:
+        feed (Feed): Лента-источник (элементы с вычисляемым GUID, т.е. парсинг)
+        dry_run (bool): Только посчитать изменения
+
+    Returns:
+        tuple: (элементов с измененным GUID, удаленных дубликатов)
+    """
+    from .storage import db, FeedItem, ItemBody
+
+    items = FeedItem.query.filter(FeedItem.feed_id == feed.id).order_by(FeedItem.id).all()
+    groups = {}
+    for item in items:
+        if item.link == feed.url:
+            continue
+        groups.setdefault(url_guid(item.link), []).append(item)
+
+    updated = merged = 0
+    for guid, group in groups.items():
+        keep, latest, duplicates = group[0], group[-1], group[1:]
+        if keep.guid != guid:
+            updated += 1
+        merged += len(duplicates)
+        if dry_run:
+            continue
+
+        keep.guid = guid
+        if latest is not keep:
+            keep.title = latest.title
+            keep.description = latest.description
+            body, latest.body = latest.body, None
+            keep.body = body and ItemBody(codec=body.codec, size=body.size, data=body.data, text=body.text)
+            keep.image = latest.image or keep.image
+        for item in duplicates:
+            db.session.delete(item)
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        if merged:
+            feed.items_version = (feed.items_version or 0) + 1
+        db.session.commit()
+    return updated, merged
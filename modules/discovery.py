@@ -0,0 +1,449 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+
+from flask import current_app
+
+from .storage import db, Feed, UpdateRun
+
+logger = logging.getLogger(__name__)
+
+# MIME-типы в <link rel="alternate">, которые умеет разбирать feedparser
+FEED_LINK_TYPES = ('application/rss+xml', 'application/atom+xml', 'application/rdf+xml')
+
+# Типичные адреса лент, если страница не объявляет их в <head>
+COMMON_FEED_PATHS = (
+    '/feed', '/rss', '/rss.xml', '/feed.xml', '/atom.xml', '/index.xml', '/feed/rss', '/news/rss'
+)
+
+# Адреса новостных sitemap по умолчанию (дополнительно к указанным в robots.txt)
+COMMON_SITEMAP_PATHS = ('/sitemap_news.xml', '/news-sitemap.xml', '/sitemap.xml')
+
+# Сколько дочерних sitemap проверять в индексе sitemap
+MAX_SITEMAP_CHILDREN = 3
+
+
+def find_feed_links(html, page_url):
+    """
+    Находит ленты, объявленные на странице через <link rel="alternate">
+
+    Args:
+        html (str): HTML страницы
+        page_url (str): URL страницы для разрешения относительных ссылок
+
+    Returns:
+        list: Абсолютные URL лент в порядке появления на странице
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # Разбираем только теги <link>, остальная страница не нужна
+    soup = BeautifulSoup(html, 'lxml', parse_only=SoupStrainer('link'))
+    links = []
+    for link in soup.find_all('link', href=True):
+        rel = [value.lower() for value in link.get('rel') or []]
+        link_type = (link.get('type') or '').split(';')[0].strip().lower()
+        if 'alternate' in rel and link_type in FEED_LINK_TYPES:
+            url = urljoin(page_url, link['href'])
+            if url not in links:
+                links.append(url)
+    return links
+
+
+def _site_root(url):
+    parts = urlparse(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _check_candidate(url, feed_type, max_bytes=None):
+    """
+    Загружает кандидата и проверяет, что это лента с элементами
+
+    Args:
+        url (str): URL кандидата
+        feed_type (str): 'rss' или 'sitemap'
+        max_bytes (int, optional): Лимит размера ответа
+
+    Returns:
+        dict: Кандидат с количеством элементов и временем загрузки и разбора
+            или None, если по адресу нет подходящей ленты
+    """
+    from .aggregator import fetch_rss_feed, fetch_sitemap_feed
+
+    fetch = fetch_rss_feed if feed_type == 'rss' else fetch_sitemap_feed
+    started = time.monotonic()
+    feed_data = fetch(url, max_bytes=max_bytes)
+    elapsed_ms = (time.monotonic() - started) * 1000
+
+    if not feed_data or not feed_data.get('entries'):
+        return None
+    return {
+        'url': url,
+        'type': feed_type,
+        'entries': len(feed_data['entries']),
+        'candidate_ms': round(elapsed_ms, 1)
+    }
+
+
+def _sitemap_candidates(page_url):
+    """
+    Собирает адреса возможных новостных sitemap сайта
+
+    Args:
+        page_url (str): URL страницы сайта
+
+    Returns:
+        list: URL sitemap: сначала из robots.txt, затем типичные адреса
+    """
+    from .politeness import get_governor
+
+    root = _site_root(page_url)
+    candidates = list(get_governor().site_maps(page_url))
+    for path in COMMON_SITEMAP_PATHS:
+        url = root + path
+        if url not in candidates:
+            candidates.append(url)
+    return candidates
+
+
+def _expand_sitemap_index(url, max_bytes=None):
+    """
+    Возвращает дочерние sitemap из индекса, похожие на новостные
+
+    Args:
+        url (str): URL sitemap
+        max_bytes (int, optional): Лимит размера ответа
+
+    Returns:
+        list: URL дочерних sitemap (пустой, если это не индекс)
+    """
+    from xml.etree import ElementTree
+    from .fetcher import fetch_url
+    from .aggregator import SITEMAP_NS
+
+    try:
+        root = ElementTree.fromstring(fetch_url(url, timeout=15, max_bytes=max_bytes).content)
+    except Exception as e:
+        logger.info(f"Sitemap {url} is not available: {str(e)}")
+        return []
+
+    if root.tag != f'{{{SITEMAP_NS}}}sitemapindex':
+        return []
+    children = [loc.text.strip() for loc in root.iter(f'{{{SITEMAP_NS}}}loc') if loc.text]
+    news = [child for child in children if 'news' in child.lower()]
+    return news[:MAX_SITEMAP_CHILDREN]
+
+
+def discover_feeds(page_url, html=None, max_bytes=None):
+    """
+    Ищет ленту, которой можно заменить скрапинг страницы
+
+    Порядок поиска от дешевого к дорогому: <link rel="alternate"> в уже
+    загруженной странице, типичные адреса лент на сайте, новостные sitemap
+    (из robots.txt и по типичным адресам). Поиск останавливается на первом
+    кандидате, который удалось загрузить и в котором есть элементы.
+
+    Args:
+        page_url (str): URL страницы
+        html (str, optional): Уже загруженный HTML страницы
+        max_bytes (int, optional): Лимит размера ответа
+
+    Returns:
+        dict: Найденная лента (url, type, entries, candidate_ms) или None
+    """
+    if html:
+        for url in find_feed_links(html, page_url):
+            candidate = _check_candidate(url, 'rss', max_bytes)
+            if candidate:
+                return dict(candidate, source='link')
+
+    root = _site_root(page_url)
+    for path in COMMON_FEED_PATHS:
+        candidate = _check_candidate(root + path, 'rss', max_bytes)
+        if candidate:
+            return dict(candidate, source='path')
+
+    for url in _sitemap_candidates(page_url):
+        for sitemap_url in _expand_sitemap_index(url, max_bytes) or [url]:
+            candidate = _check_candidate(sitemap_url, 'sitemap', max_bytes)
+            if candidate:
+                return dict(candidate, source='sitemap')
+
+    return None
+
+
+def discovery_due(feed):
+    """
+    Проверяет, пора ли снова искать ленту для источника со скрапингом
+
+    Args:
+        feed (Feed): Объект ленты из БД
+
+    Returns:
+        bool: Нужен ли поиск
+    """
+    if feed.feed_type != 'scrape' or not current_app.config['FEED_DISCOVERY_ENABLED']:
+        return False
+    discovery = feed.get_discovery()
+    if not discovery.get('checked_at'):
+        return True
+    checked_at = datetime.fromisoformat(discovery['checked_at'])
+    return (datetime.utcnow() - checked_at).total_seconds() > current_app.config['FEED_DISCOVERY_INTERVAL']
+
+
+def _last_scrape_ms(feed):
+    """Время последнего успешного обновления источника (загрузка и разбор), мс"""
+    run = UpdateRun.query.filter(UpdateRun.feed_id == feed.id, UpdateRun.error_class.is_(None)) \
+                         .order_by(UpdateRun.started_at.desc()).first()
+    return run.fetch_ms + run.parse_ms if run else None
+
+
+def run_discovery(feed, html=None, scrape_ms=None):
+    """
+    Ищет ленту для источника со скрапингом и сохраняет результат
+
+    Время скрапинга (загрузка страницы и извлечение по селекторам, по
+    умолчанию - из истории обновлений) сохраняется вместе с результатом для
+    отчета об экономии. Если включено FEED_DISCOVERY_AUTO_SWITCH, переход на
+    найденную ленту откладывается до следующего обновления источника (см.
+    apply_pending_switch), чтобы адрес и тип не менялись посреди обновления.
+
+    Args:
+        feed (Feed): Объект ленты из БД
+        html (str, optional): Уже загруженный HTML страницы
+        scrape_ms (float, optional): Время последнего скрапинга, мс
+
+    Returns:
+        dict: Результат поиска
+    """
+    from .fetcher import pop_last_error
+    from .scraper import get_html
+
+    print(f"Поиск ленты для источника {feed.name}")
+    try:
+        if html is None:
+            # Ссылки на ленты объявляются в <head>, браузер для них не нужен
+            html = get_html(feed.url, max_bytes=feed.max_fetch_bytes)
+        candidate = discover_feeds(feed.url, html, max_bytes=feed.max_fetch_bytes)
+    except Exception as e:
+        logger.error(f"Error discovering feeds for {feed.name}: {str(e)}")
+        candidate = None
+    finally:
+        # Неудачные пробы адресов - не ошибки самого источника
+        pop_last_error()
+
+    discovery = {'checked_at': datetime.utcnow().isoformat(timespec='seconds')}
+    if candidate:
+        discovery.update(candidate)
+        if scrape_ms is None:
+            # Время загрузки в истории уже включает ожидание рендеринга в браузере
+            scrape_ms = _last_scrape_ms(feed)
+        if scrape_ms is not None:
+            discovery['scrape_ms'] = round(scrape_ms, 1)
+        print(f"Для источника {feed.name} найдена лента: {candidate['url']} ({candidate['type']})")
+        if current_app.config['FEED_DISCOVERY_AUTO_SWITCH']:
+            discovery['pending_switch'] = True
+
+    feed.set_discovery(discovery)
+    db.session.commit()
+    return discovery
+
+
+# Поиск, запрошенный из интерфейса, выполняется по одному в отдельном потоке
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed-discovery')
+
+
+def _discovery_job(app, feed_id):
+    """Поиск ленты для источника в фоновом потоке"""
+    with app.app_context():
+        feed = Feed.query.get(feed_id)
+        if feed is None:
+            return
+        _set_status(feed, 'running')
+        try:
+            run_discovery(feed)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Discovery job for feed {feed_id} failed: {str(e)}")
+            _set_status(feed, 'failed')
+        finally:
+            db.session.remove()
+
+
+def _set_status(feed, status):
+    """Сохраняет состояние поиска, не затирая его прошлый результат"""
+    discovery = feed.get_discovery()
+    discovery['status'] = status
+    feed.set_discovery(discovery)
+    db.session.commit()
+
+
+def start_discovery(feed):
+    """
+    Ставит поиск ленты для источника в очередь и сразу возвращает управление
+
+    Пробные запросы могут подолгу ждать очереди к хосту, поэтому поиск
+    выполняется не в потоке запроса. Результат появляется в Feed.discovery,
+    ход поиска - см. discovery_status.
+
+    Args:
+        feed (Feed): Объект ленты из БД
+
+    Returns:
+        dict: Состояние поиска
+    """
+    if feed.get_discovery().get('status') not in ('queued', 'running'):
+        _set_status(feed, 'queued')
+        _background.submit(_discovery_job, current_app._get_current_object(), feed.id)
+    return discovery_status(feed)
+
+
+def discovery_status(feed):
+    """
+    Описывает состояние поиска ленты для API
+
+    Args:
+        feed (Feed): Объект ленты из БД
+
+    Returns:
+        dict: status ('queued', 'running', 'failed', 'done' или None - поиск
+            не выполнялся), время проверки и найденная лента
+    """
+    discovery = feed.get_discovery()
+    status = discovery.get('status') or ('done' if discovery.get('checked_at') else None)
+    return {
+        'feed_id': feed.id,
+        'status': status,
+        'checked_at': discovery.get('checked_at'),
+        'url': discovery.get('url'),
+        'type': discovery.get('type'),
+        'pending_switch': bool(discovery.get('pending_switch'))
+    }
+
+
+def run_due_discovery(limit=None):
+    """
+    Ищет ленты для источников со скрапингом, у которых подошел срок поиска
+
+    Выполняется отдельной задачей планировщика, а не внутри обновления:
+    поиск делает много пробных запросов через ограничитель частоты
+    запросов к хосту и задержал бы обновление источника.
+
+    Args:
+        limit (int, optional): Сколько источников проверить за один запуск
+
+    Returns:
+        int: Количество проверенных источников
+    """
+    feeds = Feed.query.filter(Feed.feed_type == 'scrape', Feed.active.is_(True),
+                              Feed.suspended.isnot(True)).order_by(Feed.id)
+    checked = 0
+    for feed in feeds:
+        if limit is not None and checked >= limit:
+            break
+        if discovery_due(feed):
+            run_discovery(feed)
+            checked += 1
+    return checked
+
+
+def apply_pending_switch(feed):
+    """
+    Переводит источник на найденную ленту, если переход отложен поиском
+
+    Вызывается перед обновлением источника, т.е. между обновлениями.
+
+    Args:
+        feed (Feed): Объект ленты из БД
+
+    Returns:
+        bool: Было ли выполнено переключение
+    """
+    discovery = feed.get_discovery()
+    if not discovery.get('pending_switch'):
+        return False
+    if feed.feed_type == 'scrape' and discovery.get('type') in ('rss', 'sitemap'):
+        return switch_to_discovered(feed)
+    discovery.pop('pending_switch')
+    feed.set_discovery(discovery)
+    db.session.commit()
+    return False
+
+
+def switch_to_discovered(feed):
+    """
+    Переводит источник на найденную ленту
+
+    Адрес страницы и тип 'scrape' сохраняются на место найденной ленты,
+    поэтому повторное переключение возвращает источник к скрапингу.
+    Селекторы не удаляются. GUID элементов у нового типа источника другие,
+    поэтому при следующем сохранении уже сохраненные элементы узнаются по
+    канонической ссылке и переводятся на новые GUID (см.
+    aggregator.store_feed_entries), а не добавляются повторно.
+
+    Args:
+        feed (Feed): Объект ленты из БД
+
+    Returns:
+        bool: Было ли выполнено переключение
+    """
+    discovery = feed.get_discovery()
+    if not discovery.get('url'):
+        return False
+
+    previous = {'url': feed.url, 'type': feed.feed_type}
+    feed.url = discovery['url']
+    feed.feed_type = discovery['type']
+    feed.parsed_content_hash = None
+    discovery.update(previous)
+    discovery.pop('pending_switch', None)
+    discovery['remap_items'] = True
+    feed.set_discovery(discovery)
+    db.session.commit()
+
+    logger.info(f"Feed {feed.name} switched from {previous['type']} to {feed.feed_type}: {feed.url}")
+    return True
+
+
+def discovery_report():
+    """
+    Сводка по источникам со скрапингом, для которых найдены ленты
+
+    Returns:
+        dict: Количество источников со скрапингом, проверенных и переводимых
+            на ленты, список переводимых источников и суммарная экономия
+            времени за один проход обновления
+    """
+    scrape_feeds = Feed.query.filter_by(feed_type='scrape').all()
+    convertible = []
+    checked = 0
+    for feed in scrape_feeds:
+        discovery = feed.get_discovery()
+        if discovery.get('checked_at'):
+            checked += 1
+        if not discovery.get('url'):
+            continue
+
+        scrape_ms = discovery.get('scrape_ms')
+        saved_ms = round(scrape_ms - discovery['candidate_ms'], 1) if scrape_ms is not None else None
+        convertible.append({
+            'feed_id': feed.id,
+            'name': feed.name,
+            'page_url': feed.url,
+            'feed_url': discovery['url'],
+            'feed_type': discovery['type'],
+            'found_by': discovery.get('source'),
+            'entries': discovery.get('entries'),
+            'scrape_ms': scrape_ms,
+            'candidate_ms': discovery['candidate_ms'],
+            'saved_ms': saved_ms
+        })
+
+    return {
+        'scrape_feeds': len(scrape_feeds),
+        'checked': checked,
+        'convertible': len(convertible),
+        'saved_ms_per_run': round(sum(item['saved_ms'] or 0 for item in convertible), 1),
+        'feeds': convertible
+    }
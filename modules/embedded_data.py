@@ -0,0 +1,303 @@
+import json
+import logging
+import re
+from datetime import datetime
+from urllib.parse import urljoin
+
+logger = logging.getLogger(__name__)
+
+# Источники встроенных данных (значение селектора контейнера в режиме 'embedded'):
+#   json_ld                 - все блоки <script type="application/ld+json">
+#   next_data               - <script id="__NEXT_DATA__"> (Next.js)
+#   window.<имя>            - присваивание window.<имя> = {...} в скрипте
+#                             (__INITIAL_STATE__, __NUXT__, __APOLLO_STATE__ ...)
+JSON_LD = 'json_ld'
+NEXT_DATA = 'next_data'
+
+_WINDOW_ASSIGNMENT = re.compile(r'window\.([A-Za-z_$][\w$]*)\s*=\s*')
+_WINDOW_PARSE_ASSIGNMENT = re.compile(r'window\.([A-Za-z_$][\w$]*)\s*=\s*JSON\.parse\(\s*')
+
+# Ключи, по которым распознаются поля элементов при автоопределении
+TITLE_KEYS = ('headline', 'title', 'name')
+LINK_KEYS = ('url', 'link', 'href', 'permalink', 'canonical_url', 'canonicalUrl', 'slug')
+DESCRIPTION_KEYS = ('description', 'summary', 'excerpt', 'lead', 'subtitle', 'abstract')
+IMAGE_KEYS = ('image', 'thumbnail', 'thumbnailUrl', 'cover', 'picture', 'imageUrl', 'image_url')
+DATE_KEYS = ('datePublished', 'publishedAt', 'published_at', 'pubDate', 'date', 'publishDate',
+             'dateCreated', 'createdAt', 'created_at')
+
+
+def find_embedded_payloads(html):
+    """
+    Находит на странице структурированные данные в скриптах
+
+    Args:
+        html (str): HTML страницы
+
+    Returns:
+        dict: Источник -> разобранные данные. Для json_ld - список объектов
+            из всех блоков, включая содержимое @graph
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # Разбираем только теги <script>, разметка страницы не нужна
+    soup = BeautifulSoup(html, 'lxml', parse_only=SoupStrainer('script'))
+    payloads = {}
+    json_ld = []
+
+    for script in soup.find_all('script'):
+        text = script.string or script.get_text()
+        if not text or not text.strip():
+            continue
+        script_type = (script.get('type') or '').lower()
+
+        if script_type == 'application/ld+json':
+            try:
+                data = json.loads(text)
+            except ValueError:
+                continue
+            for block in data if isinstance(data, list) else [data]:
+                if isinstance(block, dict) and isinstance(block.get('@graph'), list):
+                    json_ld.extend(block['@graph'])
+                else:
+                    json_ld.append(block)
+        elif script.get('id') == '__NEXT_DATA__':
+            try:
+                payloads[NEXT_DATA] = json.loads(text)
+            except ValueError:
+                continue
+        elif 'window.' in text:
+            payloads.update(_window_assignments(text))
+
+    if json_ld:
+        payloads[JSON_LD] = json_ld
+    return payloads
+
+
+def _window_assignments(script):
+    """Извлекает объекты из присваиваний window.<имя> = {...} и window.<имя> = JSON.parse("...")"""
+    decoder = json.JSONDecoder()
+    found = {}
+
+    for match in _WINDOW_PARSE_ASSIGNMENT.finditer(script):
+        try:
+            # Аргумент JSON.parse - JSON-строка, внутри которой JSON-документ
+            encoded, _ = decoder.raw_decode(script, match.end())
+            found[f'window.{match.group(1)}'] = json.loads(encoded)
+        except ValueError:
+            continue
+
+    for match in _WINDOW_ASSIGNMENT.finditer(script):
+        name = f'window.{match.group(1)}'
+        if name in found or script[match.end():match.end() + 1] not in '{[':
+            continue
+        try:
+            found[name], _ = decoder.raw_decode(script, match.end())
+        except ValueError:
+            continue
+    return found
+
+
+def resolve_path(data, path):
+    """
+    Возвращает значения по пути в JSON
+
+    Путь состоит из сегментов через точку: ключ объекта, индекс списка,
+    '*' - все элементы списка (или все значения объекта), 'ключ=значение' -
+    только элементы списка с таким значением ключа (например, @type=NewsArticle).
+
+    Args:
+        data: Разобранный JSON
+        path (str): Путь, например 'props.pageProps.articles' или '@type=NewsArticle'
+
+    Returns:
+        list: Найденные значения (списки на конце пути не раскрываются)
+    """
+    current = [data]
+    for segment in [part for part in (path or '').split('.') if part]:
+        next_values = []
+        for value in current:
+            if segment == '*':
+                if isinstance(value, list):
+                    next_values.extend(value)
+                elif isinstance(value, dict):
+                    next_values.extend(value.values())
+            elif '=' in segment:
+                key, expected = segment.split('=', 1)
+                for element in value if isinstance(value, list) else [value]:
+                    if isinstance(element, dict):
+                        actual = element.get(key)
+                        if actual == expected or (isinstance(actual, list) and expected in actual):
+                            next_values.append(element)
+            elif isinstance(value, dict):
+                if segment in value:
+                    next_values.append(value[segment])
+            elif isinstance(value, list):
+                if segment.isdigit() and int(segment) < len(value):
+                    next_values.append(value[int(segment)])
+                else:
+                    # Ключ применяется к каждому элементу списка
+                    next_values.extend(
+                        element[segment] for element in value
+                        if isinstance(element, dict) and segment in element
+                    )
+        current = next_values
+    return current
+
+
+def _first_text(item, path):
+    """Возвращает первое значение по пути как строку"""
+    for value in resolve_path(item, path):
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if isinstance(value, dict):
+            # Вложенные объекты schema.org: ImageObject, WebPage, Person
+            value = value.get('url') or value.get('@id') or value.get('name') or value.get('text')
+        if value is not None and value != '':
+            return str(value)
+    return None
+
+
+def extract_data_from_embedded(html, selectors, base_url):
+    """
+    Извлекает элементы из встроенных в страницу данных по путям JSON
+
+    В режиме 'embedded' селектор контейнера задает источник данных
+    (json_ld, next_data, window.<имя>), селектор элемента - путь к списку
+    элементов, остальные селекторы - пути к полям внутри элемента.
+
+    Args:
+        html (str): HTML страницы
+        selectors (dict): Словарь селекторов
+        base_url (str): Базовый URL для относительных ссылок
+
+    Returns:
+        list: Список элементов в том же виде, что и extract_data_with_selectors
+    """
+    from .canonical import item_identity
+    from .scraper import parse_date
+
+    if not html:
+        return []
+
+    source = selectors.get('container')
+    payloads = find_embedded_payloads(html)
+    if source not in payloads:
+        logger.warning(f"Embedded data {source} not found on {base_url}")
+        return []
+
+    elements = []
+    for value in resolve_path(payloads[source], selectors.get('item')):
+        elements.extend(value if isinstance(value, list) else [value])
+
+    items = []
+    for element in elements:
+        if not isinstance(element, dict):
+            continue
+
+        title = _first_text(element, selectors['title']) if selectors.get('title') else None
+        link = _first_text(element, selectors['link']) if selectors.get('link') else None
+        if not title and not link:
+            continue
+
+        description = _first_text(element, selectors['description']) if selectors.get('description') else None
+        image = _first_text(element, selectors['image']) if selectors.get('image') else None
+        date_text = _first_text(element, selectors['date']) if selectors.get('date') else None
+
+        item_data = {
+            'title': title or 'No Title',
+            'link': urljoin(base_url, link) if link else base_url,
+            'description': description or '',
+            'image': urljoin(base_url, image) if image else '',
+            'published': parse_date(date_text) if date_text else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        # GUID считается так же, как для CSS селекторов - по канонической ссылке
+        item_data['link'], item_data['guid'] = item_identity(item_data['link'], item_data['title'], base_url)
+        items.append(item_data)
+
+    return items
+
+
+def _find_key(sample, keys):
+    """Ищет в объекте первый ключ из списка, в том числе на один уровень глубже"""
+    for key in keys:
+        if key in sample and sample[key] not in (None, '', [], {}):
+            return key
+    for parent, value in sample.items():
+        if isinstance(value, dict):
+            for key in keys:
+                if key in value and value[key] not in (None, '', [], {}):
+                    return f'{parent}.{key}'
+    return None
+
+
+def _candidate_lists(data, path='', depth=0):
+    """Обходит JSON и возвращает (путь, список объектов) для всех списков объектов"""
+    if depth > 8:
+        return
+    if isinstance(data, list):
+        objects = [value for value in data if isinstance(value, dict)]
+        if len(objects) >= 2:
+            yield path, objects
+        return
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if '.' in key or '=' in key:
+                continue
+            yield from _candidate_lists(value, f'{path}.{key}' if path else key, depth + 1)
+
+
+def detect_embedded_data(html):
+    """
+    Ищет во встроенных данных страницы список статей и подбирает пути к полям
+
+    Args:
+        html (str): HTML страницы
+
+    Returns:
+        dict: Селекторы для режима 'embedded' или None, если данных нет
+    """
+    best = None
+    for source, payload in find_embedded_payloads(html).items():
+        candidates = []
+        if source == JSON_LD:
+            # Статьи в отдельных блоках JSON-LD группируем по @type
+            types = {}
+            for block in payload:
+                if isinstance(block, dict) and isinstance(block.get('@type'), str):
+                    types.setdefault(block['@type'], []).append(block)
+            candidates.extend((f"@type={type_name}", blocks) for type_name, blocks in types.items())
+            # Списки внутри блоков, например ItemList.itemListElement
+            for block in payload:
+                if not isinstance(block, dict) or not isinstance(block.get('@type'), str):
+                    continue
+                for path, objects in _candidate_lists(block):
+                    if path:
+                        candidates.append((f"@type={block.get('@type')}.{path}", objects))
+        else:
+            candidates.extend(_candidate_lists(payload))
+
+        for path, objects in candidates:
+            sample = objects[0]
+            title_key = _find_key(sample, TITLE_KEYS)
+            link_key = _find_key(sample, LINK_KEYS)
+            if not path or not title_key or not link_key:
+                continue
+            # Предпочитаем более длинные списки и списки с датами публикации
+            date_key = _find_key(sample, DATE_KEYS)
+            score = len(objects) + (len(objects) if date_key else 0)
+            if best is None or score > best[0]:
+                best = (score, {
+                    'mode': 'embedded',
+                    'container': source,
+                    'item': path,
+                    'title': title_key,
+                    'link': link_key,
+                    'description': _find_key(sample, DESCRIPTION_KEYS),
+                    'image': _find_key(sample, IMAGE_KEYS),
+                    'date': date_key,
+                    'use_selenium': False
+                })
+
+    if best is None:
+        return None
+    return {key: value for key, value in best[1].items() if value is not None}
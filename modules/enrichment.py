@@ -0,0 +1,367 @@
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from .storage import db, ItemContent
+
+logger = logging.getLogger(__name__)
+
+# Признаки основного содержимого и служебных блоков в class/id
+_POSITIVE = re.compile(r'article|body|content|entry|main|page|post|story|text', re.I)
+_NEGATIVE = re.compile(
+    r'comment|footer|header|sidebar|widget|nav|menu|share|social|related|promo|advert|banner|'
+    r'subscribe|breadcrumb|popup|cookie|meta|tags|author-bio', re.I
+)
+
+# Теги, которые никогда не бывают частью статьи
+_JUNK_TAGS = ('script', 'style', 'noscript', 'iframe', 'form', 'nav', 'aside', 'footer', 'header', 'svg', 'button')
+
+# Теги и атрибуты, которые остаются в извлеченном тексте
+_ALLOWED_TAGS = {
+    'p', 'br', 'h2', 'h3', 'h4', 'h5', 'ul', 'ol', 'li', 'blockquote', 'pre', 'code',
+    'em', 'strong', 'b', 'i', 'a', 'img', 'figure', 'figcaption', 'table', 'tr', 'td', 'th'
+}
+_ALLOWED_ATTRS = {'a': ('href',), 'img': ('src', 'alt')}
+# Схемы адресов в href/src (javascript:, data: и т.п. удаляются)
+_ALLOWED_SCHEMES = ('http', 'https')
+
+# Минимальная длина текста, чтобы считать извлечение удачным
+MIN_TEXT_LENGTH = 250
+
+
+def _hints(node):
+    """Строка из class и id узла"""
+    return ' '.join(node.get('class') or []) + ' ' + (node.get('id') or '')
+
+
+def _class_weight(node):
+    """Вес узла по class и id, как в Readability"""
+    weight = 0
+    hints = _hints(node)
+    if _POSITIVE.search(hints):
+        weight += 25
+    if _NEGATIVE.search(hints):
+        weight -= 25
+    return weight
+
+
+def _link_density(node):
+    """Доля текста узла, которая находится внутри ссылок"""
+    text_length = len(node.get_text(strip=True))
+    if not text_length:
+        return 0.0
+    link_length = sum(len(link.get_text(strip=True)) for link in node.find_all('a'))
+    return link_length / text_length
+
+
+def _safe_url(url, base_url):
+    """Абсолютный адрес ссылки или None, если схема не http(s)"""
+    if base_url:
+        url = urljoin(base_url, url)
+    try:
+        scheme = urlsplit(url).scheme.lower()
+    except ValueError:
+        return None
+    # Относительный адрес (без схемы) остается относительным к нашей странице
+    if scheme and scheme not in _ALLOWED_SCHEMES:
+        return None
+    return url
+
+
+def _clean(node, base_url):
+    """Оставляет в узле только разметку текста и делает ссылки абсолютными"""
+    for tag in node.find_all(True):
+        if tag.name not in _ALLOWED_TAGS:
+            tag.unwrap()
+            continue
+        allowed = _ALLOWED_ATTRS.get(tag.name, ())
+        tag.attrs = {name: value for name, value in tag.attrs.items() if name in allowed}
+        for name in ('href', 'src'):
+            if name in tag.attrs:
+                url = _safe_url(tag[name], base_url)
+                if url:
+                    tag[name] = url
+                else:
+                    del tag[name]
+    # Пустые абзацы после удаления разметки
+    for tag in node.find_all('p'):
+        if not tag.get_text(strip=True) and not tag.find('img'):
+            tag.decompose()
+
+
+def extract_main_content(html, base_url):
+    """
+    Извлекает основной текст статьи со страницы (алгоритм в духе Readability)
+
+    Каждый абзац добавляет очки родителю и, вполовину, деду: за сам абзац,
+    за запятые и за длину текста. Очки узла корректируются по class/id и
+    по доле текста в ссылках; побеждает узел с наибольшим счетом.
+
+    Args:
+        html (str): HTML страницы
+        base_url (str): URL страницы для абсолютных ссылок
+
+    Returns:
+        tuple: (HTML основного содержимого, длина текста) или (None, 0)
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'lxml')
+    for tag in soup.find_all(_JUNK_TAGS):
+        tag.decompose()
+    # Служебные блоки (комментарии, «читайте также», меню) убираем целиком
+    for tag in soup.find_all(True):
+        if tag.decomposed or tag.name in ('html', 'body', 'article', 'main'):
+            continue
+        hints = _hints(tag)
+        if _NEGATIVE.search(hints) and not _POSITIVE.search(hints):
+            tag.decompose()
+
+    scores = {}
+    for paragraph in soup.find_all(['p', 'pre', 'td']):
+        text = paragraph.get_text(' ', strip=True)
+        if len(text) < 25:
+            continue
+        score = 1 + text.count(',') + text.count('，') + min(len(text) // 100, 3)
+        for parent, share in ((paragraph.parent, 1.0), (getattr(paragraph.parent, 'parent', None), 0.5)):
+            if parent is None or parent.name in (None, '[document]'):
+                continue
+            if id(parent) not in scores:
+                scores[id(parent)] = [parent, _class_weight(parent) + (5 if parent.name in ('article', 'main') else 0)]
+            scores[id(parent)][1] += score * share
+
+    if not scores:
+        return None, 0
+
+    best, best_score = None, None
+    for node, score in scores.values():
+        score *= 1 - _link_density(node)
+        if best_score is None or score > best_score:
+            best, best_score = node, score
+
+    _clean(best, base_url)
+    text_length = len(best.get_text(' ', strip=True))
+    if text_length < MIN_TEXT_LENGTH:
+        return None, text_length
+    return best.decode_contents().strip(), text_length
+
+
+def sanitize_article_html(html):
+    """
+    Очищает сохраненный текст статьи перед выводом в шаблон
+
+    Текст, сохраненный до появления проверки схем адресов, мог сохранить
+    ссылки javascript: и data:, поэтому разметка проверяется и при выводе.
+
+    Args:
+        html (str): HTML из ItemContent.content
+
+    Returns:
+        str: HTML только с разрешенными тегами, атрибутами и адресами
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html or '', 'html.parser')
+    for tag in soup.find_all(_JUNK_TAGS):
+        tag.decompose()
+    _clean(soup, None)
+    return soup.decode()
+
+
+def queue_items(items):
+    """
+    Ставит статьи новых элементов в очередь на загрузку полного текста
+
+    Каждый URL загружается один раз: если запись для него уже есть
+    (в том числе от другой ленты), новая не создается. Запись, которую
+    одновременно добавило другое обновление, пропускается, а не прерывает
+    сохранение остальных.
+
+    Args:
+        items (list): Новые объекты FeedItem
+
+    Returns:
+        int: Количество добавленных в очередь URL
+    """
+    urls = {item.link for item in items if item.link and item.link.startswith(('http://', 'https://'))}
+    if not urls:
+        return 0
+
+    existing = {row.url for row in db.session.query(ItemContent.url).filter(ItemContent.url.in_(urls))}
+    added = 0
+    for url in sorted(urls - existing):
+        try:
+            with db.session.begin_nested():
+                db.session.add(ItemContent(url=url, status='pending', next_attempt_at=datetime.utcnow()))
+        except IntegrityError:
+            continue
+        added += 1
+    db.session.commit()
+    return added
+
+
+def _claim_batch(limit, stale_after):
+    """
+    Забирает порцию статей, готовых к загрузке
+
+    Запись переводится в 'running' условным UPDATE, поэтому одну статью не
+    заберут два процесса. Записи, застрявшие в 'running' (процесс упал),
+    возвращаются в работу через stale_after секунд.
+
+    Returns:
+        list: Объекты ItemContent
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=stale_after)
+    candidates = ItemContent.query.filter(
+        db.or_(
+            db.and_(ItemContent.status == 'pending', ItemContent.next_attempt_at <= now),
+            db.and_(ItemContent.status == 'running', ItemContent.claimed_at < stale)
+        )
+    ).order_by(ItemContent.next_attempt_at).limit(limit).all()
+
+    claimed = []
+    for row in candidates:
+        result = db.session.query(ItemContent).filter(
+            ItemContent.id == row.id,
+            ItemContent.status == row.status,
+            db.or_(ItemContent.claimed_at.is_(None), ItemContent.claimed_at == row.claimed_at)
+        ).update({'status': 'running', 'claimed_at': now}, synchronize_session=False)
+        if result:
+            claimed.append(row.id)
+    db.session.commit()
+    if not claimed:
+        return []
+    return ItemContent.query.filter(ItemContent.id.in_(claimed)).all()
+
+
+def _fetch_article(app, url):
+    """
+    Загружает страницу статьи и извлекает основной текст (выполняется в пуле)
+
+    Returns:
+        tuple: (HTML содержимого, длина текста, текст ошибки, стоит ли повторять)
+    """
+    from .fetcher import fetch_url
+
+    with app.app_context():
+        try:
+            response = fetch_url(url, timeout=15)
+        except Exception as e:
+            return None, 0, f"{type(e).__name__}: {str(e)}", True
+
+        content, text_length = extract_main_content(response.text, response.url)
+        if content is None:
+            # Страница загружена, но статьи на ней нет - повтор не поможет
+            return None, text_length, 'Main content not found', False
+        return content, text_length, None, False
+
+
+def _apply_result(row, content, text_length, error, retryable):
+    """Сохраняет результат загрузки статьи или планирует повтор"""
+    config = current_app.config
+    row.claimed_at = None
+    row.attempts = (row.attempts or 0) + 1
+    row.text_length = text_length
+
+    if error is None:
+        row.status = 'done'
+        row.content = content
+        row.last_error = None
+        row.fetched_at = datetime.utcnow()
+        return
+
+    row.last_error = error[:500]
+    if not retryable or row.attempts >= config['ENRICH_MAX_ATTEMPTS']:
+        row.status = 'failed'
+    else:
+        # Экспоненциальная пауза перед повтором
+        delay = config['ENRICH_RETRY_BASE'] * 2 ** (row.attempts - 1)
+        row.status = 'pending'
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+
+_drain_lock = threading.Lock()
+
+
+def process_pending(app):
+    """
+    Загружает полный текст статей из очереди, пока она не опустеет
+
+    Страницы загружаются пулом из ENRICH_WORKERS потоков (через регулятор
+    запросов), а результаты записываются в БД в вызывающем потоке.
+    Одновременно в процессе работает только один такой проход.
+
+    Args:
+        app (Flask): Экземпляр приложения
+
+    Returns:
+        int: Количество обработанных статей (None, если проход уже идет)
+    """
+    from .metrics import metrics
+
+    if not _drain_lock.acquire(blocking=False):
+        return None
+
+    processed = 0
+    try:
+        with app.app_context():
+            config = app.config
+            try:
+                with ThreadPoolExecutor(max_workers=config['ENRICH_WORKERS']) as executor:
+                    while True:
+                        batch = _claim_batch(config['ENRICH_BATCH_SIZE'], config['ENRICH_STALE_AFTER'])
+                        if not batch:
+                            break
+                        urls = [row.url for row in batch]
+                        results = executor.map(lambda url: _fetch_article(app, url), urls)
+                        for row, (content, text_length, error, retryable) in zip(batch, results):
+                            _apply_result(row, content, text_length, error, retryable)
+                            metrics.increment('enrich.done' if error is None else 'enrich.errors')
+                        db.session.commit()
+                        processed += len(batch)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error enriching articles: {str(e)}")
+            if processed:
+                logger.info(f"Enriched {processed} articles")
+            return processed
+    finally:
+        _drain_lock.release()
+
+
+def enrichment_status():
+    """
+    Возвращает размер очереди загрузки статей по статусам
+
+    Returns:
+        dict: Статус -> количество статей
+    """
+    rows = db.session.query(ItemContent.status, db.func.count(ItemContent.id)).group_by(ItemContent.status).all()
+    return {status: count for status, count in rows}
+
+
+# Отдельный поток для прохода по очереди: обновление лент его не ждет
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='enrichment')
+
+
+def start_background_processing(app):
+    """
+    Запускает проход по очереди статей в фоне и сразу возвращает управление
+
+    Проход ставится в очередь всегда, даже если другой уже идет: тот мог
+    последний раз проверить очередь до добавления новых записей. Лишний
+    проход ничего не стоит - при занятой блокировке process_pending сразу
+    возвращается, а у пула один поток, поэтому поставленный за идущим
+    проходом запускается после него.
+
+    Args:
+        app (Flask): Экземпляр приложения
+    """
+    _background.submit(process_pending, app)
@@ -1,111 +1,419 @@
+import base64
 import feedgenerator
+import json
+import mimetypes
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import pytz
-from flask import url_for
-from .storage import Feed, FeedItem, AggregatedFeed
+from flask import url_for, current_app
+from sqlalchemy import func
+from .storage import db, Feed, FeedItem, AggregatedFeed
+from .item_body import full_description
 import logging
 
 logger = logging.getLogger(__name__)
 
-def generate_feed(items, title, description, link, language='ru'):
+# Поддерживаемые форматы выдачи и их MIME-типы
+FEED_FORMATS = {
+    'rss': 'application/rss+xml',
+    'atom': 'application/atom+xml',
+    'json': 'application/feed+json',
+}
+
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+
+MEDIA_NS = 'http://search.yahoo.com/mrss/'
+
+
+class WebSubRssFeed(feedgenerator.Rss201rev2Feed):
+    """
+    RSS 2.0 с элементами atom:link rel="self" и rel="hub" для WebSub
+    и изображениями элементов в media:content и media:thumbnail (Media RSS)
+    """
+    
+    def rss_attributes(self):
+        attrs = super().rss_attributes()
+        if self.feed.get('hub_url'):
+            attrs['xmlns:atom'] = 'http://www.w3.org/2005/Atom'
+        if any(item.get('image') for item in self.items):
+            attrs['xmlns:media'] = MEDIA_NS
+        return attrs
+    
+    def add_item_elements(self, handler, item):
+        super().add_item_elements(handler, item)
+        if item.get('image'):
+            handler.addQuickElement('media:content', '', {'url': item['image'], 'medium': 'image'})
+            handler.addQuickElement('media:thumbnail', '', {'url': item['image']})
+    
+    def add_root_elements(self, handler):
+        super().add_root_elements(handler)
+        if self.feed.get('hub_url'):
+            handler.addQuickElement('atom:link', '', {'rel': 'self', 'href': self.feed['link']})
+            handler.addQuickElement('atom:link', '', {'rel': 'hub', 'href': self.feed['hub_url']})
+
+
+class WebSubAtomFeed(feedgenerator.Atom1Feed):
+    """Atom 1.0 с элементом link rel="hub" для WebSub"""
+    
+    def add_root_elements(self, handler):
+        super().add_root_elements(handler)
+        if self.feed.get('hub_url'):
+            handler.addQuickElement('link', '', {'rel': 'hub', 'href': self.feed['hub_url']})
+
+
+class RenderedFeedCache:
+    """
+    Кеш готовых представлений лент
+    
+    Ключ - лента и формат, значение - версия данных и готовый документ.
+    Версия - последние ID элементов и счетчики удалений источников (см.
+    aggregator.aggregated_feed_version) - читается по индексу без отбора
+    элементов, поэтому попадание в кеш не требует запросов по элементам, а
+    документ пересобирается только после изменения элементов или ленты.
+    Кеш общий для всех форматов и ограничен по количеству записей.
+    """
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def set(self, key, version, payload):
+        with self._lock:
+            self._entries[key] = (version, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+rendered_cache = RenderedFeedCache()
+
+
+def encode_cursor(item_id):
+    """
+    Кодирует позицию в ленте в непрозрачный курсор для параметра ?since=
+    
+    Args:
+        item_id (int): ID последнего полученного элемента
+        
+    Returns:
+        str: Курсор
+    """
+    return base64.urlsafe_b64encode(f'v1:{item_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Декодирует курсор, выданный encode_cursor
+    
+    Args:
+        cursor (str): Курсор из параметра ?since=
+        
+    Returns:
+        int: ID последнего полученного элемента
+        
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    padded = cursor + '=' * (-len(cursor) % 4)
+    version, _, value = base64.urlsafe_b64decode(padded.encode()).decode().partition(':')
+    if version != 'v1' or not value.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return int(value)
+
+
+def _iter_entries(items, base_url=None):
+    """
+    Приводит строки элементов к единому виду для всех сериализаторов
+    
+    Args:
+        items (iterable): Объекты FeedItem или строки с теми же полями
+        base_url (str, optional): Базовый URL приложения для ссылок на миниатюры
+    
+    Yields:
+        dict: Поля элемента с датой публикации в UTC
+    """
+    from .thumbnails import thumbnail_url, cached_thumbnail_type
+    
+    for item in items:
+        # Устанавливаем дату публикации (с учетом временной зоны)
+        pubdate = item.published
+        if pubdate and pubdate.tzinfo is None:
+            pubdate = pubdate.replace(tzinfo=pytz.UTC)
+        elif not pubdate:
+            pubdate = datetime.utcnow().replace(tzinfo=pytz.UTC)
+        
+        # Изображение отдается и вложением (enclosure), и элементами Media RSS;
+        # размер вложения неизвестен, поэтому length="0". Тип миниатюры
+        # берется из кеша; пока ее там нет, /thumbnails/<id> отправляет к
+        # источнику, и тип исходного изображения угадывается по адресу
+        image = thumbnail_url(item, base_url)
+        enclosure = None
+        if image:
+            mime_type = cached_thumbnail_type(item.image) if image != item.image else None
+            if not mime_type:
+                mime_type = mimetypes.guess_type(item.image.split('?', 1)[0])[0]
+            if not mime_type or not mime_type.startswith('image/'):
+                mime_type = 'image/jpeg'
+            enclosure = feedgenerator.Enclosure(image, '0', mime_type)
+        
+        yield {
+            'title': item.title,
+            'link': item.link,
+            'description': full_description(item),
+            'pubdate': pubdate,
+            'unique_id': item.guid or item.link,
+            'enclosure': enclosure,
+            'image': image
+        }
+
+
+def _generate_xml_feed(feed_class, entries, title, description, link, language, hub_url):
+    """Сериализует элементы в RSS 2.0 или Atom 1.0 через feedgenerator"""
+    feed = feed_class(
+        title=title,
+        link=link,
+        description=description,
+        language=language,
+        feed_url=link,
+        lastBuildDate=datetime.utcnow().replace(tzinfo=pytz.UTC),
+        hub_url=hub_url
+    )
+    
+    # Добавляем элементы в ленту
+    for entry in entries:
+        feed.add_item(**entry)
+    
+    # Генерируем XML
+    return feed.writeString('utf-8')
+
+
+def _generate_json_feed(entries, title, description, link, language, hub_url):
+    """
+    Сериализует элементы в JSON Feed 1.1
+    
+    Документ собирается по частям по мере чтения элементов и выводится
+    в компактном виде (без пробелов и без экранирования не-ASCII символов).
+    """
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    
+    header = {
+        'version': JSON_FEED_VERSION,
+        'title': title,
+        'feed_url': link,
+        'description': description,
+        'language': language,
+    }
+    if hub_url:
+        header['hubs'] = [{'type': 'WebSub', 'url': hub_url}]
+    
+    chunks = [dumps(header)[:-1], ',"items":[']
+    first = True
+    for entry in entries:
+        item = {
+            'id': entry['unique_id'],
+            'url': entry['link'],
+            'title': entry['title'],
+            'content_html': entry['description'] or '',
+            'date_published': entry['pubdate'].isoformat(),
+        }
+        if entry['image']:
+            item['image'] = entry['image']
+        if not first:
+            chunks.append(',')
+        chunks.append(dumps(item))
+        first = False
+    chunks.append(']}')
+    
+    return ''.join(chunks)
+
+
+def generate_feed(items, title, description, link, language='ru', fmt='rss', base_url=None):
     """
-    Создает RSS-ленту из списка элементов
+    Создает ленту из списка элементов
     
     Args:
-        items (list): Список объектов FeedItem
+        items (iterable): Объекты FeedItem или строки с теми же полями (читаются один раз)
         title (str): Заголовок ленты
         description (str): Описание ленты
         link (str): Ссылка на ленту
         language (str): Язык ленты
-        
+        fmt (str): Формат: 'rss', 'atom' или 'json'
+        base_url (str, optional): Базовый URL приложения для ссылок на миниатюры
+    
     Returns:
-        str: XML-представление ленты RSS
+        str: Представление ленты в выбранном формате
     """
     try:
-        # Создаем объект канала RSS
-        feed = feedgenerator.Rss201rev2Feed(
-            title=title,
-            link=link,
-            description=description,
-            language=language,
-            lastBuildDate=datetime.utcnow().replace(tzinfo=pytz.UTC)
-        )
+        # Если настроен хаб WebSub, объявляем его в ленте
+        hub_url = current_app.config.get('WEBSUB_HUB_URL')
+        entries = _iter_entries(items, base_url)
+        
+        if fmt == 'json':
+            return _generate_json_feed(entries, title, description, link, language, hub_url)
         
-        # Добавляем элементы в ленту
-        for item in items:
-            # Устанавливаем дату публикации (с учетом временной зоны)
-            pubdate = item.published
-            if pubdate and pubdate.tzinfo is None:
-                pubdate = pubdate.replace(tzinfo=pytz.UTC)
-            elif not pubdate:
-                pubdate = datetime.utcnow().replace(tzinfo=pytz.UTC)
-                
-            feed.add_item(
-                title=item.title,
-                link=item.link,
-                description=item.description,
-                pubdate=pubdate,
-                unique_id=item.guid or item.link
-            )
-            
-        # Генерируем XML
-        return feed.writeString('utf-8')
+        feed_class = WebSubAtomFeed if fmt == 'atom' else WebSubRssFeed
+        return _generate_xml_feed(feed_class, entries, title, description, link, language, hub_url)
     except Exception as e:
         logger.error(f"Error generating feed: {str(e)}")
         return None
 
 
-def generate_aggregated_feed(aggregated_feed, base_url, limit=50):
+def _render_cached(key, version, render):
     """
-    Создает агрегированную RSS-ленту
+    Возвращает документ из общего кеша или собирает его заново
     
     Args:
-        aggregated_feed (AggregatedFeed): Объект агрегированной ленты
+        key (tuple): Ключ ленты и формата
+        version (tuple): Текущая версия данных ленты
+        render (callable): Функция сборки документа
+    
+    Returns:
+        str: Представление ленты
+    """
+    payload = rendered_cache.get(key, version)
+    if payload is None:
+        payload = render()
+        if payload is not None:
+            rendered_cache.set(key, version, payload)
+    return payload
+
+
+def generate_feed_delta(since_id, base_url, limit=50, fmt='rss', feed=None, aggregated_feed=None):
+    """
+    Создает ленту только из элементов, добавленных после курсора
+    
+    Args:
+        since_id (int): ID последнего полученного клиентом элемента
         base_url (str): Базовый URL приложения
         limit (int): Ограничение количества элементов
+        fmt (str): Формат: 'rss', 'atom' или 'json'
+        feed (Feed, optional): Лента-источник
+        aggregated_feed (AggregatedFeed, optional): Агрегированная лента
         
     Returns:
-        str: XML-представление агрегированной ленты RSS
+        tuple: (документ или None, если новых элементов нет;
+                ID последнего элемента в ответе; есть ли еще новые элементы)
     """
-    from .aggregator import get_aggregated_feed_items
+    from .aggregator import get_feed_items_since
     
-    # Получаем элементы для агрегированной ленты
-    items = get_aggregated_feed_items(aggregated_feed, limit=limit)
+    # Запрашиваем на один элемент больше, чтобы узнать, есть ли продолжение
+    items = get_feed_items_since(since_id, limit + 1, feed=feed, aggregated_feed=aggregated_feed)
+    if not items:
+        return None, since_id, False
+    
+    has_more = len(items) > limit
+    items = items[:limit]
+    
+    if aggregated_feed is not None:
+        payload = generate_feed(
+            items,
+            aggregated_feed.name,
+            aggregated_feed.description or f"Aggregated feed: {aggregated_feed.name}",
+            f"{base_url}/feed/{aggregated_feed.slug}",
+            fmt=fmt,
+            base_url=base_url
+        )
+    else:
+        payload = generate_feed(
+            items,
+            feed.name,
+            f"Feed: {feed.name}",
+            f"{base_url}/source/{feed.id}",
+            fmt=fmt,
+            base_url=base_url
+        )
+    
+    return payload, items[-1].id, has_more
+
+
+def generate_aggregated_feed(aggregated_feed, base_url, limit=50, fmt='rss', version=None):
+    """
+    Создает агрегированную ленту
+    
+    Args:
+        aggregated_feed (AggregatedFeed): Объект агрегированной ленты
+        base_url (str): Базовый URL приложения
+        limit (int): Ограничение количества элементов
+        fmt (str): Формат: 'rss', 'atom' или 'json'
+        version (tuple, optional): Версия из aggregated_feed_version, если
+            уже вычислена для этого запроса
+    
+    Returns:
+        str: Представление агрегированной ленты
+    """
+    from .aggregator import stream_aggregated_feed_entries, aggregated_feed_version
     
     # Формируем ссылку на ленту
     link = f"{base_url}/feed/{aggregated_feed.slug}"
     
-    # Генерируем ленту
-    return generate_feed(
-        items, 
-        aggregated_feed.name, 
-        aggregated_feed.description or f"Aggregated feed: {aggregated_feed.name}",
-        link
-    )
+    def render():
+        # Получаем элементы для агрегированной ленты (только нужные колонки, частями)
+        items = stream_aggregated_feed_entries(aggregated_feed, limit)
+        
+        # Генерируем ленту
+        return generate_feed(
+            items,
+            aggregated_feed.name,
+            aggregated_feed.description or f"Aggregated feed: {aggregated_feed.name}",
+            link,
+            fmt=fmt,
+            base_url=base_url
+        )
+    
+    if version is None:
+        version = aggregated_feed_version(aggregated_feed)[1]
+    return _render_cached(('aggregate', aggregated_feed.id, fmt, limit, base_url), version, render)
 
 
-def generate_single_feed(feed, base_url, limit=50):
+def generate_single_feed(feed, base_url, limit=50, fmt='rss'):
     """
-    Создает RSS-ленту для одиночного источника
+    Создает ленту для одиночного источника
     
     Args:
         feed (Feed): Объект ленты
         base_url (str): Базовый URL приложения
         limit (int): Ограничение количества элементов
-        
+        fmt (str): Формат: 'rss', 'atom' или 'json'
+    
     Returns:
-        str: XML-представление ленты RSS
+        str: Представление ленты
     """
-    # Получаем элементы для ленты
-    items = FeedItem.query.filter_by(feed_id=feed.id).order_by(FeedItem.published.desc()).limit(limit).all()
+    from .aggregator import stream_feed_entries
     
     # Формируем ссылку на ленту
     link = f"{base_url}/source/{feed.id}"
     
-    # Генерируем ленту
-    return generate_feed(
-        items, 
-        feed.name, 
-        f"Feed: {feed.name}", 
-        link
-    )
\ No newline at end of file
+    def render():
+        # Получаем элементы для ленты (только нужные колонки, частями)
+        items = stream_feed_entries(feed, limit)
+        
+        # Генерируем ленту
+        return generate_feed(
+            items,
+            feed.name,
+            f"Feed: {feed.name}",
+            link,
+            fmt=fmt,
+            base_url=base_url
+        )
+    
+    version = (
+        feed.name,
+        db.session.query(func.max(FeedItem.id)).filter(FeedItem.feed_id == feed.id).scalar(),
+        feed.items_version
+    )
+    return _render_cached(('source', feed.id, fmt, limit, base_url), version, render)
@@ -0,0 +1,331 @@
+import logging
+import socket
+import threading
+import time
+
+from flask import current_app
+
+from .metrics import metrics
+from .politeness import get_governor, FetchError, WaitInterrupted
+
+logger = logging.getLogger(__name__)
+
+# Состояние загрузок в текущем потоке. Функции загрузки по соглашению модуля
+# возвращают None при ошибке, а причину сохраняют здесь, чтобы update_feed мог
+# сохранить класс ошибки в состоянии ленты. Здесь же накапливается объем
+# прочитанных данных и время загрузок и хранится событие отмены загрузок потока.
+_thread_state = threading.local()
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ResponseTooLarge(FetchError):
+    """Тело ответа превышает допустимый размер"""
+
+
+class DeadlineExceeded(FetchError):
+    """Загрузка не уложилась в общий лимит времени"""
+
+
+class UnexpectedContentType(FetchError):
+    """Тип ответа не тот, который ожидался (по умолчанию HTML или XML)"""
+
+
+class Cancelled(FetchError):
+    """Загрузка отменена: ее результат больше никому не нужен"""
+
+
+class FetchResult:
+    """Результат загрузки: тело ответа, прочитанное целиком, и его метаданные"""
+
+    def __init__(self, url, status_code, headers, content, encoding, elapsed):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.elapsed = elapsed
+
+    @property
+    def bytes_read(self):
+        """Количество прочитанных байт тела"""
+        return len(self.content)
+
+    @property
+    def text(self):
+        """Тело ответа, декодированное по charset из заголовка или по содержимому"""
+        encoding = self.encoding
+        if not encoding:
+            from requests.compat import chardet
+            encoding = chardet.detect(self.content)['encoding'] or 'utf-8'
+        try:
+            return self.content.decode(encoding, errors='replace')
+        except LookupError:
+            return self.content.decode('utf-8', errors='replace')
+
+
+def record_error(error):
+    """
+    Запоминает ошибку загрузки или разбора для текущего потока
+
+    Args:
+        error (Exception): Исключение
+    """
+    _thread_state.error = (type(error).__name__, str(error))
+
+
+def pop_last_error():
+    """
+    Возвращает и сбрасывает последнюю ошибку текущего потока
+
+    Returns:
+        tuple: (класс ошибки, сообщение) или None
+    """
+    error = getattr(_thread_state, 'error', None)
+    _thread_state.error = None
+    return error
+
+
+def record_bytes(count):
+    """Учитывает прочитанные байты в счетчике текущего потока и в метриках"""
+    _thread_state.bytes_read = getattr(_thread_state, 'bytes_read', 0) + count
+    metrics.observe('fetch.bytes', count)
+
+
+def record_fetch_time(seconds):
+    """Учитывает время загрузки в счетчике текущего потока"""
+    _thread_state.fetch_seconds = getattr(_thread_state, 'fetch_seconds', 0.0) + seconds
+
+
+def fetch_counters():
+    """
+    Возвращает счетчики текущего потока, не сбрасывая их
+
+    Разница двух снимков - объем и время загрузок между ними, поэтому
+    вложенные замеры не мешают друг другу (в отличие от pop_bytes_read).
+
+    Returns:
+        tuple: (прочитано байт, секунд загрузки)
+    """
+    return getattr(_thread_state, 'bytes_read', 0), getattr(_thread_state, 'fetch_seconds', 0.0)
+
+
+def pop_bytes_read():
+    """
+    Возвращает и сбрасывает объем данных, прочитанных текущим потоком
+
+    Returns:
+        int: Количество байт
+    """
+    count = getattr(_thread_state, 'bytes_read', 0)
+    _thread_state.bytes_read = 0
+    return count
+
+
+def set_cancel_event(event):
+    """
+    Связывает загрузки текущего потока с событием отмены
+
+    Args:
+        event (threading.Event): Событие; None - загрузки не отменяются
+    """
+    _thread_state.cancel_event = event
+
+
+def get_cancel_event():
+    """
+    Возвращает событие отмены загрузок текущего потока
+
+    Returns:
+        threading.Event: Событие или None
+    """
+    return getattr(_thread_state, 'cancel_event', None)
+
+
+def check_cancelled(url):
+    """
+    Прерывает работу потока, если его загрузки отменены
+
+    Args:
+        url (str): Адрес для сообщения об ошибке
+
+    Raises:
+        Cancelled: Если событие отмены потока установлено
+    """
+    event = getattr(_thread_state, 'cancel_event', None)
+    if event is not None and event.is_set():
+        raise Cancelled(f"Download of {url} cancelled")
+
+
+def cancellable_sleep(seconds, url):
+    """
+    Пауза, которую прерывает отмена загрузок потока
+
+    Args:
+        seconds (float): Длительность паузы
+        url (str): Адрес для сообщения об ошибке
+
+    Raises:
+        Cancelled: Если загрузки отменены до окончания паузы
+    """
+    event = getattr(_thread_state, 'cancel_event', None)
+    if event is None:
+        time.sleep(seconds)
+    elif event.wait(seconds):
+        raise Cancelled(f"Download of {url} cancelled")
+
+
+def is_markup_type(content_type):
+    """
+    Проверяет, что Content-Type относится к HTML или XML
+
+    Args:
+        content_type (str): Значение заголовка Content-Type
+
+    Returns:
+        bool: True для HTML/XML и для ответов без Content-Type
+    """
+    if not content_type:
+        return True
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return (
+        media_type in ('text/html', 'text/plain', 'application/xhtml+xml')
+        or media_type.endswith('/xml')
+        or media_type.endswith('+xml')
+    )
+
+
+def _iter_body(response, url, started, timeout, deadline):
+    """
+    Читает тело ответа фрагментами, не выходя за общий лимит времени
+
+    Каждое чтение возвращает то, что уже пришло (read1), а таймаут сокета
+    перед чтением сокращается до времени, оставшегося до deadline, поэтому
+    сервер, отдающий данные по нескольку байт, не растянет загрузку.
+
+    Raises:
+        DeadlineExceeded: Если лимит времени исчерпан
+        requests.ReadTimeout: Если сервер молчит дольше timeout
+    """
+    import requests
+    from urllib3.exceptions import ReadTimeoutError
+
+    raw = response.raw
+    connection = raw.connection
+    sock = getattr(connection, 'sock', None)
+    while True:
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Download of {url} exceeded {deadline}s")
+        if sock is not None:
+            sock.settimeout(min(timeout, remaining))
+        try:
+            chunk = raw.read1(CHUNK_SIZE, decode_content=True)
+        except (ReadTimeoutError, socket.timeout) as e:
+            if time.monotonic() - started >= deadline:
+                raise DeadlineExceeded(f"Download of {url} exceeded {deadline}s")
+            raise requests.ReadTimeout(str(e))
+        if not chunk:
+            return
+        yield chunk
+
+
+def fetch_url(url, headers=None, timeout=15, max_bytes=None, deadline=None, accept=None,
+              governor=None, check_robots=True):
+    """
+    Загружает URL с соблюдением ограничений регулятора запросов
+
+    Перед запросом ждет слота для хоста (лимит скорости, robots.txt,
+    Retry-After), после запроса сообщает регулятору статус ответа.
+    Тело читается потоком: загрузка прерывается, если тип ответа не подходит,
+    превышает max_bytes или не укладывается в общий лимит времени deadline
+    (таймаут timeout действует на отдельные операции чтения сокета, deadline -
+    на всю загрузку тела, в том числе внутри чтения, см. _iter_body).
+    Если загрузки потока отменены (set_cancel_event), чтение прерывается
+    после очередного фрагмента, а ожидание слота у регулятора - сразу.
+
+    Args:
+        url (str): Адрес
+        headers (dict, optional): Дополнительные заголовки
+        timeout (int): Таймаут соединения и чтения сокета, секунд
+        max_bytes (int, optional): Лимит размера тела, по умолчанию FETCH_MAX_BYTES
+        deadline (int, optional): Лимит времени загрузки, по умолчанию FETCH_DEADLINE
+        accept (tuple, optional): Допустимые префиксы типа ответа (например,
+            ('image/',)); по умолчанию допускаются только HTML и XML
+        governor (HostGovernor, optional): Регулятор, по умолчанию - регулятор процесса
+        check_robots (bool): Проверять ли адрес по robots.txt
+
+    Returns:
+        FetchResult: Успешный ответ
+
+    Raises:
+        FetchError: Если запрос отклонен регулятором или прерван по лимиту
+        requests.RequestException: Если запрос не удался
+    """
+    import requests
+
+    config = current_app.config
+    max_bytes = max_bytes or config['FETCH_MAX_BYTES']
+    deadline = deadline or config['FETCH_DEADLINE']
+
+    request_headers = {'User-Agent': config['FETCH_USER_AGENT']}
+    request_headers.update(headers or {})
+
+    check_cancelled(url)
+    governor = governor or get_governor()
+    try:
+        governor.acquire(url, cancel_event=get_cancel_event(), check_robots=check_robots)
+    except WaitInterrupted:
+        check_cancelled(url)
+        raise
+    check_cancelled(url)
+
+    started = time.monotonic()
+    bytes_read = 0
+    try:
+        response = requests.get(url, headers=request_headers, timeout=timeout, stream=True)
+    except Exception:
+        record_fetch_time(time.monotonic() - started)
+        raise
+    try:
+        governor.register_response(url, response.status_code, response.headers)
+        response.raise_for_status()
+
+        content_type = response.headers.get('Content-Type')
+        if accept is not None:
+            type_ok = (content_type or '').split(';', 1)[0].strip().lower().startswith(accept)
+        else:
+            type_ok = is_markup_type(content_type)
+        if not type_ok:
+            raise UnexpectedContentType(f"Unexpected content type {content_type} for {url}")
+
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ResponseTooLarge(f"Response for {url} is {content_length} bytes, limit is {max_bytes}")
+
+        chunks = []
+        for chunk in _iter_body(response, url, started, timeout, deadline):
+            bytes_read += len(chunk)
+            if bytes_read > max_bytes:
+                raise ResponseTooLarge(f"Response for {url} exceeds {max_bytes} bytes")
+            check_cancelled(url)
+            chunks.append(chunk)
+
+        # requests подставляет ISO-8859-1 для text/* без charset, поэтому
+        # кодировке доверяем, только если она явно указана в заголовке
+        encoding = response.encoding if 'charset' in (content_type or '').lower() else None
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Fetched {url}: {bytes_read} bytes in {elapsed:.2f}s")
+        return FetchResult(
+            url=response.url,
+            status_code=response.status_code,
+            headers=response.headers,
+            content=b''.join(chunks),
+            encoding=encoding,
+            elapsed=elapsed
+        )
+    finally:
+        response.close()
+        record_bytes(bytes_read)
+        record_fetch_time(time.monotonic() - started)
@@ -0,0 +1,203 @@
+import logging
+import re
+import zlib
+
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+# Оборванный тег в конце обрезанного HTML: '<' с буквой или '/' и без '>'.
+# Одиночный '<' в тексте ("a < b") тегом не считается
+_PARTIAL_TAG = re.compile(r'<[a-zA-Z/][^<>]*$')
+# '<', который не начинает тег или комментарий: экранируется, чтобы
+# striptags не удалил текст до следующего '>'
+_STRAY_LT = re.compile(r'<(?![a-zA-Z/!])')
+
+
+def plain_text(html):
+    """
+    Текст описания без разметки
+
+    Args:
+        html (str): HTML описания (может быть обрезан посреди тега)
+
+    Returns:
+        str: Текст
+    """
+    html = _STRAY_LT.sub('&lt;', _PARTIAL_TAG.sub('', html or ''))
+    return Markup(html).striptags()
+
+
+def make_excerpt(html, length):
+    """
+    Текст описания без разметки, обрезанный по границе слова
+
+    Args:
+        html (str): HTML описания (может быть обрезан посреди тега)
+        length (int): Максимальная длина текста
+
+    Returns:
+        str: Текст с многоточием, если он был обрезан
+    """
+    text = plain_text(html)
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(' ', 1)[0] + '…'
+
+
+def _zstd():
+    """Модуль zstandard или None, если он не установлен"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def compress_body(html):
+    """
+    Сжимает описание элемента кодеком из конфигурации
+
+    zstd - необязательная зависимость (пакет zstandard): без нее
+    используется zlib.
+
+    Args:
+        html (str): HTML описания
+
+    Returns:
+        tuple: (кодек, сжатые данные)
+    """
+    data = html.encode('utf-8')
+    if current_app.config['ITEM_BODY_CODEC'] == 'zstd':
+        zstandard = _zstd()
+        if zstandard is not None:
+            return 'zstd', zstandard.ZstdCompressor(level=10).compress(data)
+    return 'zlib', zlib.compress(data, 6)
+
+
+def decompress_body(codec, data):
+    """
+    Восстанавливает описание элемента
+
+    Args:
+        codec (str): 'zlib' или 'zstd'
+        data (bytes): Сжатые данные
+
+    Returns:
+        str: HTML описания
+    """
+    if codec == 'zstd':
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read bodies compressed with zstd')
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return zlib.decompress(data).decode('utf-8')
+
+
+def split_description(html):
+    """
+    Решает, где хранить описание элемента
+
+    Короткие описания остаются в FeedItem.description как есть. Длинные
+    сжимаются в ItemBody вместе с полным текстом без разметки для правил по
+    ключевым словам, а в строке элемента остается короткий текст для списков.
+
+    Args:
+        html (str): HTML описания
+
+    Returns:
+        tuple: (значение FeedItem.description, ItemBody или None)
+    """
+    from .storage import ItemBody
+
+    config = current_app.config
+    if not html or len(html) <= config['ITEM_BODY_INLINE_MAX']:
+        return html, None
+    codec, data = compress_body(html)
+    body = ItemBody(codec=codec, size=len(html.encode('utf-8')), data=data, text=plain_text(html))
+    return make_excerpt(html, config['ITEM_BODY_EXCERPT_LENGTH']), body
+
+
+def set_item_description(item, html):
+    """
+    Записывает описание элемента, вынося длинное в ItemBody
+
+    Args:
+        item (FeedItem): Элемент ленты
+        html (str): HTML описания
+    """
+    item.description, item.body = split_description(html)
+
+
+def full_description(item):
+    """
+    Возвращает полное описание элемента для сериализации ленты
+
+    Args:
+        item: FeedItem или строка с полями description и, если описание
+            вынесено, body_codec и body_data
+
+    Returns:
+        str: HTML описания
+    """
+    data = getattr(item, 'body_data', None)
+    if data is None:
+        return item.description
+    try:
+        return decompress_body(item.body_codec, data)
+    except Exception as e:
+        logger.error(f"Could not decompress body of item {item.id}: {str(e)}")
+        return item.description
+
+
+def compact_feed_bodies(feed, dry_run=False, batch_size=200):
+    """
+    Выносит длинные описания уже сохраненных элементов ленты в ItemBody
+
+    Заодно заполняет текст без разметки у описаний, вынесенных до его
+    появления, иначе правила по ключевым словам видят у них только начало.
+
+    Args:
+        feed (Feed): Лента-источник
+        dry_run (bool): Только посчитать
+        batch_size (int): Сколько элементов обрабатывать за транзакцию
+
+    Returns:
+        tuple: (вынесено описаний, байт описаний до, байт в строках и
+            сжатых данных после)
+    """
+    from .storage import db, FeedItem, ItemBody
+
+    inline_max = current_app.config['ITEM_BODY_INLINE_MAX']
+    query = db.session.query(FeedItem.id).filter(
+        FeedItem.feed_id == feed.id,
+        func.length(FeedItem.description) > inline_max,
+        ~db.session.query(ItemBody.item_id).filter(ItemBody.item_id == FeedItem.id).exists()
+    ).order_by(FeedItem.id)
+    ids = [item_id for (item_id,) in query]
+
+    moved = before = after = 0
+    for start in range(0, len(ids), batch_size):
+        for item in FeedItem.query.filter(FeedItem.id.in_(ids[start:start + batch_size])):
+            html = item.description
+            before += len(html.encode('utf-8'))
+            description, body = split_description(html)
+            after += len(description.encode('utf-8')) + len(body.data)
+            moved += 1
+            if not dry_run:
+                item.description, item.body = description, body
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+
+    if not dry_run:
+        bodies = ItemBody.query.join(FeedItem, FeedItem.id == ItemBody.item_id) \
+                               .filter(FeedItem.feed_id == feed.id, ItemBody.text.is_(None))
+        for body in bodies.yield_per(batch_size):
+            body.text = plain_text(decompress_body(body.codec, body.data))
+        db.session.commit()
+    return moved, before, after
+
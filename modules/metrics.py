@@ -0,0 +1,53 @@
+import threading
+
+
+class Metrics:
+    """
+    Простейший реестр метрик процесса
+
+    Хранит счетчики и сводки наблюдений (количество, сумма, максимум).
+    Снимок доступен через /api/metrics.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._summaries = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        """Увеличивает счетчик"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Добавляет наблюдение (например, время ожидания в секундах)"""
+        with self._lock:
+            summary = self._summaries.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0})
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['max'] = max(summary['max'], value)
+
+    def snapshot(self):
+        """
+        Возвращает текущие значения метрик
+
+        Returns:
+            dict: Счетчики и сводки наблюдений со средним значением
+        """
+        with self._lock:
+            summaries = {}
+            for name, summary in self._summaries.items():
+                summaries[name] = dict(summary, avg=summary['sum'] / summary['count'] if summary['count'] else 0.0)
+            return {
+                'counters': dict(self._counters),
+                'summaries': summaries
+            }
+
+    def reset(self):
+        """Сбрасывает все метрики"""
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,393 @@
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from email.utils import format_datetime
+from xml.etree import ElementTree
+
+from flask import current_app
+
+from .storage import db, Feed, AggregatedFeed, ImportJob
+
+logger = logging.getLogger(__name__)
+
+# Сколько ошибок проверки сохранять в задаче импорта
+MAX_REPORTED_ERRORS = 100
+
+# Группа экспорта с агрегированными лентами приложения
+AGGREGATES_GROUP = 'Агрегированные ленты'
+
+
+def parse_opml(content):
+    """
+    Извлекает источники из OPML
+
+    Группа верхнего уровня (outline без xmlUrl) считается категорией;
+    вложенные группы относятся к категории верхнего уровня.
+
+    Args:
+        content (bytes | str): Документ OPML
+
+    Returns:
+        list: Словари с ключами url, title, category (None вне групп)
+
+    Raises:
+        ValueError: Если документ не является OPML
+    """
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError as e:
+        raise ValueError(f"Invalid OPML: {str(e)}")
+
+    body = root.find('body')
+    if root.tag != 'opml' or body is None:
+        raise ValueError("Invalid OPML: no <opml><body>")
+
+    entries = []
+
+    def walk(node, category):
+        for outline in node.findall('outline'):
+            title = (outline.get('title') or outline.get('text') or '').strip()
+            url = (outline.get('xmlUrl') or outline.get('xmlurl') or '').strip()
+            if url:
+                entries.append({'url': url, 'title': title, 'category': category})
+            else:
+                walk(outline, category or title or None)
+
+    walk(body, None)
+    return entries
+
+
+def interleave_hosts(entries):
+    """
+    Переупорядочивает источники по кругу между хостами
+
+    Регулятор запросов ограничивает скорость для каждого хоста, поэтому
+    источники одного хоста подряд заняли бы все потоки проверки ожиданием.
+
+    Args:
+        entries (list): Источники с ключом url
+
+    Returns:
+        list: Те же источники: первый каждого хоста, затем второй и т.д.
+    """
+    from .politeness import HostGovernor
+
+    by_host = OrderedDict()
+    for entry in entries:
+        by_host.setdefault(HostGovernor.host_of(entry['url']), []).append(entry)
+
+    result = []
+    queues = [list(reversed(queue)) for queue in by_host.values()]
+    while queues:
+        for queue in queues:
+            result.append(queue.pop())
+        queues = [queue for queue in queues if queue]
+    return result
+
+
+def _validate(app, entry):
+    """
+    Загружает и разбирает ленту источника (выполняется в пуле)
+
+    Returns:
+        tuple: (источник, данные ленты или None, (класс ошибки, сообщение) или None)
+    """
+    from .aggregator import fetch_rss_feed
+    from .fetcher import pop_last_error
+
+    with app.app_context():
+        pop_last_error()
+        try:
+            feed_data = fetch_rss_feed(entry['url'])
+        except Exception as e:
+            return entry, None, (type(e).__name__, str(e))
+        if feed_data:
+            return entry, feed_data, None
+        return entry, None, pop_last_error() or ('NoData', 'Не удалось загрузить или распознать ленту')
+
+
+def _first_update(app, feed_id):
+    """Первое обновление ленты, созданной без проверки (выполняется в пуле)"""
+    from .aggregator import update_feed
+
+    with app.app_context():
+        try:
+            feed = Feed.query.get(feed_id)
+            return feed is not None and update_feed(feed)
+        finally:
+            db.session.remove()
+
+
+class _Importer:
+    """Состояние одного импорта: задача, найденные агрегаты и ошибки"""
+
+    def __init__(self, job):
+        self.job = job
+        self.errors = job.get_errors()
+        self.aggregates = {}
+        self.unfetched = []
+
+    def add_error(self, url, error):
+        self.job.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'url': url, 'error': error})
+
+    def save_progress(self):
+        self.job.set_errors(self.errors)
+        db.session.commit()
+
+    def aggregate_for(self, category):
+        """Возвращает агрегированную ленту категории, создавая ее при необходимости"""
+        from slugify import slugify
+
+        if category not in self.aggregates:
+            aggregate = AggregatedFeed.query.filter_by(name=category).first()
+            if aggregate is None:
+                slug = slugify(category) or 'opml'
+                if AggregatedFeed.query.filter_by(slug=slug).first():
+                    slug = f"{slug}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                aggregate = AggregatedFeed(name=category[:200], slug=slug, description='Импортировано из OPML')
+                db.session.add(aggregate)
+            self.aggregates[category] = aggregate
+        return self.aggregates[category]
+
+    def flush(self, batch):
+        """
+        Создает ленты одной пачкой и сохраняет первые элементы
+
+        Args:
+            batch (list): Пары (источник, данные ленты или None)
+        """
+        from .aggregator import update_feed
+
+        if not batch:
+            return
+
+        feeds = []
+        for entry, feed_data in batch:
+            name = entry['title'] or (feed_data or {}).get('title') or entry['url']
+            feed = Feed(name=name[:200], url=entry['url'], feed_type='rss', active=True, included_in_aggregate=True)
+            if entry['category']:
+                self.aggregate_for(entry['category']).feeds.append(feed)
+            feeds.append(feed)
+        db.session.add_all(feeds)
+        self.job.created += len(feeds)
+        self.save_progress()
+
+        # Ленты, загруженные при проверке, получают элементы сразу, без
+        # повторной загрузки; остальные обновляются после создания всех лент
+        for feed, (_, feed_data) in zip(feeds, batch):
+            if feed_data is None:
+                self.unfetched.append(feed.id)
+            elif update_feed(feed, feed_data=feed_data):
+                self.job.fetched += 1
+        self.save_progress()
+
+
+def run_import(app, job_id, entries):
+    """
+    Выполняет импорт источников (в фоновом потоке)
+
+    Источники, которые уже есть в БД, повторяются в файле или указывают на
+    ленты самого приложения, пропускаются. При включенной проверке ленты
+    загружаются пулом из OPML_IMPORT_WORKERS потоков через регулятор
+    запросов (лимиты по хостам и robots.txt); ленты, которые не удалось
+    проверить из-за переполненной очереди к хосту, создаются без проверки.
+    Ленты создаются пачками по OPML_IMPORT_BATCH, а источники из групп OPML
+    добавляются в агрегированные ленты с именами групп.
+
+    Args:
+        app (Flask): Экземпляр приложения
+        job_id (int): ID задачи импорта
+        entries (list): Источники из parse_opml
+    """
+    with app.app_context():
+        config = app.config
+        job = ImportJob.query.get(job_id)
+        importer = _Importer(job)
+        try:
+            own_prefix = config['BASE_URL'].rstrip('/') + '/'
+            seen = {url for (url,) in db.session.query(Feed.url)}
+            pending = []
+            for entry in entries:
+                if entry['url'] in seen or entry['url'].startswith(own_prefix):
+                    job.duplicates += 1
+                elif not entry['url'].startswith(('http://', 'https://')):
+                    importer.add_error(entry['url'], 'Unsupported URL scheme')
+                else:
+                    seen.add(entry['url'])
+                    pending.append(entry)
+            job.processed = len(entries) - len(pending)
+            job.status = 'validating' if job.validate else 'fetching'
+            importer.save_progress()
+
+            batch = []
+            if job.validate:
+                with ThreadPoolExecutor(max_workers=config['OPML_IMPORT_WORKERS']) as executor:
+                    futures = [executor.submit(_validate, app, entry) for entry in interleave_hosts(pending)]
+                    for future in as_completed(futures):
+                        entry, feed_data, error = future.result()
+                        job.processed += 1
+                        if error is None or error[0] == 'HostSaturated':
+                            batch.append((entry, feed_data))
+                        else:
+                            importer.add_error(entry['url'], f"{error[0]}: {error[1]}"[:300])
+                        if len(batch) >= config['OPML_IMPORT_BATCH']:
+                            importer.flush(batch)
+                            batch = []
+                        elif job.processed % 50 == 0:
+                            importer.save_progress()
+            else:
+                batch = [(entry, None) for entry in pending]
+                job.processed = len(entries)
+            importer.flush(batch)
+
+            # Первая загрузка лент, созданных без проверки
+            job.status = 'fetching'
+            importer.save_progress()
+            if importer.unfetched:
+                with ThreadPoolExecutor(max_workers=config['OPML_IMPORT_WORKERS']) as executor:
+                    for success in executor.map(lambda feed_id: _first_update(app, feed_id), importer.unfetched):
+                        if success:
+                            job.fetched += 1
+
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"OPML import {job_id} failed: {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)[:500]
+
+        job.finished_at = datetime.utcnow()
+        importer.save_progress()
+        logger.info(f"OPML import {job_id}: {job.created} feeds created, {job.invalid} invalid, "
+                    f"{job.duplicates} duplicates")
+
+
+# Импорты выполняются по одному в отдельном потоке
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='opml-import')
+
+
+def start_import(content, validate=True):
+    """
+    Разбирает OPML и запускает импорт в фоне
+
+    Args:
+        content (bytes | str): Документ OPML
+        validate (bool): Проверять ли ленты перед созданием
+
+    Returns:
+        ImportJob: Задача импорта
+
+    Raises:
+        ValueError: Если документ не является OPML или слишком велик
+    """
+    if len(content) > current_app.config['OPML_MAX_BYTES']:
+        raise ValueError(f"OPML is larger than {current_app.config['OPML_MAX_BYTES']} bytes")
+    entries = parse_opml(content)
+
+    job = ImportJob(status='pending', validate=validate, total=len(entries))
+    db.session.add(job)
+    db.session.commit()
+
+    _background.submit(run_import, current_app._get_current_object(), job.id, entries)
+    return job
+
+
+def import_progress(job):
+    """
+    Описывает состояние задачи импорта для API
+
+    Args:
+        job (ImportJob): Задача импорта
+
+    Returns:
+        dict: Счетчики, статус и первые ошибки проверки
+    """
+    elapsed = ((job.finished_at or datetime.utcnow()) - job.created_at).total_seconds()
+    return {
+        'id': job.id,
+        'status': job.status,
+        'validate': bool(job.validate),
+        'total': job.total,
+        'processed': job.processed,
+        'created': job.created,
+        'duplicates': job.duplicates,
+        'invalid': job.invalid,
+        'fetched': job.fetched,
+        'percent': round(100 * job.processed / job.total, 1) if job.total else 100.0,
+        'elapsed_seconds': round(elapsed, 1),
+        'error': job.error,
+        'errors': job.get_errors()
+    }
+
+
+def _feed_outline(parent, feed, base_url):
+    """Добавляет в OPML элемент источника"""
+    attrs = {'type': 'rss', 'text': feed.name, 'title': feed.name}
+    if feed.feed_type == 'rss':
+        attrs['xmlUrl'] = feed.url
+    else:
+        # Для парсинга и sitemap лентой является лента, которую отдает приложение
+        attrs['xmlUrl'] = f"{base_url}/source/{feed.id}"
+        attrs['htmlUrl'] = feed.url
+    ElementTree.SubElement(parent, 'outline', attrs)
+
+
+def export_opml(base_url):
+    """
+    Выгружает источники и агрегированные ленты в OPML
+
+    Источники из агрегированных лент группируются по их именам (источник
+    из нескольких агрегатов попадает в каждую группу), остальные находятся
+    на верхнем уровне. Состав группы - те же активные источники, что и в
+    ленте агрегата: выбранные вручную и подходящие под правила по типу и
+    меткам. Отдельная группа содержит ленты самих агрегатов.
+
+    Args:
+        base_url (str): Базовый URL приложения
+
+    Returns:
+        str: Документ OPML 2.0
+    """
+    root = ElementTree.Element('opml', {'version': '2.0'})
+    head = ElementTree.SubElement(root, 'head')
+    ElementTree.SubElement(head, 'title').text = current_app.config['RSS_FEED_TITLE']
+    ElementTree.SubElement(head, 'dateCreated').text = format_datetime(datetime.utcnow(), usegmt=False)
+    body = ElementTree.SubElement(root, 'body')
+
+    from .aggregator import aggregated_sources_condition
+
+    feeds = {feed.id: feed for feed in Feed.query.order_by(Feed.name)}
+    aggregates = AggregatedFeed.query.order_by(AggregatedFeed.name).all()
+
+    grouped = set()
+    for aggregate in aggregates:
+        feed_ids = [feed_id for (feed_id,) in db.session.query(Feed.id).filter(
+            Feed.active.is_(True),
+            aggregated_sources_condition(aggregate)
+        )]
+        if not feed_ids:
+            continue
+        group = ElementTree.SubElement(body, 'outline', {'text': aggregate.name, 'title': aggregate.name})
+        for feed_id in sorted(feed_ids, key=lambda feed_id: feeds[feed_id].name):
+            _feed_outline(group, feeds[feed_id], base_url)
+        grouped.update(feed_ids)
+
+    for feed in feeds.values():
+        if feed.id not in grouped:
+            _feed_outline(body, feed, base_url)
+
+    active = [aggregate for aggregate in aggregates if aggregate.active]
+    if active:
+        group = ElementTree.SubElement(body, 'outline', {'text': AGGREGATES_GROUP, 'title': AGGREGATES_GROUP})
+        for aggregate in active:
+            ElementTree.SubElement(group, 'outline', {
+                'type': 'rss',
+                'text': aggregate.name,
+                'title': aggregate.name,
+                'xmlUrl': f"{base_url}/feed/{aggregate.slug}"
+            })
+
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ElementTree.tostring(root, encoding='unicode')
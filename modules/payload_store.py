@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(content):
+    """
+    Вычисляет хеш тела ответа
+
+    Args:
+        content (bytes | str): Тело ответа
+
+    Returns:
+        str: SHA-256 в шестнадцатеричном виде
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+class PayloadStore:
+    """
+    Хранилище последних загруженных тел ответов на диске
+
+    Файлы адресуются хешем содержимого (одинаковые ответы разных лент и
+    разных запусков хранятся один раз) и сжимаются gzip. Когда общий объем
+    превышает max_bytes, удаляются файлы, которые дольше всего не читались
+    и не записывались, поэтому в хранилище остаются последние тела ответов.
+    """
+
+    # Расширение файлов; подклассы с другим форматом файлов меняют его
+    # вместе с _encode и _decode
+    SUFFIX = '.gz'
+
+    # Доля лимита, до которой освобождается хранилище: следующий обход
+    # диска нужен только после записи еще 10% лимита, а не на каждом put
+    LOW_WATER = 0.9
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._total = None
+        self._lock = threading.Lock()
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], f'{digest}{self.SUFFIX}')
+
+    def _encode(self, content):
+        """Преобразует содержимое перед записью в файл"""
+        return gzip.compress(content, compresslevel=6)
+
+    def _decode(self, data):
+        """Восстанавливает содержимое, прочитанное из файла"""
+        return gzip.decompress(data)
+
+    def put(self, content, digest=None):
+        """
+        Сохраняет тело ответа
+
+        Args:
+            content (bytes | str): Тело ответа
+            digest (str, optional): Заранее вычисленный хеш
+
+        Returns:
+            str: Хеш содержимого
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        digest = digest or content_hash(content)
+        path = self._path(digest)
+
+        if os.path.exists(path):
+            # Такое тело уже есть - только отмечаем использование
+            os.utime(path)
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._encode(content))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total is not None:
+                self._total += os.path.getsize(path)
+            self._evict(keep=path)
+        return digest
+
+    def get(self, digest):
+        """
+        Читает тело ответа по хешу
+
+        Args:
+            digest (str): Хеш содержимого (ключ файла)
+
+        Returns:
+            bytes: Тело ответа или None, если оно уже вытеснено
+        """
+        if not digest:
+            return None
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                content = self._decode(f.read())
+            os.utime(path)
+            return content
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError) as e:
+            logger.warning(f"Corrupted payload {digest}: {str(e)}")
+            return None
+
+    def _files(self):
+        """Возвращает список (время использования, размер, путь) файлов хранилища"""
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(self.SUFFIX):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict(self, keep=None):
+        """Когда объем больше лимита, удаляет давно не использованные файлы до LOW_WATER лимита"""
+        if self._total is not None and self._total <= self.max_bytes:
+            return
+
+        # Хранилище может делить несколько процессов, поэтому перед
+        # вытеснением объем пересчитывается по диску
+        files = self._files()
+        self._total = sum(size for _, size, _ in files)
+        if self._total <= self.max_bytes:
+            return
+
+        started = time.monotonic()
+        removed = 0
+        low_water = self.max_bytes * self.LOW_WATER
+        for _, size, path in sorted(files):
+            if self._total <= low_water:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total -= size
+            removed += 1
+
+        logger.info(f"{type(self).__name__} evicted {removed} files in {time.monotonic() - started:.2f}s")
+
+    def size(self):
+        """
+        Возвращает объем хранилища
+
+        Returns:
+            tuple: (количество файлов, байт на диске)
+        """
+        files = self._files()
+        return len(files), sum(size for _, size, _ in files)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_payload_store():
+    """
+    Возвращает хранилище тел ответов, настроенное по конфигурации приложения
+
+    Returns:
+        PayloadStore: Хранилище или None, если оно отключено
+    """
+    global _store
+    config = current_app.config
+    if not config['PAYLOAD_STORE_ENABLED']:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PayloadStore(config['PAYLOAD_STORE_DIR'], config['PAYLOAD_STORE_MAX_BYTES'])
+    return _store
+
+
+def store_payload(content):
+    """
+    Сохраняет тело ответа в хранилище, если оно включено
+
+    Args:
+        content (bytes | str): Тело ответа
+
+    Returns:
+        str: Хеш содержимого
+    """
+    digest = content_hash(content)
+    store = get_payload_store()
+    if store is not None:
+        try:
+            store.put(content, digest)
+        except OSError as e:
+            # Хранилище - только оптимизация, его ошибки не мешают обновлению
+            logger.warning(f"Could not store payload {digest}: {str(e)}")
+    return digest
@@ -0,0 +1,360 @@
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from flask import current_app
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class FetchError(Exception):
+    """Загрузка страницы отклонена или не удалась"""
+
+
+class RobotsDisallowed(FetchError):
+    """Адрес запрещен для обхода в robots.txt"""
+
+
+class HostSaturated(FetchError):
+    """Очередь к хосту длиннее допустимого времени ожидания"""
+
+
+class WaitInterrupted(FetchError):
+    """Ожидание слота прервано отменой загрузки или остановкой процесса"""
+
+
+class HostState:
+    """Состояние ограничителя скорости для одного хоста"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        # Теоретическое время следующего запроса (алгоритм GCRA)
+        self.tat = 0.0
+        # До этого момента запросы к хосту запрещены (Retry-After)
+        self.blocked_until = 0.0
+        # Crawl-delay из robots.txt, секунд
+        self.crawl_delay = None
+
+
+class HostGovernor:
+    """
+    Регулятор запросов к внешним хостам
+
+    - ограничение скорости по хосту (token bucket в форме GCRA: rate
+      запросов в секунду с допустимой пачкой burst);
+    - кеш разобранных robots.txt с ограниченным временем жизни,
+      включая Crawl-delay;
+    - учет Retry-After в ответах 429 и 503;
+    - очередь: если хост занят, запрос ждет своего слота, а не падает;
+      ошибка возникает, только если ожидание длиннее max_wait.
+
+    robots.txt проверяется для того же User-Agent, с которым уходят запросы
+    (см. fetcher.fetch_url). Время ожидания попадает в метрики
+    governor.wait_seconds.
+    """
+
+    def __init__(self, rate=1.0, burst=3, host_limits=None, max_wait=60,
+                 robots_enabled=True, robots_ttl=3600, user_agent='*',
+                 retry_after_max=3600, robots_timeout=10, robots_max_bytes=512 * 1024):
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = host_limits or {}
+        self.max_wait = max_wait
+        self.robots_enabled = robots_enabled
+        self.robots_ttl = robots_ttl
+        self.robots_timeout = robots_timeout
+        self.robots_max_bytes = robots_max_bytes
+        self.user_agent = user_agent
+        self.retry_after_max = retry_after_max
+
+        self._hosts = {}
+        self._robots = {}
+        self._robots_locks = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    @staticmethod
+    def host_of(url):
+        """Возвращает хост (с портом) из URL"""
+        return urlparse(url).netloc.lower()
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+            state = self._hosts[host] = HostState(rate, burst)
+        return state
+
+    def reserve(self, host):
+        """
+        Резервирует ближайший слот для запроса к хосту
+
+        Args:
+            host (str): Хост
+
+        Returns:
+            float: Сколько секунд нужно подождать до запроса
+
+        Raises:
+            HostSaturated: Если ожидание превышает max_wait
+        """
+        with self._lock:
+            state = self._state(host)
+            now = time.monotonic()
+
+            interval = 1.0 / state.rate if state.rate > 0 else 0.0
+            tolerance = (state.burst - 1) * interval
+            if state.crawl_delay:
+                # Crawl-delay задает минимальный интервал без пачек
+                interval = max(interval, state.crawl_delay)
+                tolerance = 0.0
+
+            tat = max(state.tat, now, state.blocked_until)
+            allowed_at = max(tat - tolerance, now, state.blocked_until)
+            wait = allowed_at - now
+
+            if wait > self.max_wait:
+                metrics.increment('governor.saturated')
+                raise HostSaturated(f"Host {host} is saturated, wait would be {wait:.1f}s")
+
+            state.tat = tat + interval
+            return wait
+
+    def _sleep(self, seconds, cancel_event=None):
+        """
+        Пауза, которую прерывают close() и событие отмены
+
+        Returns:
+            bool: True, если пауза прервана
+        """
+        if cancel_event is None:
+            return self._closed.wait(seconds)
+        deadline = time.monotonic() + seconds
+        while not cancel_event.is_set() and not self._closed.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            cancel_event.wait(min(remaining, 0.5))
+        return True
+
+    def acquire(self, url, cancel_event=None, check_robots=True):
+        """
+        Ждет разрешения на запрос к URL
+
+        Args:
+            url (str): Адрес запроса
+            cancel_event (threading.Event, optional): Событие отмены загрузки,
+                прерывающее ожидание
+            check_robots (bool): Проверять ли адрес по robots.txt (не нужно
+                для загрузки самого robots.txt)
+
+        Returns:
+            float: Фактическое время ожидания, секунд
+
+        Raises:
+            RobotsDisallowed: Если адрес запрещен в robots.txt
+            HostSaturated: Если очередь к хосту слишком длинная
+            WaitInterrupted: Если ожидание прервано отменой или close()
+        """
+        host = self.host_of(url)
+
+        if check_robots and self.robots_enabled and not self.can_fetch(url):
+            metrics.increment('governor.robots_denied')
+            raise RobotsDisallowed(f"Disallowed by robots.txt: {url}")
+
+        wait = self.reserve(host)
+        if wait > 0 and self._sleep(wait, cancel_event):
+            raise WaitInterrupted(f"Wait for {host} interrupted")
+
+        metrics.observe('governor.wait_seconds', wait)
+        return wait
+
+    def register_response(self, url, status_code, headers):
+        """
+        Учитывает ответ сервера: при 429/503 блокирует хост на Retry-After
+
+        Args:
+            url (str): Адрес запроса
+            status_code (int): HTTP-статус
+            headers (Mapping): Заголовки ответа
+        """
+        if status_code not in (429, 503):
+            return
+
+        delay = parse_retry_after(headers.get('Retry-After'))
+        if delay is None:
+            # Сервер не сказал, сколько ждать - притормаживаем на минуту
+            delay = 60
+        delay = min(delay, self.retry_after_max)
+
+        host = self.host_of(url)
+        with self._lock:
+            state = self._state(host)
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+
+        metrics.increment('governor.retry_after')
+        logger.warning(f"Host {host} answered {status_code}, pausing requests for {delay:.0f}s")
+
+    def can_fetch(self, url):
+        """
+        Проверяет, разрешен ли адрес в robots.txt хоста
+
+        Args:
+            url (str): Адрес запроса
+
+        Returns:
+            bool: Разрешен ли обход
+        """
+        parts = urlparse(url)
+        host = parts.netloc.lower()
+        parser = self._get_robots(parts.scheme or 'http', host)
+        if parser is None:
+            return True
+        return parser.can_fetch(self.user_agent, url)
+
+    def site_maps(self, url):
+        """
+        Возвращает адреса sitemap, указанные в robots.txt хоста
+
+        Args:
+            url (str): Любой адрес на хосте
+
+        Returns:
+            list: URL sitemap
+        """
+        parts = urlparse(url)
+        parser = self._get_robots(parts.scheme or 'http', parts.netloc.lower())
+        if parser is None:
+            return []
+        return parser.site_maps() or []
+
+    def _get_robots(self, scheme, host):
+        """Возвращает разобранный robots.txt хоста, загружая его при необходимости"""
+        with self._lock:
+            cached = self._robots.get(host)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+            host_lock = self._robots_locks.setdefault(host, threading.Lock())
+
+        # Один поток загружает robots.txt, остальные ждут результата
+        with host_lock:
+            with self._lock:
+                cached = self._robots.get(host)
+                if cached and cached[1] > time.monotonic():
+                    return cached[0]
+
+            parser = self._fetch_robots(scheme, host)
+
+            with self._lock:
+                self._robots[host] = (parser, time.monotonic() + self.robots_ttl)
+                if parser is not None:
+                    crawl_delay = parser.crawl_delay(self.user_agent)
+                    self._state(host).crawl_delay = float(crawl_delay) if crawl_delay else None
+            return parser
+
+    def _fetch_robots(self, scheme, host):
+        """
+        Загружает и разбирает robots.txt
+
+        Файл загружается через fetch_url (тот же User-Agent и учет
+        Retry-After) с лимитом размера robots_max_bytes. Ответы 401 и 403
+        означают запрет обхода всего сайта, прочие ошибки и слишком большой
+        файл - отсутствие ограничений.
+
+        Returns:
+            RobotFileParser: Разобранный файл или None, если ограничений нет
+        """
+        import requests
+        from .fetcher import fetch_url
+
+        robots_url = f"{scheme}://{host}/robots.txt"
+        parser = RobotFileParser(robots_url)
+        try:
+            response = fetch_url(robots_url, timeout=self.robots_timeout, max_bytes=self.robots_max_bytes,
+                                 governor=self, check_robots=False)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in (401, 403):
+                logger.info(f"{robots_url} answered {e.response.status_code}, treating the site as disallowed")
+                parser.disallow_all = True
+                return parser
+            return None
+        except Exception as e:
+            logger.warning(f"Could not fetch {robots_url}: {str(e)}")
+            return None
+
+        parser.parse(response.text.splitlines())
+        return parser
+
+    def close(self):
+        """Прерывает текущие и будущие ожидания в очереди (при остановке процесса)"""
+        self._closed.set()
+
+    def reset(self):
+        """Сбрасывает состояние хостов и кеш robots.txt"""
+        with self._lock:
+            self._hosts.clear()
+            self._robots.clear()
+
+
+def parse_retry_after(value):
+    """
+    Разбирает заголовок Retry-After
+
+    Args:
+        value (str): Число секунд или HTTP-дата
+
+    Returns:
+        float: Задержка в секундах или None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """
+    Возвращает регулятор запросов процесса, настроенный по конфигурации приложения
+
+    Returns:
+        HostGovernor: Регулятор запросов
+    """
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                config = current_app.config
+                _governor = HostGovernor(
+                    rate=config['HOST_RATE_LIMIT'],
+                    burst=config['HOST_BURST'],
+                    host_limits=config['HOST_RATE_LIMITS'],
+                    max_wait=config['HOST_MAX_WAIT'],
+                    robots_enabled=config['ROBOTS_TXT_ENABLED'],
+                    robots_ttl=config['ROBOTS_TXT_TTL'],
+                    robots_max_bytes=config['ROBOTS_TXT_MAX_BYTES'],
+                    user_agent=config['FETCH_USER_AGENT'],
+                    retry_after_max=config['RETRY_AFTER_MAX']
+                )
+    return _governor
+
+
+def close_governor():
+    """Прерывает ожидания регулятора процесса, если он уже создан"""
+    if _governor is not None:
+        _governor.close()
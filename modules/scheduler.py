@@ -0,0 +1,250 @@
+import atexit
+import logging
+import os
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """
+    Межпроцессная блокировка лидера на основе файловой блокировки
+
+    Обновления лент выполняет только процесс, удерживающий блокировку.
+    Операционная система снимает блокировку, когда процесс-владелец
+    завершается (в том числе аварийно), поэтому другой процесс может
+    перехватить лидерство при следующей попытке.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @property
+    def is_held(self):
+        """Удерживает ли текущий процесс блокировку"""
+        return self._file is not None
+
+    def try_acquire(self):
+        """
+        Пытается захватить блокировку без ожидания
+
+        Returns:
+            bool: Является ли процесс лидером
+        """
+        if self._file is not None:
+            return True
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+
+        # Записываем PID лидера для диагностики
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+
+        self._file = lock_file
+        return True
+
+    def release(self):
+        """Освобождает блокировку, если она удерживается"""
+        if self._file is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def run_update_job(app):
+    """
+    Выполняет обновление всех лент в контексте приложения
+
+    Args:
+        app (Flask): Экземпляр приложения
+    """
+    from .aggregator import update_all_feeds
+
+    with app.app_context():
+        update_all_feeds()
+
+
+def run_enrichment_job(app):
+    """
+    Обрабатывает очередь загрузки полного текста статей
+
+    Args:
+        app (Flask): Экземпляр приложения
+    """
+    from .enrichment import process_pending
+
+    process_pending(app)
+
+
+def run_discovery_job(app):
+    """
+    Ищет готовые ленты для источников со скрапингом, у которых подошел срок
+
+    Args:
+        app (Flask): Экземпляр приложения
+    """
+    from .discovery import run_due_discovery
+
+    with app.app_context():
+        run_due_discovery(limit=app.config['FEED_DISCOVERY_BATCH'])
+
+
+def elect_leader(app, scheduler, lock):
+    """
+    Пытается стать лидером и, в случае успеха, планирует обновление лент
+
+    Выполняется периодически во всех процессах с планировщиком. Пока лидер
+    жив, остальные процессы получают отказ; после его остановки блокировку
+    захватывает первый процесс, выполнивший следующую попытку.
+
+    Args:
+        app (Flask): Экземпляр приложения
+        scheduler (BaseScheduler): Планировщик текущего процесса
+        lock (LeaderLock): Блокировка лидера
+    """
+    if not lock.try_acquire():
+        return
+
+    if scheduler.get_job('update_feeds') is None:
+        scheduler.add_job(
+            run_update_job,
+            'interval',
+            args=[app],
+            seconds=app.config['UPDATE_INTERVAL'],
+            id='update_feeds'
+        )
+        logger.info(f"Process {os.getpid()} became scheduler leader")
+
+    # Повторы загрузки полного текста статей, отложенные после ошибок
+    if scheduler.get_job('enrich_items') is None:
+        scheduler.add_job(
+            run_enrichment_job,
+            'interval',
+            args=[app],
+            seconds=app.config['ENRICH_INTERVAL'],
+            id='enrich_items'
+        )
+
+    # Поиск лент для источников со скрапингом - отдельно от их обновления
+    if scheduler.get_job('discover_feeds') is None:
+        scheduler.add_job(
+            run_discovery_job,
+            'interval',
+            args=[app],
+            seconds=app.config['FEED_DISCOVERY_JOB_INTERVAL'],
+            id='discover_feeds'
+        )
+
+
+def _configure_scheduler(app, scheduler):
+    """
+    Добавляет в планировщик задачу выбора лидера
+
+    Args:
+        app (Flask): Экземпляр приложения
+        scheduler (BaseScheduler): Планировщик
+
+    Returns:
+        LeaderLock: Блокировка лидера процесса
+    """
+    lock = LeaderLock(app.config['SCHEDULER_LOCK_FILE'])
+    scheduler.add_job(
+        elect_leader,
+        'interval',
+        args=[app, scheduler, lock],
+        seconds=app.config['LEADER_ELECTION_INTERVAL'],
+        next_run_time=datetime.now(),
+        id='leader_election'
+    )
+    return lock
+
+
+def start_scheduler(app):
+    """
+    Запускает фоновый планировщик автоматического обновления лент
+
+    Вызывается явно при сборке приложения, а не при импорте модуля.
+    Планировщик может работать в нескольких процессах (воркеры gunicorn),
+    но обновления выполняет только лидер, см. LeaderLock.
+
+    Args:
+        app (Flask): Экземпляр приложения
+
+    Returns:
+        BackgroundScheduler: Запущенный планировщик
+    """
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    scheduler = BackgroundScheduler()
+    lock = _configure_scheduler(app, scheduler)
+    scheduler.start()
+
+    def shutdown():
+        from .politeness import close_governor
+
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        # Обновления, ждущие очереди к хосту, завершаются сразу
+        close_governor()
+        lock.release()
+
+    # Останавливаем планировщик и отдаем лидерство при завершении процесса
+    atexit.register(shutdown)
+
+    app.extensions['scheduler'] = scheduler
+    logger.info("Scheduler started")
+    return scheduler
+
+
+def run_worker(app):
+    """
+    Запускает обновление лент в отдельном процессе без HTTP-сервера
+
+    Блокирует текущий поток до остановки процесса.
+
+    Args:
+        app (Flask): Экземпляр приложения
+    """
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    scheduler = BlockingScheduler()
+    lock = _configure_scheduler(app, scheduler)
+
+    logger.info("Update worker started")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        from .politeness import close_governor
+
+        close_governor()
+        lock.release()
@@ -1,43 +1,77 @@
-import requests
 from bs4 import BeautifulSoup
-import hashlib
 import logging
 import time
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
 from flask import current_app
 import os
 import json
 import re
 from urllib.parse import urljoin, urlparse
+from .fetcher import (
+    fetch_url, record_error, record_bytes, record_fetch_time, check_cancelled, cancellable_sleep, get_cancel_event
+)
+from .politeness import get_governor
+from .payload_store import get_payload_store, store_payload
+from .canonical import item_identity, element_canonical_link, page_canonical_link
 
 logger = logging.getLogger(__name__)
 
-def get_html(url, use_selenium=False):
+# Сколько секунд ждать загрузки страницы в браузере
+SELENIUM_PAGE_WAIT = 5
+
+
+def _create_chrome_driver(chrome_options):
+    """
+    Создает драйвер Chrome
+
+    Selenium и webdriver_manager импортируются только здесь, при первом
+    рендеринге страницы в браузере.
+
+    Args:
+        chrome_options (list): Аргументы командной строки Chrome
+
+    Returns:
+        WebDriver: Экземпляр драйвера Chrome
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    options = Options()
+    for argument in chrome_options:
+        options.add_argument(argument)
+
+    service = Service(ChromeDriverManager().install())
+    return webdriver.Chrome(service=service, options=options)
+
+
+def get_html(url, use_selenium=False, max_bytes=None):
     """
     Получает HTML страницы
     
     Args:
         url (str): URL страницы
         use_selenium (bool): Использовать ли Selenium для страниц с JavaScript
+        max_bytes (int, optional): Лимит размера ответа (только без Selenium)
         
     Returns:
         str: HTML содержимое страницы
     """
     try:
         if use_selenium:
-            return get_html_selenium(url)
+            # Рендеринг в браузере тоже нагружает хост - ждем слота у регулятора
+            get_governor().acquire(url, cancel_event=get_cancel_event())
+            started = time.monotonic()
+            try:
+                return get_html_selenium(url)
+            finally:
+                record_fetch_time(time.monotonic() - started)
         else:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
+            response = fetch_url(url, timeout=15, max_bytes=max_bytes)
             return response.text
     except Exception as e:
+        record_error(e)
         logger.error(f"Error fetching HTML from {url}: {str(e)}")
         return None
 
@@ -55,24 +89,30 @@ def get_html_selenium(url):
     driver = None
     try:
         # Настройка опций Chrome
-        chrome_options = Options()
+        chrome_options = []
         if current_app.config.get('HEADLESS_BROWSER', True):
-            chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--window-size=1920,1080")
+            chrome_options.append("--headless")
+        chrome_options.append("--disable-gpu")
+        chrome_options.append("--no-sandbox")
+        chrome_options.append("--disable-dev-shm-usage")
+        chrome_options.append("--window-size=1920,1080")
+        # Тот же User-Agent, что у обычных загрузок и при проверке robots.txt
+        chrome_options.append(f"--user-agent={current_app.config['FETCH_USER_AGENT']}")
         
         # Инициализация драйвера
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        check_cancelled(url)
+        driver = _create_chrome_driver(chrome_options)
         
-        # Загрузка страницы
+        # Загрузка страницы; при отмене браузер закрывается, не дожидаясь паузы
+        check_cancelled(url)
         driver.get(url)
-        time.sleep(5)  # Даем странице время загрузиться
+        cancellable_sleep(SELENIUM_PAGE_WAIT, url)  # Даем странице время загрузиться
         
-        return driver.page_source
+        html = driver.page_source
+        record_bytes(len(html.encode('utf-8')))
+        return html
     except Exception as e:
+        record_error(e)
         logger.error(f"Error using Selenium for {url}: {str(e)}")
         return None
     finally:
@@ -80,6 +120,25 @@ def get_html_selenium(url):
             driver.quit()
 
 
+def extract_entries(html, selectors, base_url):
+    """
+    Извлекает элементы страницы в режиме, заданном в селекторах
+    
+    Args:
+        html (str): HTML страницы
+        selectors (dict): Словарь селекторов; mode='embedded' - пути JSON
+            во встроенных данных страницы, иначе CSS селекторы
+        base_url (str): Базовый URL для относительных ссылок
+        
+    Returns:
+        list: Список извлеченных элементов
+    """
+    if selectors.get('mode') == 'embedded':
+        from .embedded_data import extract_data_from_embedded
+        return extract_data_from_embedded(html, selectors, base_url)
+    return extract_data_with_selectors(html, selectors, base_url)
+
+
 def extract_data_with_selectors(html, selectors, base_url):
     """
     Извлекает данные со страницы с использованием CSS селекторов
@@ -99,6 +158,7 @@ def extract_data_with_selectors(html, selectors, base_url):
         
     soup = BeautifulSoup(html, 'lxml')
     items = []
+    page_canonical = page_canonical_link(soup, base_url)
     
     # Получаем селектор контейнера и элементов
     container_selector = selectors.get('container', 'body')
@@ -164,6 +224,11 @@ def extract_data_with_selectors(html, selectors, base_url):
         else:
             item_data['link'] = base_url
         
+        # Каноническая ссылка из микроразметки карточки точнее ссылки в ней
+        canonical = element_canonical_link(element, base_url)
+        if canonical:
+            item_data['link'] = canonical
+        
         # Извлекаем описание
         if 'description' in selectors:
             try:
@@ -218,10 +283,11 @@ def extract_data_with_selectors(html, selectors, base_url):
         else:
             item_data['published'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Создаем уникальный GUID на основе ссылки или содержимого
-        item_data['guid'] = hashlib.md5(
-            (item_data['link'] + item_data['title']).encode()
-        ).hexdigest()
+        # GUID по канонической ссылке: правка заголовка или параметры
+        # отслеживания в ссылке не создают дубликат
+        item_data['link'], item_data['guid'] = item_identity(
+            item_data['link'], item_data['title'], base_url, page_canonical
+        )
         
         items.append(item_data)
     
@@ -269,15 +335,217 @@ def scrape_feed(feed):
     print(f"Использование Selenium: {use_selenium}")
     
     # Получаем HTML страницы
-    html = get_html(feed.url, use_selenium)
+    html = get_html(feed.url, use_selenium, max_bytes=feed.max_fetch_bytes)
     if not html:
         print(f"Не удалось получить HTML для {feed.url}")
         return None
     
     print(f"HTML получен, длина: {len(html)} символов")
     
+    # Сохраняем страницу, чтобы новые селекторы можно было применить без
+    # повторной загрузки, и пропускаем разбор, если она не изменилась
+    digest = store_payload(html)
+    feed.content_hash = digest
+    if digest == feed.parsed_content_hash:
+        feed_data = {'unchanged': True, 'content_hash': digest}
+    else:
+        feed_data = _build_scraped_feed_data(feed, html, selectors, digest)
+    
+    # Если настроена пагинация, догружаем следующие страницы списка
+    if feed_data and not feed_data.get('unchanged') and _pagination_enabled(selectors):
+        feed_data['entries'] = crawl_next_pages(feed, html, feed_data['entries'], selectors)
+    
+    return feed_data
+
+
+def _pagination_enabled(selectors):
+    """Настроена ли для ленты загрузка следующих страниц списка"""
+    return bool(selectors.get('next_page') or selectors.get('page_url_template'))
+
+
+def _known_guids(feed, guids):
+    """
+    Возвращает GUID из списка, которые уже сохранены для ленты
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+        guids (list): GUID элементов страницы
+        
+    Returns:
+        set: Уже сохраненные GUID
+    """
+    from .storage import db, FeedItem
+    
+    if not guids:
+        return set()
+    rows = db.session.query(FeedItem.guid).filter(
+        FeedItem.feed_id == feed.id,
+        FeedItem.guid.in_(guids)
+    ).all()
+    return {row.guid for row in rows}
+
+
+def _next_page_url(html, selector, page_url):
+    """Находит ссылку на следующую страницу по CSS селектору"""
+    soup = BeautifulSoup(html, 'lxml')
+    try:
+        link = soup.select_one(selector)
+    except Exception as e:
+        logger.warning(f"Invalid next page selector {selector}: {str(e)}")
+        return None
+    if link is None or not link.has_attr('href'):
+        return None
+    return urljoin(page_url, link['href'])
+
+
+def _fetch_pages(urls, use_selenium, max_bytes, workers):
+    """
+    Загружает несколько страниц параллельно
+    
+    Потоки получают собственный контекст приложения; регулятор запросов
+    по-прежнему ограничивает частоту запросов к хосту.
+    
+    Args:
+        urls (list): URL страниц
+        use_selenium (bool): Использовать ли Selenium
+        max_bytes (int, optional): Лимит размера ответа
+        workers (int): Количество потоков
+        
+    Returns:
+        list: HTML страниц (None для неудачных) в порядке urls
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    app = current_app._get_current_object()
+    
+    def fetch(url):
+        with app.app_context():
+            return get_html(url, use_selenium, max_bytes=max_bytes)
+    
+    if len(urls) == 1 or workers <= 1:
+        return [get_html(url, use_selenium, max_bytes=max_bytes) for url in urls]
+    with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+        return list(executor.map(fetch, urls))
+
+
+def crawl_next_pages(feed, first_html, entries, selectors):
+    """
+    Догружает следующие страницы списка до первой страницы без новых элементов
+    
+    Адреса страниц берутся из шаблона (page_url_template с {page}, первая
+    страница - адрес ленты) или по ссылке на следующую страницу (next_page).
+    По шаблону страницы загружаются параллельно, волнами по
+    SCRAPE_PAGE_CONCURRENCY; ссылки на следующую страницу можно получить
+    только последовательно. Обход останавливается на первой странице, все
+    элементы которой уже есть в БД, поэтому в обычном режиме загружается
+    только первая страница.
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+        first_html (str): HTML первой страницы
+        entries (list): Элементы первой страницы
+        selectors (dict): Словарь селекторов
+        
+    Returns:
+        list: Элементы всех загруженных страниц без повторов
+    """
+    from .metrics import metrics
+    
+    config = current_app.config
+    max_pages = int(selectors.get('max_pages') or config['SCRAPE_MAX_PAGES'])
+    use_selenium = selectors.get('use_selenium', False)
+    # Каждая страница в Selenium - отдельный браузер, поэтому без параллельности
+    workers = 1 if use_selenium else config['SCRAPE_PAGE_CONCURRENCY']
+    template = selectors.get('page_url_template')
+    
+    all_entries = list(entries)
+    seen = {entry['guid'] for entry in entries}
+    pages = 1
+    
+    def page_is_known(page_entries):
+        guids = [entry['guid'] for entry in page_entries]
+        return not guids or len(_known_guids(feed, guids)) == len(set(guids))
+    
+    if page_is_known(entries):
+        metrics.observe('scrape.pages', pages)
+        return all_entries
+    
+    page_url, page_html = feed.url, first_html
+    next_page = 2
+    while next_page <= max_pages:
+        if template:
+            urls = [template.replace('{page}', str(number))
+                    for number in range(next_page, min(next_page + workers, max_pages + 1))]
+        else:
+            url = _next_page_url(page_html, selectors['next_page'], page_url)
+            if not url or url == page_url:
+                break
+            urls = [url]
+        
+        stop = False
+        for url, html in zip(urls, _fetch_pages(urls, use_selenium, feed.max_fetch_bytes, workers)):
+            pages += 1
+            if not html:
+                stop = True
+                break
+            page_entries = extract_entries(html, selectors, url)
+            print(f"Страница {url}: найдено элементов: {len(page_entries)}")
+            if page_is_known(page_entries):
+                stop = True
+                break
+            for entry in page_entries:
+                if entry['guid'] not in seen:
+                    seen.add(entry['guid'])
+                    all_entries.append(entry)
+            page_url, page_html = url, html
+        
+        if stop:
+            break
+        next_page += len(urls)
+    
+    metrics.observe('scrape.pages', pages)
+    print(f"Загружено страниц списка: {pages}, элементов: {len(all_entries)}")
+    return all_entries
+
+
+def scrape_stored_payload(feed):
+    """
+    Применяет селекторы ленты к последней сохраненной странице без загрузки
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+        
+    Returns:
+        dict: Данные ленты или None, если страница уже вытеснена из хранилища
+    """
+    store = get_payload_store()
+    selectors = feed.get_selectors()
+    if store is None or not feed.content_hash or not selectors:
+        return None
+    
+    content = store.get(feed.content_hash)
+    if content is None:
+        return None
+    
+    print(f"Применение селекторов к сохраненной странице {feed.content_hash[:12]}")
+    return _build_scraped_feed_data(feed, content.decode('utf-8'), selectors, feed.content_hash)
+
+
+def _build_scraped_feed_data(feed, html, selectors, digest):
+    """
+    Извлекает элементы страницы и собирает данные ленты
+    
+    Args:
+        feed (Feed): Объект ленты из БД
+        html (str): HTML страницы
+        selectors (dict): Словарь селекторов
+        digest (str): Хеш страницы
+        
+    Returns:
+        dict: Данные ленты или None, если элементы не найдены
+    """
     # Извлекаем данные
-    entries = extract_data_with_selectors(html, selectors, feed.url)
+    entries = extract_entries(html, selectors, feed.url)
     print(f"Найдено элементов: {len(entries) if entries else 0}")
     
     if not entries or len(entries) == 0:
@@ -287,7 +555,8 @@ def scrape_feed(feed):
     return {
         'title': feed.name,
         'description': f'Scraped feed from {feed.url}',
-        'entries': entries
+        'entries': entries,
+        'content_hash': digest
     }
 
 
@@ -319,7 +588,7 @@ def test_selectors(url, selectors, use_selenium=False):
         }
     
     # Извлекаем данные
-    entries = extract_data_with_selectors(html, selectors, url)
+    entries = extract_entries(html, selectors, url)
     
     if not entries:
         return {
@@ -370,6 +639,10 @@ def auto_detect_selectors(url, use_selenium=False):
     """
     Автоматически определяет возможные селекторы для страницы
     
+    Если список статей есть и в данных страницы (JSON-LD, __NEXT_DATA__,
+    window.__INITIAL_STATE__), предлагается режим 'embedded' - без браузера,
+    но только когда в данных не меньше статей, чем находят CSS селекторы.
+    
     Args:
         url (str): URL страницы
         use_selenium (bool): Использовать ли Selenium
@@ -427,9 +700,11 @@ def auto_detect_selectors(url, use_selenium=False):
             selectors['item'] = repeated_elements['item']
     
     # Если нашли контейнер и элементы, пробуем определить другие селекторы
+    css_items = 0
     if selectors.get('container') and selectors.get('item'):
         container = soup.select_one(selectors['container'])
         if container:
+            css_items = len(container.select(selectors['item']))
             first_item = container.select_one(selectors['item'])
             if first_item:
                 # Ищем заголовок
@@ -463,6 +738,11 @@ def auto_detect_selectors(url, use_selenium=False):
                         selectors['date'] = date_selector
                         break
     
+    from .embedded_data import detect_embedded_data, extract_data_from_embedded
+    embedded = detect_embedded_data(html)
+    if embedded and len(extract_data_from_embedded(html, embedded, url)) >= css_items:
+        return embedded
+    
     return selectors
 
 
@@ -591,15 +871,15 @@ def save_screenshot_for_selector(url, filename):
     driver = None
     try:
         # Настройка опций Chrome
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
+        chrome_options = [
+            "--headless",
+            "--window-size=1920,1080",
+            "--disable-gpu",
+            "--no-sandbox"
+        ]
         
         # Инициализация драйвера
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        driver = _create_chrome_driver(chrome_options)
         
         # Загрузка страницы
         driver.get(url)
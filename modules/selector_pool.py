@@ -0,0 +1,203 @@
+import json
+import logging
+import select
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+
+from .fetcher import set_cancel_event
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PoolBusy(Exception):
+    """Все места пула и его очереди заняты"""
+
+
+class ClientDisconnected(Exception):
+    """Клиент закрыл соединение, не дождавшись результата"""
+
+
+class _Flight:
+    """Выполняемый в пуле вызов и количество запросов, ждущих его результата"""
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.cancel_event = threading.Event()
+        self.waiters = 0
+
+
+class SingleFlightPool:
+    """
+    Ограниченный пул для загрузок и рендеринга, запрошенных через API
+
+    Одинаковые вызовы (та же функция с теми же аргументами), пришедшие,
+    пока первый еще выполняется, ждут его результата, а не запускают
+    загрузку заново. Когда результата не ждет ни один запрос, вызов
+    отменяется: еще не начатый снимается с очереди, а начатый прерывается
+    на ближайшей проверке отмены в загрузчике (см. fetcher.check_cancelled).
+    Отмененный, но еще работающий вызов (например, рендеринг в браузере)
+    занимает место в лимите max_pending, пока не завершится, поэтому
+    повторяющие запрос клиенты не запустят больше вызовов, чем позволяет лимит.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='selector-api')
+        # Вызовы, к которым можно присоединиться, по ключу
+        self._flights = {}
+        # Все не завершившиеся вызовы, в том числе отмененные
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def _run(self, app, flight, func, args):
+        with app.app_context():
+            set_cancel_event(flight.cancel_event)
+            try:
+                return func(*args)
+            finally:
+                set_cancel_event(None)
+                with self._lock:
+                    if self._flights.get(flight.key) is flight:
+                        del self._flights[flight.key]
+                    self._active.discard(flight)
+
+    def join(self, func, *args):
+        """
+        Присоединяется к выполняющемуся вызову или ставит новый в очередь
+
+        Args:
+            func (callable): Функция, выполняемая в контексте приложения
+            *args: Аргументы (должны сериализоваться в JSON - из них строится ключ)
+
+        Returns:
+            _Flight: Вызов; после ожидания его нужно передать в leave()
+
+        Raises:
+            PoolBusy: Если выполняется (в том числе после отмены) и ждет
+                очереди max_pending вызовов
+        """
+        key = (func.__module__, func.__name__, json.dumps(args, sort_keys=True, default=str))
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                if len(self._active) >= self.max_pending:
+                    metrics.increment('selector_api.rejected')
+                    raise PoolBusy(f"{len(self._active)} selector requests are already running")
+                flight = _Flight(key)
+                self._flights[key] = flight
+                self._active.add(flight)
+                flight.future = self._executor.submit(
+                    self._run, current_app._get_current_object(), flight, func, args
+                )
+            else:
+                metrics.increment('selector_api.coalesced')
+            flight.waiters += 1
+        return flight
+
+    def leave(self, flight):
+        """
+        Отказывается от результата вызова; последний ушедший отменяет вызов
+
+        Args:
+            flight (_Flight): Вызов, полученный из join()
+        """
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters or flight.future.done():
+                return
+            flight.cancel_event.set()
+            # Снятый с очереди вызов не запустится; начатый освободит место
+            # в лимите сам, когда завершится (см. _run)
+            if flight.future.cancel():
+                self._active.discard(flight)
+            # Новые запросы с тем же ключом запускают новый вызов
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        metrics.increment('selector_api.cancelled')
+        logger.info(f"Cancelled {flight.key[1]}: no clients are waiting")
+
+    def call(self, func, *args, is_disconnected=None, poll=0.5):
+        """
+        Выполняет функцию в пуле и ждет результата, пока клиент на связи
+
+        Args:
+            func (callable): Функция
+            *args: Аргументы
+            is_disconnected (callable, optional): Проверка, что клиент ушел
+            poll (float): Как часто проверять соединение, секунд
+
+        Returns:
+            Результат функции (исключения функции передаются вызывающему)
+
+        Raises:
+            PoolBusy: Если пул перегружен
+            ClientDisconnected: Если клиент ушел раньше, чем вызов завершился
+        """
+        flight = self.join(func, *args)
+        try:
+            while True:
+                try:
+                    return flight.future.result(timeout=poll)
+                except FutureTimeout:
+                    if is_disconnected is not None and is_disconnected():
+                        raise ClientDisconnected()
+        finally:
+            self.leave(flight)
+
+
+def client_disconnected(environ):
+    """
+    Проверяет, закрыл ли клиент соединение, по сокету запроса
+
+    Пока клиент ждет ответа, он ничего не отправляет, поэтому сокет,
+    готовый к чтению без данных, означает закрытое соединение. Сокет
+    доступен во встроенном сервере Werkzeug и в gunicorn; для других
+    серверов и для TLS-соединений проверка считает клиента подключенным.
+
+    Args:
+        environ (dict): WSGI-окружение запроса
+
+    Returns:
+        bool: True, если соединение закрыто
+    """
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        # recv с флагами недоступен для TLS-сокетов
+        return False
+    except OSError:
+        return True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_selector_pool():
+    """
+    Возвращает пул API настройки селекторов, настроенный по конфигурации приложения
+
+    Returns:
+        SingleFlightPool: Пул
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = current_app.config
+                _pool = SingleFlightPool(
+                    max_workers=config['SELECTOR_API_WORKERS'],
+                    max_pending=config['SELECTOR_API_MAX_PENDING']
+                )
+    return _pool
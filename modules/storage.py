@@ -1,4 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
 import json
 
@@ -8,7 +10,7 @@ class Feed(db.Model):
     """Модель для хранения информации о лентах RSS"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    feed_type = db.Column(db.String(50), nullable=False)  # 'rss', 'scrape'
+    feed_type = db.Column(db.String(50), nullable=False)  # 'rss', 'scrape', 'sitemap'
     url = db.Column(db.String(500), nullable=False)
     active = db.Column(db.Boolean, default=True)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
@@ -20,11 +22,64 @@ class Feed(db.Model):
     # Для работы с агрегированными лентами
     included_in_aggregate = db.Column(db.Boolean, default=True)
     
+    # Подписка WebSub (PubSubHubbub), если источник объявляет хаб
+    hub_url = db.Column(db.String(500), nullable=True)
+    topic_url = db.Column(db.String(500), nullable=True)
+    websub_secret = db.Column(db.String(64), nullable=True)
+    websub_pending_secret = db.Column(db.String(64), nullable=True)  # Секрет продления до его подтверждения
+    websub_state = db.Column(db.String(20), nullable=True)  # 'pending', 'subscribed', 'denied'
+    websub_requested_at = db.Column(db.DateTime, nullable=True)
+    websub_lease_expires = db.Column(db.DateTime, nullable=True)
+    
+    # Учет ошибок: пауза перед повтором и автоматическая приостановка
+    consecutive_failures = db.Column(db.Integer, default=0)
+    last_error_class = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    last_error_at = db.Column(db.DateTime, nullable=True)
+    next_retry_at = db.Column(db.DateTime, nullable=True)
+    suspended = db.Column(db.Boolean, default=False)
+    
+    # Лимит размера ответа источника, байт (None - значение из конфигурации)
+    max_fetch_bytes = db.Column(db.Integer, nullable=True)
+    
+    # Хеш последнего загруженного тела ответа (ключ в хранилище тел ответов)
+    # и хеш тела, результат разбора которого уже сохранен в БД
+    content_hash = db.Column(db.String(64), nullable=True)
+    parsed_content_hash = db.Column(db.String(64), nullable=True)
+    
+    # Результат поиска ленты для источника со скрапингом (JSON строка)
+    discovery = db.Column(db.Text, nullable=True)
+    
+    # Загружать полный текст новых статей (см. modules/enrichment.py)
+    enrich_content = db.Column(db.Boolean, default=False)
+    
+    # Увеличивается при удалении и объединении элементов: вместе с последним
+    # ID элемента - версия содержимого для кеша готовых лент
+    items_version = db.Column(db.Integer, default=0)
+    
     items = db.relationship('FeedItem', backref='feed', lazy='dynamic', cascade='all, delete-orphan')
     
+    # История обновлений за последние UPDATE_HISTORY_DAYS дней
+    update_runs = db.relationship('UpdateRun', lazy='dynamic', cascade='all, delete-orphan')
+    
+    # Метки для правил агрегированных лент
+    tags = db.relationship('FeedTag', cascade='all, delete-orphan', order_by='FeedTag.tag')
+    
     def __repr__(self):
         return f'<Feed {self.name}>'
     
+    @property
+    def tag_list(self):
+        """Метки ленты через запятую"""
+        return ', '.join(tag.tag for tag in self.tags)
+    
+    @tag_list.setter
+    def tag_list(self, value):
+        """Заменяет метки ленты списком из строки через запятую"""
+        names = parse_tags(value)
+        self.tags = [tag for tag in self.tags if tag.tag in names] + \
+                    [FeedTag(tag=name) for name in names if name not in {tag.tag for tag in self.tags}]
+    
     def get_selectors(self):
         """Возвращает словарь селекторов"""
         if self.selectors:
@@ -34,23 +89,206 @@ class Feed(db.Model):
     def set_selectors(self, selectors_dict):
         """Сохраняет словарь селекторов как JSON"""
         self.selectors = json.dumps(selectors_dict)
+        # Прежний результат разбора больше не актуален для новых селекторов
+        self.parsed_content_hash = None
+    
+    def get_discovery(self):
+        """Возвращает результат поиска ленты"""
+        if self.discovery:
+            return json.loads(self.discovery)
+        return {}
+    
+    def set_discovery(self, discovery_dict):
+        """Сохраняет результат поиска ленты как JSON"""
+        self.discovery = json.dumps(discovery_dict)
+    
+    @property
+    def push_enabled(self):
+        """Получает ли лента обновления через WebSub"""
+        return (
+            self.websub_state == 'subscribed'
+            and self.websub_lease_expires is not None
+            and self.websub_lease_expires > datetime.utcnow()
+        )
+
+
+def parse_tags(value):
+    """
+    Разбирает метки из строки через запятую
+    
+    Args:
+        value (str): Метки через запятую
+        
+    Returns:
+        list: Уникальные метки в нижнем регистре в исходном порядке
+    """
+    names = []
+    for name in (value or '').split(','):
+        name = name.strip().lower()[:100]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class FeedTag(db.Model):
+    """Метка ленты-источника"""
+    __table_args__ = (
+        # Правила агрегированных лент выбирают ленты по метке
+        db.Index('ix_feed_tag_tag', 'tag'),
+    )
+    
+    feed_id = db.Column(db.Integer, db.ForeignKey('feed.id'), primary_key=True)
+    tag = db.Column(db.String(100), primary_key=True)
+    
+    def __repr__(self):
+        return f'<FeedTag {self.tag}>'
 
 
 class FeedItem(db.Model):
     """Модель для хранения элементов ленты"""
+    __table_args__ = (
+        # Порядок вставки внутри ленты: дельта-запросы (?since=) - диапазон по индексу
+        db.Index('ix_feed_item_feed_id_id', 'feed_id', 'id'),
+        # Агрегированные ленты читают последние элементы по дате публикации
+        db.Index('ix_feed_item_published', 'published'),
+        # Поиск сохраненного элемента по канонической ссылке при смене GUID
+        db.Index('ix_feed_item_feed_id_link_key', 'feed_id', 'link_key'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     feed_id = db.Column(db.Integer, db.ForeignKey('feed.id'), nullable=False)
     title = db.Column(db.String(500), nullable=False)
     link = db.Column(db.String(500), nullable=False)
+    link_key = db.Column(db.String(32), nullable=True)  # url_guid(link), см. modules/canonical.py
     description = db.Column(db.Text, nullable=True)
     guid = db.Column(db.String(500), nullable=True)
     published = db.Column(db.DateTime, nullable=True)
+    image = db.Column(db.String(1000), nullable=True)  # URL изображения статьи
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Длинное описание, вынесенное из строки элемента в сжатом виде
+    body = db.relationship('ItemBody', uselist=False, cascade='all, delete-orphan')
+    
+    # Полный текст статьи, если для ленты включено обогащение
+    article = db.relationship(
+        'ItemContent',
+        primaryjoin='FeedItem.link == foreign(ItemContent.url)',
+        uselist=False,
+        viewonly=True
+    )
+    
     def __repr__(self):
         return f'<FeedItem {self.title}>'
 
 
+class ItemBody(db.Model):
+    """
+    Сжатое описание элемента, вынесенное из FeedItem
+    
+    Длинные описания (целые статьи в summary) хранятся здесь, а в
+    FeedItem.description остается короткий текст, поэтому сортировки и
+    списки не читают их вместе с остальными колонками элемента.
+    Распаковываются только при сборке ленты (см. modules/item_body.py);
+    слова правил агрегированных лент ищутся по полному тексту без разметки.
+    """
+    item_id = db.Column(db.Integer, db.ForeignKey('feed_item.id'), primary_key=True)
+    codec = db.Column(db.String(10), nullable=False, default='zlib')  # 'zlib' или 'zstd'
+    size = db.Column(db.Integer, nullable=False)  # Размер исходного описания, байт
+    data = db.Column(db.LargeBinary, nullable=False)
+    text = db.Column(db.Text, nullable=True)  # Полный текст описания без разметки
+    
+    def __repr__(self):
+        return f'<ItemBody {self.item_id} {self.codec}>'
+
+
+class ItemContent(db.Model):
+    """
+    Полный текст статьи, извлеченный со страницы элемента
+    
+    Хранится отдельно от FeedItem.description, по одной записи на URL
+    статьи: элементы разных лент с одной ссылкой разделяют текст.
+    """
+    __table_args__ = (
+        db.Index('ix_item_content_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False, unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running', 'done', 'failed'
+    content = db.Column(db.Text, nullable=True)
+    text_length = db.Column(db.Integer, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.String(500), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ItemContent {self.url} {self.status}>'
+
+
+class ImportJob(db.Model):
+    """Фоновый импорт источников из OPML и его прогресс"""
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'validating', 'fetching', 'done', 'failed'
+    validate = db.Column(db.Boolean, default=True)
+    total = db.Column(db.Integer, default=0)  # Источников в файле
+    processed = db.Column(db.Integer, default=0)  # Проверено (или пропущено)
+    created = db.Column(db.Integer, default=0)  # Создано лент
+    duplicates = db.Column(db.Integer, default=0)  # Уже были в БД или повторяются в файле
+    invalid = db.Column(db.Integer, default=0)  # Не прошли проверку
+    fetched = db.Column(db.Integer, default=0)  # Созданных лент, получивших первые элементы
+    errors = db.Column(db.Text, nullable=True)  # JSON список {url, error} (первые ошибки)
+    error = db.Column(db.String(500), nullable=True)  # Причина сбоя всего импорта
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def get_errors(self):
+        """Возвращает список ошибок проверки"""
+        if self.errors:
+            return json.loads(self.errors)
+        return []
+    
+    def set_errors(self, errors_list):
+        """Сохраняет список ошибок проверки как JSON"""
+        self.errors = json.dumps(errors_list)
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+
+
+class UpdateRun(db.Model):
+    """
+    Одно обновление ленты: время по этапам, объем и результат
+    
+    Записи старше UPDATE_HISTORY_DAYS удаляются (см. modules/update_history.py).
+    """
+    __table_args__ = (
+        db.Index('ix_update_run_started_at', 'started_at'),
+        db.Index('ix_update_run_feed_started_at', 'feed_id', 'started_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    feed_id = db.Column(db.Integer, db.ForeignKey('feed.id'), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    fetch_ms = db.Column(db.Integer, nullable=False, default=0)  # Загрузка (HTTP или браузер)
+    parse_ms = db.Column(db.Integer, nullable=False, default=0)  # Разбор ответа
+    write_ms = db.Column(db.Integer, nullable=False, default=0)  # Сверка с БД и запись элементов
+    bytes_read = db.Column(db.Integer, nullable=False, default=0)
+    new_items = db.Column(db.Integer, nullable=False, default=0)
+    error_class = db.Column(db.String(100), nullable=True)  # None - обновление успешно
+    error = db.Column(db.String(300), nullable=True)
+    
+    @property
+    def duration_ms(self):
+        """Общее время обновления, мс"""
+        return self.fetch_ms + self.parse_ms + self.write_ms
+    
+    def __repr__(self):
+        return f'<UpdateRun {self.feed_id} {self.started_at}>'
+
+
 class AggregatedFeed(db.Model):
     """Модель для хранения агрегированных лент"""
     id = db.Column(db.Integer, primary_key=True)
@@ -61,6 +299,9 @@ class AggregatedFeed(db.Model):
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Правила отбора источников и элементов (JSON), см. aggregator.aggregated_feed_conditions
+    rules = db.Column(db.Text, nullable=True)
+    
     # Связь многие-ко-многим с Feed
     feeds = db.relationship('Feed', 
                            secondary='aggregated_feed_association',
@@ -69,6 +310,17 @@ class AggregatedFeed(db.Model):
     
     def __repr__(self):
         return f'<AggregatedFeed {self.name}>'
+    
+    def get_rules(self):
+        """Возвращает словарь правил"""
+        if self.rules:
+            return json.loads(self.rules)
+        return {}
+    
+    def set_rules(self, rules_dict):
+        """Сохраняет непустые правила как JSON"""
+        rules_dict = {name: value for name, value in rules_dict.items() if value}
+        self.rules = json.dumps(rules_dict, ensure_ascii=False) if rules_dict else None
 
 
 # Таблица связи между AggregatedFeed и Feed
@@ -78,8 +330,147 @@ aggregated_feed_association = db.Table('aggregated_feed_association',
 )
 
 
+def _sqlite_pragma_listener(pragmas):
+    """
+    Создает обработчик подключения, применяющий PRAGMA к соединениям SQLite
+    
+    Args:
+        pragmas (dict): Имена и значения PRAGMA
+        
+    Returns:
+        function: Обработчик события 'connect'
+    """
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    
+    return set_pragmas
+
+
+def _sql_literal(value):
+    """Представляет скалярное значение по умолчанию в виде SQL-литерала"""
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _upgrade_schema():
+    """
+    Добавляет в существующие таблицы недостающие колонки и индексы
+    
+    db.create_all() создает только отсутствующие таблицы, поэтому для баз,
+    созданных предыдущими версиями приложения, новые колонки моделей
+    добавляются через ALTER TABLE.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}'
+            if column.default is not None and column.default.is_scalar:
+                ddl += f' DEFAULT {_sql_literal(column.default.arg)}'
+            with engine.begin() as connection:
+                connection.exec_driver_sql(ddl)
+        
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def reindex_database(vacuum=False):
+    """
+    Перестраивает индексы и обновляет статистику планировщика запросов
+    
+    Сначала создаются недостающие колонки и индексы (как при запуске),
+    затем для каждой таблицы выполняются REINDEX и ANALYZE.
+    
+    Args:
+        vacuum (bool): Выполнить VACUUM после перестроения (только SQLite)
+        
+    Returns:
+        list: Пары (таблица, время в секундах)
+    """
+    import time
+    
+    engine = db.engine
+    is_sqlite = engine.dialect.name == 'sqlite'
+    _upgrade_schema()
+    
+    timings = []
+    for table in db.metadata.sorted_tables:
+        started = time.monotonic()
+        with engine.begin() as connection:
+            if is_sqlite:
+                connection.exec_driver_sql(f'REINDEX {table.name}')
+            elif engine.dialect.name == 'postgresql':
+                connection.exec_driver_sql(f'REINDEX TABLE {table.name}')
+            connection.exec_driver_sql(f'ANALYZE {table.name}')
+        timings.append((table.name, time.monotonic() - started))
+    
+    if vacuum and is_sqlite:
+        started = time.monotonic()
+        # VACUUM нельзя выполнять внутри транзакции
+        with engine.connect() as connection:
+            connection.execution_options(isolation_level='AUTOCOMMIT').exec_driver_sql('VACUUM')
+        timings.append(('VACUUM', time.monotonic() - started))
+    return timings
+
+
+def database_size():
+    """
+    Возвращает размер базы данных
+    
+    Для SQLite это размер файла без свободных страниц: место, освобожденное
+    удалением строк, возвращается системе только после VACUUM.
+    
+    Returns:
+        int: Размер в байтах или None, если СУБД не поддерживается
+    """
+    engine = db.engine
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+            pages = connection.exec_driver_sql('PRAGMA page_count').scalar()
+            free = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+            return (pages - free) * page_size
+        if engine.dialect.name == 'postgresql':
+            return connection.exec_driver_sql('SELECT pg_database_size(current_database())').scalar()
+    return None
+
+
 def init_db(app):
     """Инициализация базы данных"""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    is_sqlite = uri.startswith('sqlite')
+    
+    if is_sqlite and ':memory:' not in uri and app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('pool_size'):
+        # SQLAlchemy 1.4 по умолчанию использует для файлов SQLite NullPool,
+        # поэтому для настроек пула явно включаем QueuePool. Соединения из пула
+        # используются разными потоками (веб-запросы, планировщик).
+        engine_options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        engine_options.setdefault('poolclass', QueuePool)
+        connect_args = dict(engine_options.get('connect_args', {}))
+        connect_args.setdefault('check_same_thread', False)
+        engine_options['connect_args'] = connect_args
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    
     db.init_app(app)
     with app.app_context():
-        db.create_all()
\ No newline at end of file
+        pragmas = app.config.get('SQLITE_PRAGMAS')
+        if is_sqlite and pragmas:
+            event.listen(db.get_engine(), 'connect', _sqlite_pragma_listener(pragmas))
+        db.create_all()
+        _upgrade_schema()
\ No newline at end of file
@@ -0,0 +1,271 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .payload_store import PayloadStore, content_hash
+
+logger = logging.getLogger(__name__)
+
+# Сигнатуры растровых форматов для заголовка Content-Type. SVG не кешируется:
+# он может содержать скрипты, которые выполнились бы в домене приложения
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+class ThumbnailCache(PayloadStore):
+    """
+    Кеш миниатюр изображений элементов на диске
+
+    Ключ файла - хеш URL исходного изображения. Изображения уже сжаты,
+    поэтому файлы записываются как есть. Объем ограничен так же, как в
+    PayloadStore: вытесняются миниатюры, которые дольше всего не запрашивались.
+    """
+
+    SUFFIX = '.img'
+
+    def _encode(self, content):
+        return content
+
+    def _decode(self, data):
+        return data
+
+    def mimetype(self, digest):
+        """
+        Определяет тип миниатюры по первым байтам файла, не читая его целиком
+
+        Args:
+            digest (str): Ключ кеша
+
+        Returns:
+            str: MIME-тип или None, если миниатюры нет в кеше
+        """
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return image_mimetype(f.read(12))
+        except FileNotFoundError:
+            return None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# Миниатюры готовятся в отдельном потоке, а не в потоке запроса
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def get_thumbnail_cache():
+    """
+    Возвращает кеш миниатюр, настроенный по конфигурации приложения
+
+    Returns:
+        ThumbnailCache: Кеш или None, если он отключен
+    """
+    global _cache
+    config = current_app.config
+    if not config['THUMBNAIL_CACHE_ENABLED']:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ThumbnailCache(config['THUMBNAIL_CACHE_DIR'], config['THUMBNAIL_CACHE_MAX_BYTES'])
+    return _cache
+
+
+def image_mimetype(data):
+    """
+    Определяет тип изображения по первым байтам
+
+    Args:
+        data (bytes): Содержимое изображения
+
+    Returns:
+        str: MIME-тип или None для неподдерживаемых форматов
+    """
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mimetype in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    return None
+
+
+def make_thumbnail(content, size):
+    """
+    Уменьшает изображение до size точек по большей стороне
+
+    Pillow - необязательная зависимость: без нее изображение кешируется
+    в исходном виде.
+
+    Args:
+        content (bytes): Исходное изображение
+        size (int): Максимальная ширина и высота, точек
+
+    Returns:
+        bytes: Миниатюра в JPEG (или исходное изображение) либо None,
+            если содержимое не является изображением
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return content
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        if image.width <= size and image.height <= size and image.format in ('JPEG', 'PNG', 'GIF', 'WEBP'):
+            return content
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=85, optimize=True)
+        return output.getvalue()
+    except Exception as e:
+        logger.warning(f"Could not make thumbnail: {str(e)}")
+        return None
+
+
+def cached_thumbnail(image_url):
+    """
+    Возвращает миниатюру изображения, если она уже есть в кеше
+
+    Args:
+        image_url (str): URL исходного изображения
+
+    Returns:
+        tuple: (содержимое, MIME-тип, ключ кеша) или None, если кеш отключен
+            или миниатюры в нем нет
+    """
+    from .metrics import metrics
+
+    cache = get_thumbnail_cache()
+    if cache is None:
+        return None
+
+    key = content_hash(image_url)
+    data = cache.get(key)
+    if data is None:
+        metrics.increment('thumbnails.misses')
+        return None
+    metrics.increment('thumbnails.hits')
+    return data, image_mimetype(data), key
+
+
+def cached_thumbnail_type(image_url):
+    """
+    Возвращает MIME-тип миниатюры из кеша
+
+    Args:
+        image_url (str): URL исходного изображения
+
+    Returns:
+        str: MIME-тип или None, если кеш отключен или миниатюры в нем нет
+    """
+    cache = get_thumbnail_cache()
+    if cache is None:
+        return None
+    return cache.mimetype(content_hash(image_url))
+
+
+def queue_thumbnail(image_url):
+    """
+    Ставит загрузку миниатюры в очередь, если она еще не поставлена
+
+    Args:
+        image_url (str): URL исходного изображения
+
+    Returns:
+        bool: Поставлена ли загрузка в очередь
+    """
+    if get_thumbnail_cache() is None:
+        return False
+    with _queued_lock:
+        if image_url in _queued:
+            return False
+        _queued.add(image_url)
+    _background.submit(_thumbnail_job, current_app._get_current_object(), image_url)
+    return True
+
+
+def _thumbnail_job(app, image_url):
+    """Загрузка миниатюры в фоновом потоке"""
+    try:
+        with app.app_context():
+            build_thumbnail(image_url)
+    except Exception as e:
+        logger.error(f"Thumbnail job for {image_url} failed: {str(e)}")
+    finally:
+        with _queued_lock:
+            _queued.discard(image_url)
+
+
+def build_thumbnail(image_url):
+    """
+    Загружает изображение, уменьшает его и сохраняет миниатюру в кеш
+
+    Args:
+        image_url (str): URL исходного изображения
+
+    Returns:
+        tuple: (содержимое, MIME-тип, ключ кеша) или None, если кеш отключен
+            или изображение не удалось загрузить
+    """
+    from .fetcher import fetch_url
+
+    cache = get_thumbnail_cache()
+    if cache is None:
+        return None
+
+    key = content_hash(image_url)
+    config = current_app.config
+    try:
+        response = fetch_url(
+            image_url,
+            timeout=15,
+            max_bytes=config['THUMBNAIL_MAX_SOURCE_BYTES'],
+            accept=('image/',)
+        )
+    except Exception as e:
+        logger.warning(f"Could not fetch image {image_url}: {str(e)}")
+        return None
+
+    if image_mimetype(response.content) is None:
+        logger.warning(f"Unsupported image format at {image_url}")
+        return None
+    data = make_thumbnail(response.content, config['THUMBNAIL_SIZE'])
+    if data is None:
+        return None
+    try:
+        cache.put(data, key)
+    except OSError as e:
+        logger.warning(f"Could not cache thumbnail for {image_url}: {str(e)}")
+    return data, image_mimetype(data), key
+
+
+def thumbnail_url(item, base_url):
+    """
+    Возвращает адрес изображения элемента для выдачи читателям
+
+    Если кеш миниатюр включен, это адрес миниатюры в приложении,
+    иначе - исходный адрес изображения.
+
+    Args:
+        item (FeedItem): Элемент ленты
+        base_url (str): Базовый URL приложения
+
+    Returns:
+        str: URL изображения или None, если у элемента нет изображения
+    """
+    if not item.image:
+        return None
+    if current_app.config['THUMBNAIL_CACHE_ENABLED'] and base_url:
+        return f"{base_url}/thumbnails/{item.id}"
+    return item.image
@@ -0,0 +1,202 @@
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func
+
+from .storage import db, Feed, UpdateRun
+
+logger = logging.getLogger(__name__)
+
+
+def record_update_run(feed_id, started_at, fetch_ms, parse_ms, write_ms, bytes_read, new_items,
+                      error_class=None, error=None):
+    """
+    Сохраняет запись об обновлении ленты
+
+    Ошибка записи истории не должна влиять на обновление, поэтому она
+    только логируется.
+
+    Args:
+        feed_id (int): ID ленты
+        started_at (datetime): Начало обновления (UTC)
+        fetch_ms (float): Время загрузки
+        parse_ms (float): Время разбора
+        write_ms (float): Время записи в БД
+        bytes_read (int): Прочитано байт
+        new_items (int): Новых элементов
+        error_class (str, optional): Класс ошибки, если обновление не удалось
+        error (str, optional): Текст ошибки
+    """
+    try:
+        db.session.add(UpdateRun(
+            feed_id=feed_id,
+            started_at=started_at,
+            fetch_ms=int(fetch_ms),
+            parse_ms=int(max(parse_ms, 0)),
+            write_ms=int(write_ms),
+            bytes_read=bytes_read,
+            new_items=new_items,
+            error_class=error_class[:100] if error_class else None,
+            error=(error or '')[:300] or None
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving update run for feed {feed_id}: {str(e)}")
+
+
+def prune_update_runs(dry_run=False):
+    """
+    Удаляет записи истории старше UPDATE_HISTORY_DAYS дней
+
+    Args:
+        dry_run (bool): Только посчитать
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['UPDATE_HISTORY_DAYS'])
+    query = UpdateRun.query.filter(UpdateRun.started_at < cutoff)
+    if dry_run:
+        return query.count()
+    deleted = query.delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+# Общее время обновления и признак ошибки - выражения для агрегатов в БД
+_duration = UpdateRun.fetch_ms + UpdateRun.parse_ms + UpdateRun.write_ms
+_failed = case((UpdateRun.error_class.isnot(None), 1), else_=0)
+
+
+def _feed_totals(since, until, feed_ids=None):
+    """Запрос: суммы по лентам за период [since, until)"""
+    query = db.session.query(
+        UpdateRun.feed_id,
+        func.count(UpdateRun.id).label('runs'),
+        func.sum(_failed).label('failures'),
+        func.sum(_duration).label('total_ms'),
+        func.max(_duration).label('max_ms'),
+        func.sum(UpdateRun.fetch_ms).label('fetch_ms'),
+        func.sum(UpdateRun.parse_ms).label('parse_ms'),
+        func.sum(UpdateRun.write_ms).label('write_ms'),
+        func.sum(UpdateRun.bytes_read).label('bytes'),
+        func.sum(UpdateRun.new_items).label('new_items'),
+    ).filter(UpdateRun.started_at >= since, UpdateRun.started_at < until)
+    if feed_ids is not None:
+        query = query.filter(UpdateRun.feed_id.in_(feed_ids))
+    return query.group_by(UpdateRun.feed_id)
+
+
+def _trend(current, previous):
+    """Изменение относительно предыдущего периода, % (None - не с чем сравнить)"""
+    if not previous:
+        return None
+    return round((current - previous) * 100.0 / previous, 1)
+
+
+def update_history_report(hours=24, limit=10, buckets=24):
+    """
+    Отчет о самых медленных и самых неудачных лентах за период
+
+    Для каждой ленты приводится изменение относительно предыдущего периода
+    той же длины, а для всех лент - распределение времени и ошибок по
+    интервалам периода. Все суммы считаются в БД по индексу started_at.
+
+    Args:
+        hours (int): Длина периода, часов
+        limit (int): Сколько лент в каждом списке
+        buckets (int): На сколько интервалов делить период для графика
+
+    Returns:
+        dict: since, totals, slowest, failing, timeline
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(hours=hours)
+    previous_since = since - timedelta(hours=hours)
+
+    totals = db.session.query(
+        func.count(UpdateRun.id),
+        func.coalesce(func.sum(_failed), 0),
+        func.coalesce(func.sum(_duration), 0),
+        func.coalesce(func.sum(UpdateRun.bytes_read), 0),
+        func.coalesce(func.sum(UpdateRun.new_items), 0),
+    ).filter(UpdateRun.started_at >= since).one()
+    total_ms = int(totals[2])
+
+    feed_totals = _feed_totals(since, now).subquery()
+    slowest = db.session.query(feed_totals).order_by(feed_totals.c.total_ms.desc()).limit(limit).all()
+    failing = db.session.query(feed_totals).filter(feed_totals.c.failures > 0) \
+                        .order_by(feed_totals.c.failures.desc(), feed_totals.c.total_ms.desc()) \
+                        .limit(limit).all()
+
+    feed_ids = {row.feed_id for row in slowest} | {row.feed_id for row in failing}
+    previous = {row.feed_id: row for row in _feed_totals(previous_since, since, feed_ids)} if feed_ids else {}
+    names = dict(db.session.query(Feed.id, Feed.name).filter(Feed.id.in_(feed_ids))) if feed_ids else {}
+
+    # Последняя ошибка неудачных лент - одним запросом по индексу (feed_id, started_at)
+    last_errors = {}
+    failing_ids = [row.feed_id for row in failing]
+    if failing_ids:
+        latest = db.session.query(UpdateRun.feed_id, func.max(UpdateRun.started_at).label('started_at')) \
+                           .filter(UpdateRun.feed_id.in_(failing_ids), UpdateRun.error_class.isnot(None),
+                                   UpdateRun.started_at >= since) \
+                           .group_by(UpdateRun.feed_id).subquery()
+        rows = db.session.query(UpdateRun.feed_id, UpdateRun.error_class, UpdateRun.error, UpdateRun.started_at) \
+                         .join(latest, (UpdateRun.feed_id == latest.c.feed_id)
+                               & (UpdateRun.started_at == latest.c.started_at))
+        for feed_id, error_class, error, started_at in rows:
+            last_errors[feed_id] = {'error_class': error_class, 'error': error, 'at': started_at.isoformat()}
+
+    def feed_row(row):
+        before = previous.get(row.feed_id)
+        return {
+            'feed_id': row.feed_id,
+            'name': names.get(row.feed_id),
+            'runs': row.runs,
+            'failures': int(row.failures),
+            'total_ms': int(row.total_ms),
+            'avg_ms': int(row.total_ms) // row.runs,
+            'max_ms': int(row.max_ms),
+            'fetch_ms': int(row.fetch_ms),
+            'parse_ms': int(row.parse_ms),
+            'write_ms': int(row.write_ms),
+            'bytes': int(row.bytes),
+            'new_items': int(row.new_items),
+            'share': round(int(row.total_ms) * 100.0 / total_ms, 1) if total_ms else 0.0,
+            'total_ms_trend': _trend(int(row.total_ms), before and int(before.total_ms)),
+            'previous_failures': int(before.failures) if before else 0,
+            'last_error': last_errors.get(row.feed_id),
+        }
+
+    # Интервал записи: номер первой границы, которую запись не достигла
+    step = timedelta(hours=hours) / buckets
+    bucket = case(
+        *[(UpdateRun.started_at < since + step * (index + 1), index) for index in range(buckets - 1)],
+        else_=buckets - 1
+    )
+    timeline = [
+        {'start': (since + step * index).isoformat(), 'runs': 0, 'failures': 0, 'total_ms': 0}
+        for index in range(buckets)
+    ]
+    rows = db.session.query(bucket, func.count(UpdateRun.id), func.sum(_failed), func.sum(_duration)) \
+                     .filter(UpdateRun.started_at >= since) \
+                     .group_by(bucket)
+    for index, runs, failures, duration in rows:
+        timeline[index].update(runs=runs, failures=int(failures), total_ms=int(duration))
+
+    return {
+        'hours': hours,
+        'since': since.isoformat(),
+        'totals': {
+            'runs': totals[0],
+            'failures': int(totals[1]),
+            'total_ms': total_ms,
+            'bytes': int(totals[3]),
+            'new_items': int(totals[4]),
+        },
+        'slowest': [feed_row(row) for row in slowest],
+        'failing': [feed_row(row) for row in failing],
+        'timeline': timeline,
+    }
@@ -0,0 +1,294 @@
+import hashlib
+import hmac
+import logging
+import secrets
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from .storage import db
+
+logger = logging.getLogger(__name__)
+
+# Алгоритмы, допустимые в заголовке X-Hub-Signature
+SIGNATURE_ALGORITHMS = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'sha384': hashlib.sha384,
+    'sha512': hashlib.sha512,
+}
+
+
+def callback_url(feed):
+    """
+    Формирует адрес, на который хаб доставляет обновления ленты
+
+    Args:
+        feed (Feed): Объект ленты
+
+    Returns:
+        str: Абсолютный URL обработчика WebSub
+    """
+    return f"{current_app.config['BASE_URL']}/websub/callback/{feed.id}"
+
+
+def subscribe(feed, mode='subscribe'):
+    """
+    Отправляет хабу запрос на подписку (или отписку) от ленты
+
+    Хаб подтверждает намерение асинхронно, запросом GET на callback_url,
+    поэтому новый секрет сохраняется до отправки запроса. Он хранится
+    отдельно (websub_pending_secret) и заменяет действующий только после
+    подтверждения: при продлении подписка остается 'subscribed', а
+    доставки, подписанные прежним секретом, по-прежнему принимаются.
+
+    Args:
+        feed (Feed): Объект ленты с заполненными hub_url и topic_url
+        mode (str): 'subscribe' или 'unsubscribe'
+
+    Returns:
+        bool: Принят ли запрос хабом
+    """
+    import requests
+
+    if mode == 'subscribe':
+        feed.websub_pending_secret = secrets.token_hex(20)
+        if not feed.push_enabled:
+            feed.websub_state = 'pending'
+    else:
+        feed.websub_pending_secret = None
+        feed.websub_state = 'unsubscribing'
+    feed.websub_requested_at = datetime.utcnow()
+    db.session.commit()
+
+    data = {
+        'hub.mode': mode,
+        'hub.topic': feed.topic_url,
+        'hub.callback': callback_url(feed),
+    }
+    if mode == 'subscribe':
+        data['hub.secret'] = feed.websub_pending_secret
+        data['hub.lease_seconds'] = current_app.config['WEBSUB_LEASE_SECONDS']
+
+    try:
+        response = requests.post(feed.hub_url, data=data, timeout=15)
+        if response.status_code not in (202, 204):
+            logger.warning(f"Hub {feed.hub_url} rejected {mode} for {feed.topic_url}: {response.status_code}")
+            return False
+        return True
+    except Exception as e:
+        logger.error(f"Error sending WebSub {mode} to {feed.hub_url}: {str(e)}")
+        return False
+
+
+def needs_subscription(feed):
+    """
+    Проверяет, нужно ли (пере)подписаться на ленту
+
+    Args:
+        feed (Feed): Объект ленты
+
+    Returns:
+        bool: Нужно ли отправить запрос на подписку
+    """
+    if not feed.hub_url or not feed.topic_url:
+        return False
+
+    now = datetime.utcnow()
+    config = current_app.config
+
+    # Ждем подтверждения от хаба (новой подписки или продления), но не бесконечно
+    if (feed.websub_state == 'pending' or feed.websub_pending_secret) and feed.websub_requested_at:
+        return feed.websub_requested_at < now - timedelta(seconds=config['WEBSUB_VERIFY_TIMEOUT'])
+
+    # Хаб отказал в подписке - повторяем не чаще интервала опроса-подстраховки
+    if feed.websub_state == 'denied' and feed.websub_requested_at:
+        return feed.websub_requested_at < now - timedelta(seconds=config['WEBSUB_FALLBACK_INTERVAL'])
+
+    if not feed.push_enabled:
+        return True
+
+    # Продлеваем подписку заранее, до истечения аренды
+    renew_at = feed.websub_lease_expires - timedelta(seconds=config['WEBSUB_RENEW_BEFORE'])
+    return now >= renew_at
+
+
+def handle_discovered_hub(feed, feed_data):
+    """
+    Запоминает хаб, объявленный в загруженной ленте, и подписывается на него
+
+    Args:
+        feed (Feed): Объект ленты
+        feed_data (dict): Результат fetch_rss_feed с ключами 'hub' и 'self_url'
+    """
+    if not current_app.config.get('WEBSUB_ENABLED'):
+        return
+
+    hub_url = feed_data.get('hub')
+    topic_url = feed_data.get('self_url') or feed.url
+
+    if not hub_url:
+        if feed.hub_url:
+            # Источник перестал объявлять хаб - возвращаемся к обычному опросу
+            feed.hub_url = None
+            feed.websub_state = None
+            feed.websub_secret = None
+            feed.websub_pending_secret = None
+            feed.websub_lease_expires = None
+            db.session.commit()
+        return
+
+    if hub_url != feed.hub_url or topic_url != feed.topic_url:
+        feed.hub_url = hub_url
+        feed.topic_url = topic_url
+        feed.websub_state = None
+        feed.websub_secret = None
+        feed.websub_pending_secret = None
+        feed.websub_lease_expires = None
+        db.session.commit()
+
+    if needs_subscription(feed):
+        print(f"Подписка WebSub для ленты {feed.name} через хаб {hub_url}")
+        subscribe(feed)
+
+
+def verify_intent(feed, params):
+    """
+    Обрабатывает проверку намерения подписки от хаба (GET на callback)
+
+    Args:
+        feed (Feed): Объект ленты
+        params (dict): Параметры запроса hub.*
+
+    Returns:
+        str: Значение hub.challenge, если намерение подтверждено, иначе None
+    """
+    mode = params.get('hub.mode')
+    topic = params.get('hub.topic')
+
+    # Отказ, как и подтверждение, относится только к теме текущей подписки
+    if not feed.topic_url or topic != feed.topic_url:
+        return None
+
+    if mode == 'denied':
+        feed.websub_state = 'denied'
+        feed.websub_pending_secret = None
+        feed.websub_lease_expires = None
+        db.session.commit()
+        logger.warning(f"Hub denied subscription for {feed.topic_url}: {params.get('hub.reason')}")
+        return ''
+
+    if mode == 'subscribe' and feed.websub_state in ('pending', 'subscribed'):
+        lease_seconds = params.get('hub.lease_seconds', type=int) \
+            or current_app.config['WEBSUB_LEASE_SECONDS']
+        if feed.websub_pending_secret:
+            # Хаб принял новый секрет - прежний больше не нужен
+            feed.websub_secret = feed.websub_pending_secret
+            feed.websub_pending_secret = None
+        feed.websub_state = 'subscribed'
+        feed.websub_lease_expires = datetime.utcnow() + timedelta(seconds=lease_seconds)
+        db.session.commit()
+        print(f"Подписка WebSub подтверждена для ленты {feed.name}")
+        return params.get('hub.challenge')
+
+    if mode == 'unsubscribe' and feed.websub_state == 'unsubscribing':
+        feed.websub_state = None
+        feed.websub_lease_expires = None
+        db.session.commit()
+        return params.get('hub.challenge')
+
+    return None
+
+
+def accepts_push(feed):
+    """
+    Проверяет, может ли хаб доставлять содержимое ленты
+
+    Содержимое принимается только по действующей подписке с секретом:
+    без секрета подпись проверить нечем, и элементы в ленту мог бы
+    добавить кто угодно.
+
+    Args:
+        feed (Feed): Объект ленты
+
+    Returns:
+        bool: Есть ли действующая подписка с секретом
+    """
+    return bool(feed.active and feed.websub_secret and feed.push_enabled)
+
+
+def verify_signature(feed, body, signature_header):
+    """
+    Проверяет подпись доставленного содержимого (X-Hub-Signature)
+
+    Args:
+        feed (Feed): Объект ленты
+        body (bytes): Тело запроса
+        signature_header (str): Значение заголовка вида 'sha256=<hex>'
+
+    Returns:
+        bool: Верна ли подпись
+    """
+    if not signature_header or '=' not in signature_header:
+        return False
+
+    algorithm, signature = signature_header.split('=', 1)
+    digestmod = SIGNATURE_ALGORITHMS.get(algorithm.lower())
+    if not digestmod:
+        return False
+
+    # Пока продление не подтверждено, хаб может подписывать любым из двух секретов
+    for secret in (feed.websub_secret, feed.websub_pending_secret):
+        if secret and hmac.compare_digest(hmac.new(secret.encode(), body, digestmod).hexdigest(), signature.strip()):
+            return True
+    return False
+
+
+def topics_for_feed(feed):
+    """
+    Возвращает адреса наших лент, в которые попадают элементы источника
+
+    Args:
+        feed (Feed): Объект ленты-источника
+
+    Returns:
+        list: URL ленты источника и всех активных агрегированных лент с ним
+    """
+    from .aggregator import aggregates_for_feed
+
+    base_url = current_app.config['BASE_URL']
+    topics = [f"{base_url}/source/{feed.id}"]
+    for agg_feed in aggregates_for_feed(feed):
+        topics.append(f"{base_url}/feed/{agg_feed.slug}")
+    return topics
+
+
+def publish(topics):
+    """
+    Уведомляет наш хаб о новых элементах в лентах
+
+    Args:
+        topics (list): URL обновленных лент
+
+    Returns:
+        bool: Принято ли уведомление хабом
+    """
+    import requests
+
+    hub_url = current_app.config.get('WEBSUB_HUB_URL')
+    if not hub_url or not topics:
+        return False
+
+    try:
+        response = requests.post(
+            hub_url,
+            data=[('hub.mode', 'publish')] + [('hub.url', topic) for topic in topics],
+            timeout=5
+        )
+        if response.status_code >= 400:
+            logger.warning(f"Hub {hub_url} rejected publish ping: {response.status_code}")
+            return False
+        return True
+    except Exception as e:
+        logger.error(f"Error pinging hub {hub_url}: {str(e)}")
+        return False
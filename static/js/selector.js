@@ -555,6 +555,12 @@ document.addEventListener('DOMContentLoaded', function() {
      * @param {Object} detectedSelectors Объект с селекторами
      */
     function applyDetectedSelectors(detectedSelectors) {
+        // Режим JSON предлагается, если список статей найден в данных страницы
+        document.getElementById('mode').value = detectedSelectors.mode || 'css';
+        if (detectedSelectors.mode === 'embedded') {
+            document.getElementById('use_selenium').checked = false;
+        }
+        
         for (const [type, selector] of Object.entries(detectedSelectors)) {
             if (selector && selectors[type]) {
                 selectors[type].value = selector;
@@ -571,6 +577,9 @@ document.addEventListener('DOMContentLoaded', function() {
         // Сбрасываем текущие подсветки
         resetHighlights();
         
+        // В режиме JSON поля содержат пути в данных, а не CSS селекторы
+        if (document.getElementById('mode').value === 'embedded') return;
+        
         // Подсвечиваем элементы для каждого селектора
         for (const [type, input] of Object.entries(selectors)) {
             if (!input.value) continue;
@@ -710,7 +719,9 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         // Собираем текущие селекторы из полей
-        const currentSelectors = {};
+        const currentSelectors = {
+            mode: document.getElementById('mode').value
+        };
         for (const [type, input] of Object.entries(selectors)) {
             if (input.value) {
                 currentSelectors[type] = input.value;
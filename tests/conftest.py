@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Приложение читает адрес БД при импорте, поэтому окружение задается до него
+_tmp = tempfile.mkdtemp(prefix='rss-aggregator-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['FLASK_ENV'] = 'production'
+os.environ.pop('WEBSUB_HUB_URL', None)
+
+
+@pytest.fixture
+def app():
+    """Приложение с пустой базой"""
+    from app import app as flask_app
+    from modules.feed_generator import rendered_cache
+    from modules.storage import db
+
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, ROBOTS_TXT_ENABLED=False)
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        rendered_cache.clear()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def live_server(app):
+    """
+    Приложение на локальном HTTP-сервере (для внешних участников: хаба и т.п.)
+
+    Returns:
+        str: Базовый URL сервера
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    previous = app.config['BASE_URL']
+    app.config['BASE_URL'] = base_url
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield base_url
+    server.shutdown()
+    app.config['BASE_URL'] = previous
@@ -0,0 +1,83 @@
+import hashlib
+
+from modules.canonical import canonical_url, item_identity, url_guid
+
+LEGACY_LINKS = [
+    'https://ex.com/news/article-1/',
+    'https://ex.com/news/article-2?b=2&a=1',
+    'https://ex.com/news/article-3?utm_source=rss&id=3',
+]
+FRESH_LINKS = [
+    'https://ex.com/news/article-1',
+    'https://ex.com/news/article-2?a=1&b=2',
+    'https://ex.com/news/article-3?id=3',
+]
+
+
+def scrape_feed():
+    from modules.storage import db, Feed
+
+    feed = Feed(name='Scraped', feed_type='scrape', url='https://ex.com/news/')
+    db.session.add(feed)
+    db.session.commit()
+    return feed
+
+
+def entry(link, title='Article'):
+    link, guid = item_identity(link, title, 'https://ex.com/news/')
+    return {'title': title, 'link': link, 'guid': guid, 'description': '',
+            'published': '2024-01-01 00:00:00'}
+
+
+def test_item_identity_keeps_original_link():
+    link, guid = item_identity('https://ex.com/a/?utm_source=x', 'Title', 'https://ex.com/')
+
+    assert link == 'https://ex.com/a/?utm_source=x'
+    assert guid == url_guid('https://ex.com/a')
+
+
+def test_content_params_are_kept():
+    assert canonical_url('https://ex.com/p?rss=1&ref_url=x&utm_medium=y') == 'https://ex.com/p?ref_url=x&rss=1'
+
+
+def test_upgrade_keeps_raw_stored_links(app):
+    """Элементы прежних версий (сырая ссылка, GUID по ссылке и заголовку) не дублируются"""
+    from modules.aggregator import store_feed_entries
+    from modules.storage import db, FeedItem
+
+    feed = scrape_feed()
+    for link in LEGACY_LINKS:
+        db.session.add(FeedItem(feed_id=feed.id, title='Article', link=link,
+                                guid=hashlib.md5((link + 'Article').encode()).hexdigest()))
+    db.session.commit()
+
+    new_count = store_feed_entries(feed, {'entries': [entry(link) for link in FRESH_LINKS]})
+
+    assert new_count == 0
+    assert sorted(link for (link,) in db.session.query(FeedItem.link)) == sorted(LEGACY_LINKS)
+
+
+def test_new_items_store_original_link(app):
+    from modules.aggregator import store_feed_entries
+    from modules.storage import FeedItem
+
+    feed = scrape_feed()
+
+    assert store_feed_entries(feed, {'entries': [entry('https://ex.com/news/new/?utm_source=x')]}) == 1
+    assert store_feed_entries(feed, {'entries': [entry('https://ex.com/news/new')]}) == 0
+    assert FeedItem.query.one().link == 'https://ex.com/news/new/?utm_source=x'
+
+
+def test_dedupe_merges_without_rewriting_links(app):
+    from modules.canonical import canonicalize_feed_items
+    from modules.storage import db, FeedItem
+
+    feed = scrape_feed()
+    db.session.add(FeedItem(feed_id=feed.id, title='Old', link=LEGACY_LINKS[0], guid='legacy'))
+    db.session.add(FeedItem(feed_id=feed.id, title='New', link=FRESH_LINKS[0], guid=url_guid(FRESH_LINKS[0])))
+    db.session.commit()
+
+    assert canonicalize_feed_items(feed) == (1, 1)
+
+    item = FeedItem.query.one()
+    assert (item.link, item.title, item.guid) == (LEGACY_LINKS[0], 'New', url_guid(FRESH_LINKS[0]))
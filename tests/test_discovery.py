@@ -0,0 +1,120 @@
+from datetime import datetime
+
+PAGE_URL = 'https://ex.com/news/'
+FEED_URL = 'https://ex.com/feed.xml'
+
+
+def scraped_feed():
+    from modules.canonical import item_identity
+    from modules.storage import db, Feed, FeedItem
+
+    feed = Feed(name='News', feed_type='scrape', url=PAGE_URL)
+    db.session.add(feed)
+    db.session.commit()
+    for index in range(3):
+        link, guid = item_identity(f'https://ex.com/news/article-{index}/', f'Article {index}', PAGE_URL)
+        db.session.add(FeedItem(feed_id=feed.id, title=f'Article {index}', link=link, guid=guid))
+    db.session.commit()
+    return feed
+
+
+def rss_data(count):
+    entries = [{'title': f'Article {index}', 'link': f'https://ex.com/news/article-{index}?utm_source=rss',
+                'guid': f'urn:article:{index}', 'description': '', 'published': datetime.utcnow()}
+               for index in range(count)]
+    return {'entries': entries}
+
+
+def test_discovery_job_defers_switch(app, monkeypatch):
+    import modules.discovery as discovery
+    import modules.scraper as scraper
+
+    monkeypatch.setitem(app.config, 'FEED_DISCOVERY_AUTO_SWITCH', True)
+    monkeypatch.setattr(scraper, 'get_html', lambda url, *args, **kwargs: '<html></html>')
+    monkeypatch.setattr(discovery, 'discover_feeds', lambda url, html=None, max_bytes=None: {
+        'url': FEED_URL, 'type': 'rss', 'entries': 3, 'candidate_ms': 10.0, 'source': 'path'})
+    feed = scraped_feed()
+
+    assert discovery.run_due_discovery(limit=5) == 1
+
+    # Поиск только запоминает находку; тип меняется перед следующим обновлением
+    assert feed.feed_type == 'scrape'
+    assert feed.get_discovery()['pending_switch']
+    assert discovery.run_due_discovery(limit=5) == 0
+
+
+def test_switch_remaps_existing_items(app, monkeypatch):
+    import modules.aggregator as aggregator
+    from modules.storage import FeedItem
+
+    monkeypatch.setitem(app.config, 'FEED_DISCOVERY_AUTO_SWITCH', True)
+    feed = scraped_feed()
+    feed.set_discovery({'url': FEED_URL, 'type': 'rss', 'pending_switch': True})
+    version = feed.items_version or 0
+    requested = []
+
+    def fetch_rss_feed(url, **kwargs):
+        requested.append(url)
+        return rss_data(4)
+
+    monkeypatch.setattr(aggregator, 'fetch_rss_feed', fetch_rss_feed)
+
+    assert aggregator.update_feed(feed)
+
+    assert requested == [FEED_URL]
+    assert (feed.feed_type, feed.url) == ('rss', FEED_URL)
+    items = FeedItem.query.filter_by(feed_id=feed.id).order_by(FeedItem.id).all()
+    assert [item.guid for item in items] == [f'urn:article:{index}' for index in range(4)]
+    assert items[0].link == 'https://ex.com/news/article-0/'
+    # Ключи ссылок старых элементов заполнены, а кеш готовых лент сброшен
+    assert all(item.link_key for item in items)
+    assert feed.items_version == version + 1
+    assert 'remap_items' not in feed.get_discovery()
+    assert 'pending_switch' not in feed.get_discovery()
+
+
+def fake_discovery(monkeypatch):
+    import modules.discovery as discovery
+    import modules.scraper as scraper
+
+    monkeypatch.setattr(scraper, 'get_html', lambda url, *args, **kwargs: '<html></html>')
+    monkeypatch.setattr(discovery, 'discover_feeds', lambda url, html=None, max_bytes=None: {
+        'url': FEED_URL, 'type': 'rss', 'entries': 3, 'candidate_ms': 10.0, 'source': 'path'})
+
+
+def test_discover_route_queues_job(app, client, monkeypatch):
+    import time
+    from modules.storage import db
+
+    fake_discovery(monkeypatch)
+    feed = scraped_feed()
+
+    response = client.post(f'/feeds/{feed.id}/discover', headers={'Accept': 'application/json'})
+
+    assert response.status_code == 202
+    assert response.json['status'] in ('queued', 'running', 'done')
+    status_url = response.headers['Location']
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        # Запросы тестового клиента делят сессию с тестом, поэтому ее сбрасываем
+        db.session.expire_all()
+        status = client.get(status_url).json
+        if status['status'] == 'done':
+            break
+        time.sleep(0.05)
+    assert (status['status'], status['url'], status['type']) == ('done', FEED_URL, 'rss')
+    assert feed.get_discovery()['url'] == FEED_URL
+
+
+def test_scrape_time_comes_from_history(app, monkeypatch):
+    from modules.discovery import run_discovery
+    from modules.storage import db, UpdateRun
+
+    fake_discovery(monkeypatch)
+    feed = scraped_feed()
+    feed.set_selectors({'use_selenium': True})
+    db.session.add(UpdateRun(feed_id=feed.id, fetch_ms=4000, parse_ms=50))
+    db.session.commit()
+
+    # Ожидание рендеринга в браузере уже входит в fetch_ms
+    assert run_discovery(feed)['scrape_ms'] == 4050
@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+
+PARAGRAPH = '<p>' + 'Body text of the article, long enough to count as content. ' * 6 + '</p>'
+
+
+def test_extracted_links_allow_only_http():
+    from modules.enrichment import extract_main_content
+
+    html = f'''<html><body><article>{PARAGRAPH}
+        <p><a href="javascript:alert(1)">bad</a> <a href=" JaVa&#x09;Script:alert(1)">bad</a>
+        <a href="/relative">ok</a> <img src="data:image/svg+xml;base64,PHN2Zz4="> <img src="pic.png"></p>
+        {PARAGRAPH}</article></body></html>'''
+
+    content, _ = extract_main_content(html, 'https://ex.com/news/1')
+
+    assert 'javascript' not in content.lower() and 'data:' not in content
+    assert 'href="https://ex.com/relative"' in content
+    assert 'src="https://ex.com/news/pic.png"' in content
+
+
+def test_stored_content_is_sanitized_on_output():
+    from modules.enrichment import sanitize_article_html
+
+    html = sanitize_article_html('<p onclick="x()">Text <a href="javascript:alert(1)">a</a>'
+                                 '<img src="data:text/html,x"><script>alert(1)</script>'
+                                 '<a href="https://ex.com/">b</a></p>')
+
+    assert html == '<p>Text <a>a</a><img/><a href="https://ex.com/">b</a></p>'
+
+
+def test_queue_items_skips_concurrent_insert(app):
+    from modules.enrichment import queue_items
+    from modules.storage import db, Feed, FeedItem, ItemContent
+
+    feed = Feed(name='News', feed_type='rss', url='https://ex.com/feed.xml')
+    db.session.add(feed)
+    db.session.commit()
+    items = [FeedItem(feed_id=feed.id, title=str(index), link=f'https://ex.com/{index}', guid=str(index))
+             for index in range(3)]
+
+    # Другое обновление добавляет ту же статью после проверки существующих
+    path = db.engine.url.database
+    inserted = []
+
+    def concurrent_insert(conn, cursor, statement, parameters, context, executemany):
+        if not inserted and statement.lstrip().lower().startswith('select') and 'item_content' in statement:
+            inserted.append(True)
+            other = sqlite3.connect(path)
+            other.execute("INSERT INTO item_content (url, status) VALUES ('https://ex.com/1', 'pending')")
+            other.commit()
+            other.close()
+
+    event.listen(db.engine, 'after_cursor_execute', concurrent_insert)
+    try:
+        assert queue_items(items) == 2
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', concurrent_insert)
+    assert sorted(url for (url,) in db.session.query(ItemContent.url)) == [f'https://ex.com/{index}' for index in range(3)]
+
+
+def test_wakeup_during_pass_runs_another_pass(app, monkeypatch):
+    import modules.enrichment as enrichment
+
+    order = []
+    release = threading.Event()
+
+    def process_pending(app):
+        if not enrichment._drain_lock.acquire(blocking=False):
+            order.append('skipped')
+            return None
+        try:
+            order.append('start')
+            release.wait(5)
+            order.append('end')
+        finally:
+            enrichment._drain_lock.release()
+
+    monkeypatch.setattr(enrichment, 'process_pending', process_pending)
+
+    enrichment.start_background_processing(app)
+    deadline = time.monotonic() + 5
+    while not order and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Новые статьи добавлены, пока идет проход: он мог уже проверить очередь
+    enrichment.start_background_processing(app)
+    release.set()
+    while len(order) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert order == ['start', 'end', 'start', 'end']
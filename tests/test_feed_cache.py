@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+
+@contextmanager
+def captured_sql():
+    """Собирает тексты SQL-запросов, выполненных внутри блока"""
+    from modules.storage import db
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lower())
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+def make_aggregate(rules=None):
+    from modules.storage import db, AggregatedFeed, Feed, FeedItem
+
+    feeds = [Feed(name=f'Source {index}', feed_type='rss', url=f'https://ex.com/{index}.xml') for index in range(2)]
+    aggregate = AggregatedFeed(name='All', slug='all')
+    aggregate.set_rules(rules or {})
+    db.session.add_all(feeds + [aggregate])
+    db.session.commit()
+    aggregate.feeds.append(feeds[0])
+    aggregate.feeds.append(feeds[1])
+    for feed in feeds:
+        for index in range(3):
+            db.session.add(FeedItem(feed_id=feed.id, title=f'Python news {index}', link=f'{feed.url}#{index}',
+                                    guid=f'{feed.id}-{index}', published=datetime.utcnow() - timedelta(days=index)))
+    db.session.commit()
+    return aggregate, feeds
+
+
+def test_version_tracks_items_and_sources(app):
+    from modules.aggregator import aggregated_feed_version, prune_feed_items
+    from modules.storage import db, FeedItem
+
+    aggregate, feeds = make_aggregate()
+    cursor, version = aggregated_feed_version(aggregate)
+    assert cursor == db.session.query(db.func.max(FeedItem.id)).scalar()
+    assert aggregated_feed_version(aggregate) == (cursor, version)
+
+    db.session.add(FeedItem(feed_id=feeds[0].id, title='New', link='https://ex.com/new', guid='new'))
+    db.session.commit()
+    changed = aggregated_feed_version(aggregate)
+    assert changed[0] > cursor and changed[1] != version
+
+    assert prune_feed_items(feeds[1], datetime.utcnow() - timedelta(hours=12)) == 2
+    pruned = aggregated_feed_version(aggregate)
+    assert pruned[1] != changed[1]
+
+    feeds[1].active = False
+    db.session.commit()
+    assert aggregated_feed_version(aggregate)[1] != pruned[1]
+
+
+def test_version_is_one_row(app):
+    from modules.aggregator import aggregated_feed_version
+
+    aggregate, _ = make_aggregate()
+    aggregate.name
+
+    with captured_sql() as statements:
+        aggregated_feed_version(aggregate)
+
+    # Один агрегирующий запрос, без списка источников
+    assert len(statements) == 1
+    assert statements[0].startswith('select count(')
+
+
+def test_public_feed_computes_version_once(app, client):
+    make_aggregate({'include': ['python']})
+
+    with captured_sql() as statements:
+        response = client.get('/feed/all.json')
+
+    assert response.status_code == 200
+    versions = [statement for statement in statements if 'max(feed_item.id)' in statement]
+    assert len(versions) == 1
+    # Версия не фильтрует элементы по словам и не считает их
+    assert 'like' not in versions[0] and 'count(feed_item' not in versions[0]
+
+
+def test_cache_hit_skips_aggregate_queries(app, client):
+    from modules.storage import db, FeedItem
+
+    _, feeds = make_aggregate({'include': ['python']})
+    first = client.get('/feed/all.json')
+
+    with captured_sql() as statements:
+        second = client.get('/feed/all.json')
+
+    assert second.data == first.data
+    assert not [statement for statement in statements if 'count(feed_item' in statement or 'like' in statement]
+    assert not [statement for statement in statements if 'feed_item.title' in statement]
+
+    db.session.add(FeedItem(feed_id=feeds[0].id, title='Python release', link='https://ex.com/release',
+                            guid='release', published=datetime.utcnow()))
+    db.session.commit()
+    assert b'Python release' in client.get('/feed/all.json').data
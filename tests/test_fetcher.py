@@ -0,0 +1,62 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from modules.fetcher import fetch_url, DeadlineExceeded
+from modules.politeness import HostGovernor
+
+
+class SlowServer:
+    """Отдает тело по 100 байт каждые 0.25 секунды: /slow - 10 секунд, /short - 1 секунду"""
+
+    def __init__(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                count = 40 if self.path == '/slow' else 4
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(100 * count))
+                self.end_headers()
+                try:
+                    for _ in range(count):
+                        self.wfile.write(b'x' * 100)
+                        self.wfile.flush()
+                        time.sleep(0.25)
+                except OSError:
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+@pytest.fixture
+def slow_server():
+    server = SlowServer()
+    yield server
+    server.close()
+
+
+def test_deadline_covers_slow_body(app, slow_server):
+    governor = HostGovernor(robots_enabled=False)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        fetch_url(slow_server.url + '/slow', timeout=2, deadline=1, governor=governor)
+    assert time.monotonic() - started < 2
+
+
+def test_slow_body_within_deadline(app, slow_server):
+    governor = HostGovernor(robots_enabled=False)
+
+    result = fetch_url(slow_server.url + '/short', timeout=2, deadline=30, governor=governor)
+
+    assert result.bytes_read == 400
@@ -0,0 +1,43 @@
+import pytest
+
+from modules.item_body import make_excerpt
+
+
+@pytest.mark.parametrize('html, expected', [
+    ('<p>a < b and c</p>', 'a < b and c'),
+    ('Price < 10 USD', 'Price < 10 USD'),
+    ('<p>Text</p><img src="http://ex.com/a.png', 'Text'),
+    ('<p>Text</p></p', 'Text'),
+    ('<p>1 < 2</p><a href="x', '1 < 2'),
+])
+def test_excerpt_drops_only_partial_tags(html, expected):
+    assert make_excerpt(html, 100) == expected
+
+
+def test_excerpt_cuts_on_word_boundary():
+    assert make_excerpt('<p>one two three</p>', 9) == 'one two…'
+
+
+def test_keyword_rules_match_full_body(app):
+    from modules.aggregator import get_aggregated_feed_items
+    from modules.item_body import set_item_description
+    from modules.storage import db, AggregatedFeed, Feed, FeedItem
+
+    feed = Feed(name='Source', feed_type='rss', url='https://ex.com/feed.xml')
+    aggregate = AggregatedFeed(name='Kubernetes', slug='k8s')
+    aggregate.set_rules({'include': ['kubernetes']})
+    db.session.add_all([feed, aggregate])
+    db.session.commit()
+    aggregate.feeds.append(feed)
+    long_article = '<p>' + 'Intro text. ' * 500 + 'Deploying to <b>Kubernetes</b> clusters.</p>'
+    for index, html in enumerate([long_article, '<p>' + 'Other text. ' * 500 + '</p>']):
+        item = FeedItem(feed_id=feed.id, title=f'Article {index}', link=f'https://ex.com/{index}', guid=str(index))
+        set_item_description(item, html)
+        db.session.add(item)
+    db.session.commit()
+
+    # Слово есть только в конце статьи, за пределами короткого текста в строке элемента
+    first = FeedItem.query.filter_by(guid='0').one()
+    assert first.body is not None and 'Kubernetes' not in first.description
+
+    assert [item.guid for item in get_aggregated_feed_items(aggregate)] == ['0']
@@ -0,0 +1,25 @@
+from xml.etree import ElementTree
+
+
+def test_export_groups_rule_members(app):
+    from modules.opml import export_opml
+    from modules.storage import db, AggregatedFeed, Feed, FeedTag
+
+    manual = Feed(name='Manual', feed_type='rss', url='https://ex.com/manual.xml')
+    tagged = Feed(name='Tagged', feed_type='rss', url='https://ex.com/tagged.xml')
+    paused = Feed(name='Paused', feed_type='rss', url='https://ex.com/paused.xml', active=False)
+    other = Feed(name='Other', feed_type='rss', url='https://ex.com/other.xml')
+    aggregate = AggregatedFeed(name='Tech', slug='tech')
+    aggregate.set_rules({'tags': ['tech']})
+    db.session.add_all([manual, tagged, paused, other, aggregate])
+    db.session.commit()
+    db.session.add_all([FeedTag(feed_id=tagged.id, tag='tech'), FeedTag(feed_id=paused.id, tag='tech')])
+    aggregate.feeds.append(manual)
+    db.session.commit()
+
+    body = ElementTree.fromstring(export_opml('https://agg.example.com').split('\n', 1)[1]).find('body')
+
+    group = [outline for outline in body if outline.get('text') == 'Tech'][0]
+    assert [outline.get('text') for outline in group] == ['Manual', 'Tagged']
+    top_level = [outline.get('text') for outline in body if outline.get('xmlUrl')]
+    assert sorted(top_level) == ['Other', 'Paused']
@@ -0,0 +1,41 @@
+import os
+
+from modules.payload_store import PayloadStore
+
+
+class CountingStore(PayloadStore):
+    """Хранилище без сжатия, считающее обходы диска"""
+
+    SUFFIX = '.bin'
+
+    def __init__(self, root, max_bytes):
+        super().__init__(root, max_bytes)
+        self.walks = 0
+
+    def _encode(self, content):
+        return content
+
+    def _decode(self, data):
+        return data
+
+    def _files(self):
+        self.walks += 1
+        return super()._files()
+
+
+def test_eviction_frees_down_to_low_water(tmp_path):
+    store = CountingStore(str(tmp_path), max_bytes=10000)
+
+    digests = [store.put(bytes([index]) * 1000) for index in range(11)]
+
+    # 11 000 байт > лимита: освобождено до 9000, самые старые вытеснены
+    count, total = store.size()
+    assert (count, total) == (9, 9000)
+    assert store.get(digests[0]) is None and store.get(digests[1]) is None
+    assert store.get(digests[-1]) == bytes([10]) * 1000
+
+    # Следующие записи до лимита обходятся без обхода диска
+    walks = store.walks
+    store.put(b'a' * 1000)
+    assert store.walks == walks
+    assert os.path.exists(store._path(digests[-1]))
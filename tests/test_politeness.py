@@ -0,0 +1,106 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from modules.politeness import HostGovernor, WaitInterrupted
+
+AGENT = 'TestBot/1.0'
+
+
+class RobotsServer:
+    """Сайт с заданным ответом на /robots.txt; запоминает User-Agent запросов"""
+
+    def __init__(self, status=200, body=b''):
+        server = self
+        self.status = status
+        self.body = body
+        self.agents = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.agents.append(self.headers.get('User-Agent'))
+                self.send_response(server.status)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(server.body)))
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+@pytest.fixture
+def robots_server():
+    servers = []
+
+    def start(status=200, body=b''):
+        servers.append(RobotsServer(status, body))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def governor(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'FETCH_USER_AGENT', AGENT)
+    return HostGovernor(rate=100, burst=10, user_agent=AGENT, robots_max_bytes=1024)
+
+
+def busy_governor():
+    """Регулятор, у которого следующий слот к хосту - через 30 секунд"""
+    governor = HostGovernor(rate=1 / 30, burst=1, robots_enabled=False)
+    governor.acquire('https://ex.com/1')
+    return governor
+
+
+def test_cancel_event_interrupts_wait():
+    governor = busy_governor()
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+
+    started = time.monotonic()
+    with pytest.raises(WaitInterrupted):
+        governor.acquire('https://ex.com/2', cancel_event=cancel)
+    assert time.monotonic() - started < 5
+
+
+def test_close_interrupts_wait():
+    governor = busy_governor()
+    threading.Timer(0.2, governor.close).start()
+
+    started = time.monotonic()
+    with pytest.raises(WaitInterrupted):
+        governor.acquire('https://ex.com/2')
+    assert time.monotonic() - started < 5
+
+
+def test_robots_checked_for_sent_user_agent(governor, robots_server):
+    server = robots_server(body=b'User-agent: TestBot\nDisallow: /private\n\nUser-agent: *\nDisallow: /\n')
+
+    assert governor.can_fetch(server.url + '/public')
+    assert not governor.can_fetch(server.url + '/private/page')
+    assert server.agents == [AGENT]
+
+
+@pytest.mark.parametrize('status, allowed', [(401, False), (403, False), (404, True), (500, True)])
+def test_robots_error_statuses(governor, robots_server, status, allowed):
+    server = robots_server(status=status)
+
+    assert governor.can_fetch(server.url + '/page') is allowed
+
+
+def test_oversized_robots_is_not_read(governor, robots_server):
+    server = robots_server(body=b'User-agent: *\nDisallow: /\n' + b'#' * 4096)
+
+    assert governor.can_fetch(server.url + '/page')
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+PAGE_URL = 'https://ex.com/news/'
+
+
+def page(json_ld_count, css_count):
+    blocks = [{'@type': 'NewsArticle', 'headline': f'Article {index}', 'url': f'https://ex.com/news/{index}'}
+              for index in range(json_ld_count)]
+    scripts = ''.join(f'<script type="application/ld+json">{json.dumps(block)}</script>' for block in blocks)
+    articles = ''.join(f'<article><h2><a href="/news/{index}">Article {index}</a></h2><p>Text</p></article>'
+                       for index in range(css_count))
+    return f'<html><head>{scripts}</head><body><main>{articles}</main></body></html>'
+
+
+@pytest.mark.parametrize('json_ld_count, css_count, mode', [
+    (2, 10, None),
+    (10, 10, 'embedded'),
+    (10, 2, 'embedded'),
+])
+def test_embedded_data_needs_as_many_items(app, monkeypatch, json_ld_count, css_count, mode):
+    import modules.scraper as scraper
+
+    html = page(json_ld_count, css_count)
+    monkeypatch.setattr(scraper, 'get_html', lambda url, use_selenium=False: html)
+
+    selectors = scraper.auto_detect_selectors(PAGE_URL)
+
+    assert selectors.get('mode') == mode
+    if mode is None:
+        assert (selectors['container'], selectors['item']) == ('main', 'article')
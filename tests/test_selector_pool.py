@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from modules.selector_pool import SingleFlightPool, PoolBusy
+
+release = threading.Event()
+started = threading.Event()
+
+
+def slow_render(name):
+    """Рендеринг, который не проверяет отмену до своего завершения"""
+    started.set()
+    release.wait(10)
+    return name
+
+
+@pytest.fixture
+def pool(app):
+    release.clear()
+    started.clear()
+    pool = SingleFlightPool(max_workers=1, max_pending=2)
+    yield pool
+    release.set()
+    pool._executor.shutdown(wait=True)
+
+
+def test_cancelled_running_flight_counts_until_finished(pool):
+    first = pool.join(slow_render, 'a')
+    assert started.wait(5)
+    pool.leave(first)
+    assert first.cancel_event.is_set()
+
+    # Отмененный вызов еще работает и занимает место в лимите
+    second = pool.join(slow_render, 'b')
+    with pytest.raises(PoolBusy):
+        pool.join(slow_render, 'c')
+
+    release.set()
+    first.future.result(timeout=5)
+    assert second.future.result(timeout=5) == 'b'
+    pool.leave(second)
+
+    third = pool.join(slow_render, 'c')
+    assert third.future.result(timeout=5) == 'c'
+    pool.leave(third)
+
+
+def test_queued_flight_frees_slot_when_cancelled(pool):
+    first = pool.join(slow_render, 'a')
+    assert started.wait(5)
+    queued = pool.join(slow_render, 'b')
+
+    pool.leave(queued)
+    assert queued.future.cancelled()
+
+    # Снятый с очереди вызов места не занимает
+    other = pool.join(slow_render, 'c')
+    release.set()
+    assert first.future.result(timeout=5) == 'a'
+    assert other.future.result(timeout=5) == 'c'
+    pool.leave(first)
+    pool.leave(other)
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+IMAGE_URL = 'https://img.ex.com/photo.jpg'
+
+
+@pytest.fixture
+def cache(app, monkeypatch, tmp_path):
+    import modules.thumbnails as thumbnails
+
+    monkeypatch.setitem(app.config, 'THUMBNAIL_CACHE_ENABLED', True)
+    cache = thumbnails.ThumbnailCache(str(tmp_path), 10 * 1024 * 1024)
+    monkeypatch.setattr(thumbnails, '_cache', cache)
+    return cache
+
+
+def make_item():
+    from modules.storage import db, Feed, FeedItem
+
+    feed = Feed(name='Images', feed_type='rss', url='https://ex.com/feed.xml')
+    db.session.add(feed)
+    db.session.commit()
+    item = FeedItem(feed_id=feed.id, title='Photo', link='https://ex.com/photo', guid='photo', image=IMAGE_URL)
+    db.session.add(item)
+    db.session.commit()
+    return item
+
+
+def test_miss_redirects_and_builds_in_background(app, client, cache, monkeypatch):
+    import modules.thumbnails as thumbnails
+
+    def fetch(image_url):
+        time.sleep(0.2)
+        return cache.put(PNG, thumbnails.content_hash(image_url))
+
+    monkeypatch.setattr(thumbnails, 'build_thumbnail', fetch)
+    item = make_item()
+
+    started = time.monotonic()
+    response = client.get(f'/thumbnails/{item.id}')
+
+    # Запрос не ждет загрузки изображения
+    assert time.monotonic() - started < 0.2
+    assert response.status_code == 302
+    assert response.headers['Location'] == IMAGE_URL
+
+    deadline = time.monotonic() + 5
+    while thumbnails.cached_thumbnail(IMAGE_URL) is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    response = client.get(f'/thumbnails/{item.id}')
+    assert response.status_code == 200
+    assert (response.mimetype, response.data) == ('image/png', PNG)
+
+
+def test_enclosure_type_comes_from_cached_thumbnail(app, cache):
+    from modules.feed_generator import _iter_entries
+    from modules.thumbnails import content_hash
+
+    item = make_item()
+    [entry] = _iter_entries([item], 'https://agg.example.com')
+    assert entry['enclosure'].mime_type == 'image/jpeg'
+
+    cache.put(PNG, content_hash(IMAGE_URL))
+    [entry] = _iter_entries([item], 'https://agg.example.com')
+    assert entry['enclosure'].url == f'https://agg.example.com/thumbnails/{item.id}'
+    assert entry['enclosure'].mime_type == 'image/png'
@@ -0,0 +1,289 @@
+import hashlib
+import hmac
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+import requests
+
+TOPIC = 'https://example.com/feed.xml'
+
+RSS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Topic</title><link>https://example.com/</link>
+<description>Topic feed</description>
+<item><title>Pushed</title><link>https://example.com/pushed</link><guid>pushed-1</guid>
+<description>Delivered by the hub</description></item>
+</channel></rss>"""
+
+
+class StandInHub:
+    """
+    Хаб WebSub для тестов: принимает подписку, подтверждает намерение
+    запросом GET на callback и доставляет содержимое
+    """
+
+    def __init__(self):
+        hub = self
+        self.subscriptions = {}
+        self.verifications = []
+        self.auto_verify = True
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+                hub.subscriptions[form['hub.callback']] = form
+                self.send_response(202)
+                self.end_headers()
+                if hub.auto_verify:
+                    threading.Thread(target=hub.verify, args=(form,)).start()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def verify(self, form):
+        response = requests.get(form['hub.callback'], params={
+            'hub.mode': form['hub.mode'],
+            'hub.topic': form['hub.topic'],
+            'hub.challenge': 'challenge-123',
+            'hub.lease_seconds': '600',
+        }, timeout=10)
+        self.verifications.append((response.status_code, response.text))
+
+    def deny(self, callback, topic):
+        return requests.get(callback, params={'hub.mode': 'denied', 'hub.topic': topic,
+                                              'hub.reason': 'test'}, timeout=10)
+
+    def push(self, callback, body, secret=None, signature=None):
+        headers = {'Content-Type': 'application/rss+xml'}
+        if secret is not None:
+            signature = 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        if signature is not None:
+            headers['X-Hub-Signature'] = signature
+        return requests.post(callback, data=body, headers=headers, timeout=10)
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def hub():
+    hub = StandInHub()
+    yield hub
+    hub.close()
+
+
+def make_feed(hub_url=None, **fields):
+    from modules.storage import db, Feed
+
+    feed = Feed(name='Pushed feed', feed_type='rss', url=TOPIC, hub_url=hub_url, topic_url=TOPIC, **fields)
+    db.session.add(feed)
+    db.session.commit()
+    return feed
+
+
+def subscribed_feed(hub_url='https://hub.example.com/'):
+    return make_feed(hub_url=hub_url, websub_state='subscribed', websub_secret='s3cret',
+                     websub_lease_expires=datetime.utcnow() + timedelta(days=1))
+
+
+def item_count(feed):
+    from modules.storage import FeedItem
+
+    return FeedItem.query.filter_by(feed_id=feed.id).count()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_subscribe_and_verify(app, live_server, hub):
+    from modules.storage import db
+    from modules.websub import subscribe, callback_url
+
+    feed = make_feed(hub_url=hub.url)
+    assert subscribe(feed)
+
+    callback = callback_url(feed)
+    assert wait_for(lambda: hub.verifications)
+    form = hub.subscriptions[callback]
+    assert form['hub.mode'] == 'subscribe'
+    assert form['hub.topic'] == TOPIC
+    assert hub.verifications == [(200, 'challenge-123')]
+
+    db.session.expire_all()
+    assert feed.websub_state == 'subscribed'
+    assert form['hub.secret'] == feed.websub_secret
+    assert feed.push_enabled
+
+
+def test_verify_rejects_other_topic(app, client):
+    feed = make_feed(hub_url='https://hub.example.com/', websub_state='pending', websub_secret='s3cret')
+
+    response = client.get(f'/websub/callback/{feed.id}', query_string={
+        'hub.mode': 'subscribe', 'hub.topic': 'https://evil.example.com/feed', 'hub.challenge': 'x'})
+
+    assert response.status_code == 404
+    assert feed.websub_state == 'pending'
+
+
+def test_signed_push_is_stored(app, live_server, hub):
+    from modules.websub import callback_url
+
+    feed = subscribed_feed(hub.url)
+
+    response = hub.push(callback_url(feed), RSS, secret='s3cret')
+
+    assert response.status_code == 202
+    assert item_count(feed) == 1
+
+
+@pytest.mark.parametrize('signature', [None, 'sha256=' + '0' * 64, 'md5=abc'])
+def test_unsigned_or_wrong_signature_push_is_ignored(app, live_server, hub, signature):
+    from modules.websub import callback_url
+
+    feed = subscribed_feed(hub.url)
+
+    response = hub.push(callback_url(feed), RSS, signature=signature)
+
+    # Хабу отвечаем 2xx, но содержимое не сохраняется
+    assert response.status_code == 202
+    assert item_count(feed) == 0
+
+
+@pytest.mark.parametrize('fields', [
+    {},
+    {'websub_state': 'subscribed', 'websub_lease_expires': datetime.utcnow() + timedelta(days=1)},
+    {'websub_state': 'pending', 'websub_secret': 's3cret'},
+])
+def test_push_without_active_subscription_is_rejected(app, live_server, hub, fields):
+    from modules.websub import callback_url
+
+    feed = make_feed(hub_url=hub.url, **fields)
+
+    response = hub.push(callback_url(feed), RSS, secret='s3cret')
+
+    assert response.status_code == 410
+    assert item_count(feed) == 0
+
+
+def test_denied_requires_matching_topic(app, live_server, hub):
+    from modules.storage import db
+    from modules.websub import callback_url
+
+    feed = subscribed_feed(hub.url)
+    callback = callback_url(feed)
+
+    assert hub.deny(callback, 'https://evil.example.com/feed').status_code == 404
+    db.session.expire_all()
+    assert feed.websub_state == 'subscribed'
+
+    assert hub.deny(callback, TOPIC).status_code == 200
+    db.session.expire_all()
+    assert feed.websub_state == 'denied'
+    assert not feed.push_enabled
+
+
+def test_hub_removal_clears_secret(app):
+    from modules.websub import handle_discovered_hub
+
+    feed = subscribed_feed()
+
+    handle_discovered_hub(feed, {'hub': None})
+
+    assert feed.hub_url is None
+    assert feed.websub_state is None
+    assert feed.websub_secret is None
+
+
+def test_renewal_keeps_subscription_until_verified(app, live_server, hub):
+    from modules.storage import db
+    from modules.websub import subscribe, callback_url
+
+    feed = subscribed_feed(hub.url)
+    callback = callback_url(feed)
+    hub.auto_verify = False
+
+    assert subscribe(feed)
+    form = hub.subscriptions[callback]
+    new_secret = form['hub.secret']
+    assert new_secret != 's3cret'
+
+    # До подтверждения подписка действует, принимаются оба секрета
+    db.session.expire_all()
+    assert feed.websub_state == 'subscribed'
+    assert feed.websub_secret == 's3cret'
+    assert hub.push(callback, RSS, secret='s3cret').status_code == 202
+    assert item_count(feed) == 1
+    second = RSS.replace(b'pushed-1', b'pushed-2').replace(b'/pushed<', b'/pushed-2<')
+    assert hub.push(callback, second, secret=new_secret).status_code == 202
+    assert item_count(feed) == 2
+
+    hub.verify(form)
+    assert hub.verifications == [(200, 'challenge-123')]
+    db.session.expire_all()
+    assert (feed.websub_state, feed.websub_secret, feed.websub_pending_secret) == ('subscribed', new_secret, None)
+
+    # После подтверждения прежний секрет больше не действует
+    third = RSS.replace(b'pushed-1', b'pushed-3').replace(b'/pushed<', b'/pushed-3<')
+    assert hub.push(callback, third, secret='s3cret').status_code == 202
+    assert item_count(feed) == 2
+
+
+def test_aggregates_for_feed(app):
+    from sqlalchemy import event
+    from modules.aggregator import aggregates_for_feed
+    from modules.storage import db, AggregatedFeed, FeedTag
+
+    feed = make_feed()
+    db.session.add(FeedTag(feed_id=feed.id, tag='tech'))
+    manual = AggregatedFeed(name='Manual', slug='manual')
+    by_tag = AggregatedFeed(name='Tech', slug='tech')
+    by_tag.set_rules({'tags': ['tech']})
+    by_type = AggregatedFeed(name='Scrape', slug='scrape')
+    by_type.set_rules({'feed_types': ['scrape']})
+    inactive = AggregatedFeed(name='Off', slug='off', active=False)
+    db.session.add_all([manual, by_tag, by_type, inactive])
+    db.session.commit()
+    manual.feeds.append(feed)
+    inactive.feeds.append(feed)
+    db.session.commit()
+    # Атрибуты, истекшие после commit, загружаются до подсчета запросов
+    assert feed.name and manual.name
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert aggregates_for_feed(feed) == [manual, by_tag]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    # Список агрегированных лент и одна проверка для всех сразу
+    assert len(statements) == 2
+
+
+def test_publish_skipped_without_hub(app, monkeypatch):
+    import modules.websub as websub
+    from modules.aggregator import store_feed_entries
+
+    def topics_for_feed(feed):
+        raise AssertionError('topics computed without a hub')
+
+    monkeypatch.setattr(websub, 'topics_for_feed', topics_for_feed)
+    feed = make_feed()
+
+    assert store_feed_entries(feed, {'entries': [{
+        'title': 'New', 'link': 'https://example.com/new', 'guid': 'new-1',
+        'description': '', 'published': datetime.utcnow()}]}) == 1
@@ -0,0 +1,14 @@
+"""
+Отдельный процесс обновления лент без HTTP-сервера
+
+Запуск:
+    python worker.py
+"""
+import logging
+
+from app import app
+from modules.scheduler import run_worker
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_worker(app)